@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+# Metrics compared between two result files, and whether a higher value is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "requests_per_second": True,
+    "rows_per_second": True,
+    "job_rows_per_second_p50": True,
+}
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """
+    Flatten the compared metrics of a result file into {"reads.16.p95_ms": 12.3, ...}.
+    """
+    values = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif key in METRICS and isinstance(value, (int, float)):
+            values[name] = value
+    return values
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[dict]:
+    """
+    Relative change of every metric present in both files. A change worse than threshold is a regression.
+    """
+    old, new = flatten({k: v for k, v in baseline.items() if k != "meta"}), \
+        flatten({k: v for k, v in current.items() if k != "meta"})
+    rows = []
+    for name in sorted(old.keys() & new.keys()):
+        change = (new[name] - old[name]) / old[name] if old[name] else 0.0
+        higher_is_better = METRICS[name.rsplit(".", 1)[-1]]
+        regression = -change > threshold if higher_is_better else change > threshold
+        rows.append({"metric": name, "baseline": old[name], "current": new[name], "change": change,
+                     "regression": regression})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change reported as a regression.")
+    args = parser.parse_args()
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    with open(args.current, "r") as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    width = max((len(row["metric"]) for row in rows), default=10)
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<{width}}  {row['baseline']:>12.2f}  {row['current']:>12.2f}  {row['change']:>+8.1%}{flag}")
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{regressions} regressions above {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
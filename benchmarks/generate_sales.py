@@ -0,0 +1,102 @@
+import argparse
+import datetime
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+DATAGENERATOR_DIR = Path(__file__).resolve().parent.parent / "datageneratorapp"
+INPUT_DIR = DATAGENERATOR_DIR / "input"
+# The data generator scripts import each other as top level modules
+sys.path.insert(0, str(DATAGENERATOR_DIR))
+from sales_generator import generate_sales_table, load_inputs  # noqa: E402
+
+DOMAINS = np.array(["bo", "us", "ar", "cl", "pe"])
+FIRST_SALE_DATE = datetime.date(2025, 1, 1)
+LAST_SALE_DATE = datetime.date(2025, 12, 31)
+
+# Rows generated and written at a time, bounds the memory used for the 10M rows files
+CHUNK_ROWS = 1_000_000
+
+# Compressed CSV outputs, by file extension
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+# Sizes accepted on the command line, as in the benchmark result names
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+
+
+def parse_size(size: str) -> int:
+    return SIZES[size.lower()] if size.lower() in SIZES else int(size)
+
+
+def generate_chunk(seed: np.random.SeedSequence, products: pd.DataFrame, clients: pd.DataFrame,
+                   users: pd.DataFrame, rows: int) -> pa.Table:
+    """
+    Generate rows sales with the columns of the petshopapi upload (see data/sales.csv): the sales of
+    sales_generator.generate_sales_table, renamed, with the client tax number, a domain and the sale date as text.
+    """
+    sales_seed, domain_seed = seed.spawn(2)
+    sales = generate_sales_table(products, clients, users, rows, seed=sales_seed,
+                                 start_date=FIRST_SALE_DATE, end_date=LAST_SALE_DATE)
+    client = pd.Index(clients["id"]).get_indexer(sales["client_id"].to_numpy(zero_copy_only=False))
+    domains = np.random.default_rng(domain_seed).integers(0, len(DOMAINS), rows)
+    return pa.table({
+        "saleid": sales["sale_id"],
+        "productname": sales["product_name"],
+        "clienttaxnum": clients["taxnumber"].to_numpy()[client],
+        "username": sales["user_name"],
+        "quantity": sales["quantity"],
+        "price": sales["total_price"],
+        "domain": DOMAINS[domains],
+        "saledate": sales["sale_date"].cast(pa.string()),
+    })
+
+
+def generate_sales_file(path: str, rows: int, seed: int = 42):
+    """
+    Write a CSV, compressed CSV (.csv.gz, .csv.zst) or Parquet sales file of rows sales, by extension.
+    The same seed gives the same file.
+    """
+    products, clients, users = load_inputs(str(INPUT_DIR))
+    # Each chunk has its own seed spawned from seed
+    chunk_seeds = np.random.SeedSequence(seed).spawn(-(-rows // CHUNK_ROWS))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    writer = None
+    sink = None
+    try:
+        for start, chunk_seed in zip(range(0, rows, CHUNK_ROWS), chunk_seeds):
+            table = generate_chunk(chunk_seed, products, clients, users, min(CHUNK_ROWS, rows - start))
+            if writer is None:
+                if path.endswith(".parquet"):
+                    writer = pq.ParquetWriter(path, table.schema)
+                else:
+                    compression = COMPRESSION_SUFFIXES.get(os.path.splitext(path)[1])
+                    sink = pa.CompressedOutputStream(path, compression) if compression else path
+                    writer = pa_csv.CSVWriter(sink, table.schema,
+                                              write_options=pa_csv.WriteOptions(quoting_style="needed"))
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+        if isinstance(sink, pa.NativeFile):
+            sink.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic sales file for the petshopapi upload.")
+    parser.add_argument("--rows", default="10k", help="Number of rows, or one of 10k, 100k, 1m, 10m.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True, help="Output file: .csv, .csv.gz, .csv.zst or .parquet.")
+    args = parser.parse_args()
+    generate_sales_file(args.output, parse_size(args.rows), args.seed)
+    print(f"Generated {args.output}")
+
+
+if __name__ == "__main__":
+    main()
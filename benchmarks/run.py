@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from benchmarks.generate_sales import generate_sales_file, parse_size
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCHMARKS_DIR.parent
+DATA_DIR = BENCHMARKS_DIR / "data"
+RESULTS_DIR = BENCHMARKS_DIR / "results"
+DEFAULT_REQUESTS = BENCHMARKS_DIR / "requests" / "read_mix.jsonl"
+
+AZURITE_CONNECTION_STRING = "UseDevelopmentStorage=true"
+
+
+def summarize(latencies: list[float], seconds: float, errors: int = 0) -> dict:
+    """
+    Latency percentiles in milliseconds and throughput of a set of requests.
+    """
+    values = np.array(latencies) * 1000
+    summary = {"requests": len(latencies), "errors": errors,
+               "requests_per_second": round(len(latencies) / seconds, 2) if seconds else None}
+    if len(values):
+        for name, q in (("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)):
+            summary[name] = round(float(np.percentile(values, q)), 2)
+        summary["max_ms"] = round(float(values.max()), 2)
+    return summary
+
+
+def load_requests(path: Path) -> list[dict]:
+    """
+    Read the recorded requests, one JSON object per line: {"name", "method", "path", "params"}.
+    """
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def replay(client: httpx.AsyncClient, requests: list[dict], total: int, concurrency: int) -> dict:
+    """
+    Send total requests, cycling through the recorded ones, with concurrency requests in flight.
+    """
+    latencies: dict[str, list[float]] = {request["name"]: [] for request in requests}
+    errors: dict[str, int] = {request["name"]: 0 for request in requests}
+    counter = iter(range(total))
+
+    async def worker():
+        for i in counter:
+            request = requests[i % len(requests)]
+            start = time.perf_counter()
+            response = await client.request(request.get("method", "GET"), request["path"],
+                                            params=request.get("params"))
+            latencies[request["name"]].append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors[request["name"]] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        "concurrency": concurrency,
+        **summarize(all_latencies, seconds, sum(errors.values())),
+        "by_request": {name: summarize(values, seconds, errors[name]) for name, values in latencies.items()},
+    }
+
+
+async def upload(client: httpx.AsyncClient, path: Path, mode: str, poll_interval: float) -> dict:
+    """
+    Upload a sales file and wait for its ingestion job. Returns the request latency and the job throughput.
+    Uploads rejected with 429 are retried after Retry-After, the wait counts in the request latency.
+    """
+    start = time.perf_counter()
+    while True:
+        with open(path, "rb") as f:
+            response = await client.post("/sales/upload", params={"mode": mode}, files={"file": (path.name, f)})
+        if response.status_code != 429:
+            break
+        # Over the admission limits of the server, try again when it says so
+        await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+    response.raise_for_status()
+    request_seconds = time.perf_counter() - start
+    job_id = response.json()["job_id"]
+    while True:
+        job = (await client.get(f"/sales/jobs/{job_id}")).json()
+        if job["status"] not in ("queued", "running"):
+            break
+        await asyncio.sleep(poll_interval)
+    total_seconds = time.perf_counter() - start
+    return {
+        "request_seconds": request_seconds,
+        "total_seconds": total_seconds,
+        "status": job["status"],
+        "rows": job["rows_processed"],
+        "rows_written": job["rows_written"],
+        "job_rows_per_second": job["rows_per_second"],
+    }
+
+
+async def run_uploads(client: httpx.AsyncClient, paths: list[Path], repeat: int, mode: str,
+                      poll_interval: float) -> dict:
+    """
+    Upload repeat files, len(paths) uploads at a time. Each concurrent uploader sends its own file,
+    as the server rejects a file that is still being ingested with 409.
+    """
+    async def uploader(index: int) -> list[dict]:
+        return [await upload(client, paths[index], mode, poll_interval)
+                for _ in range(index, repeat, len(paths))]
+
+    start = time.perf_counter()
+    runs = [run for runs in await asyncio.gather(*(uploader(i) for i in range(len(paths)))) for run in runs]
+    seconds = time.perf_counter() - start
+    return {
+        "concurrency": len(paths),
+        "uploads": repeat,
+        "statuses": sorted({run["status"] for run in runs}),
+        "request": summarize([run["request_seconds"] for run in runs], seconds),
+        "end_to_end": summarize([run["total_seconds"] for run in runs], seconds),
+        "rows_per_second": round(sum(run["rows_written"] for run in runs) / seconds, 1),
+        "job_rows_per_second_p50": round(float(np.median([run["job_rows_per_second"] or 0 for run in runs])), 1),
+    }
+
+
+def fixture_path(size: str, file_format: str, seed: int) -> Path:
+    """
+    Path of the synthetic sales file of that size, generated on first use.
+    """
+    path = DATA_DIR / f"sales_{size}_{seed}.{file_format}"
+    if not path.exists():
+        print(f"Generating {path}")
+        generate_sales_file(str(path), parse_size(size), seed)
+    return path
+
+
+def start_server(args, work_dir: str) -> subprocess.Popen:
+    """
+    Start petshopapi with the production entry point, on an empty local store or a fresh Azurite table.
+    """
+    env = {
+        **os.environ,
+        "PETSHOPAPI_SERVER_PORT": str(args.port),
+        "PETSHOPAPI_SERVER_WORKERS": str(args.workers),
+        "PETSHOPAPI_SERVER_ACCESS_LOG": "false",
+        "PETSHOPAPI_LOG_LEVEL": "WARNING",
+        "PETSHOPAPI_INGESTION_JOBS_DIR": os.path.join(work_dir, "jobs"),
+        "PETSHOPAPI_SQLITE_PATH": os.path.join(work_dir, "sales.db"),
+        "PETSHOPAPI_PARQUET_PATH": os.path.join(work_dir, "sales_parquet"),
+    }
+    if args.backend == "azurite":
+        table_name = f"bench{uuid.uuid4().hex[:12]}"
+        create_azurite_table(table_name)
+        env.update({"PETSHOPAPI_SALES_BACKEND": "azure_tables", "PETSHOPAPI_AZURE_TABLE_NAME": table_name,
+                    "AZURE_STORAGE_CONNECTION_STRING": AZURITE_CONNECTION_STRING})
+    else:
+        env["PETSHOPAPI_SALES_BACKEND"] = args.backend
+    return subprocess.Popen(args.server_command.split(), cwd=REPO_DIR, env=env)
+
+
+def create_azurite_table(table_name: str):
+    # The app expects the table to exist
+    from azure.data.tables import TableServiceClient
+    with TableServiceClient.from_connection_string(AZURITE_CONNECTION_STRING) as service:
+        service.create_table_if_not_exists(table_name)
+
+
+async def wait_until_ready(client: httpx.AsyncClient, server: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The server exited with code {server.returncode}")
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError(f"The server was not ready after {timeout}s")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmarks(args) -> dict:
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "backend": args.backend if args.url is None else "external",
+            "workers": args.workers if args.url is None else None,
+            "seed": args.seed,
+        },
+        "uploads": {},
+        "reads": {},
+    }
+    # One file per concurrent upload, with seeds following --seed
+    uploaders = max(1, min(args.upload_concurrency, args.upload_repeat))
+    fixtures = {size: [fixture_path(size, args.format, args.seed + i) for i in range(uploaders)]
+                for size in args.sizes}
+
+    with tempfile.TemporaryDirectory(prefix="petshopapi_bench_") as work_dir:
+        server = None if args.url else start_server(args, work_dir)
+        base_url = args.url or f"http://127.0.0.1:{args.port}"
+        try:
+            limits = httpx.Limits(max_connections=max(args.concurrency) + args.upload_concurrency)
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.request_timeout, limits=limits) as client:
+                await wait_until_ready(client, server, args.startup_timeout)
+                for size, paths in fixtures.items():
+                    print(f"Uploading {', '.join(path.name for path in paths)} x{args.upload_repeat}")
+                    results["uploads"][size] = await run_uploads(client, paths, args.upload_repeat, args.mode,
+                                                                 args.poll_interval)
+                requests = load_requests(args.requests)
+                for concurrency in args.concurrency:
+                    print(f"Replaying {args.read_requests} requests at concurrency {concurrency}")
+                    # Warm up the connections and the aggregate cache before measuring
+                    await replay(client, requests, len(requests), concurrency)
+                    results["reads"][str(concurrency)] = await replay(client, requests, args.read_requests,
+                                                                      concurrency)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=60)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the petshopapi upload and read endpoints.")
+    parser.add_argument("--backend", choices=["sqlite", "parquet", "azurite"], default="sqlite",
+                        help="Sales backend of the server started by the benchmark.")
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one.")
+    parser.add_argument("--server-command", default=f"{sys.executable} -m petshopapi.server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes, 0 for one per core.")
+    parser.add_argument("--sizes", nargs="+", default=["10k", "1m"], help="Upload file sizes: 10k, 1m, 10m...")
+    parser.add_argument("--format", choices=["csv", "csv.gz", "csv.zst", "parquet"], default="csv")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mode", default="upsert-replace", help="Write mode of the uploads.")
+    parser.add_argument("--upload-repeat", type=int, default=3)
+    parser.add_argument("--upload-concurrency", type=int, default=1)
+    parser.add_argument("--requests", type=Path, default=DEFAULT_REQUESTS, help="Recorded requests to replay.")
+    parser.add_argument("--read-requests", type=int, default=2000, help="Read requests sent per concurrency.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    parser.add_argument("--poll-interval", type=float, default=0.1)
+    parser.add_argument("--request-timeout", type=float, default=300)
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--output", type=Path, help="Result file, benchmarks/results/<timestamp>.json by default.")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    output = args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['meta']['backend']}.json"
+    os.makedirs(output.parent, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
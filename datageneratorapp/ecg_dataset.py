@@ -0,0 +1,173 @@
+import argparse
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# Time steps of each heartbeat in the PTB and MIT-BIH CSVs, the last column of a row is its class
+SIGNAL_LENGTH = 187
+FORMAT_VERSION = 1
+# Rows copied at a time when datasets are combined
+COPY_ROWS = 65536
+
+
+class ECGDataset(NamedTuple):
+    signals: np.ndarray  # float32 (samples, SIGNAL_LENGTH, 1), as the 1D CNN expects
+    labels: np.ndarray  # int64 (samples,)
+
+
+def dataset_paths(base: str) -> tuple[str, str, str]:
+    """
+    The signals, labels and metadata files of a dataset saved under base, e.g. ./data/ptbdb_normal.
+    """
+    return f'{base}.signals.npy', f'{base}.labels.npy', f'{base}.json'
+
+
+def source_stamps(sources: list[str]) -> dict:
+    return {os.path.abspath(path): [os.path.getsize(path), os.stat(path).st_mtime_ns] for path in sources}
+
+
+def write_npy(path: str, array: np.ndarray):
+    # np.save to a file object keeps the name, the file appears once complete
+    with open(f'{path}.tmp', 'wb') as f:
+        np.save(f, array)
+    os.replace(f'{path}.tmp', path)
+
+
+def save(base: str, signals: np.ndarray, labels: np.ndarray, sources: list[str] = ()):
+    """
+    Save signals and labels as float32 and int64 .npy files that load() memory-maps, with a small JSON header
+    (format version, shapes, and the size and modification time of the CSVs they were converted from).
+    """
+    signals = np.ascontiguousarray(signals, dtype=np.float32).reshape(-1, SIGNAL_LENGTH, 1)
+    labels = np.asarray(labels).reshape(-1).astype(np.int64)
+    if len(signals) != len(labels):
+        raise ValueError(f'{len(signals)} signals but {len(labels)} labels')
+    signals_path, labels_path, _ = dataset_paths(base)
+    write_npy(signals_path, signals)
+    write_npy(labels_path, labels)
+    write_metadata(base, len(signals), np.unique(labels).tolist(), source_stamps(sources))
+
+
+def write_metadata(base: str, samples: int, classes: list, sources: dict):
+    # Written last: a dataset without its header is converted again
+    metadata_path = dataset_paths(base)[2]
+    with open(f'{metadata_path}.tmp', 'w') as f:
+        json.dump({'version': FORMAT_VERSION, 'samples': samples, 'signal_length': SIGNAL_LENGTH,
+                   'classes': classes, 'sources': sources}, f, indent=2)
+    os.replace(f'{metadata_path}.tmp', metadata_path)
+
+
+def metadata(base: str) -> dict:
+    try:
+        with open(dataset_paths(base)[2], 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def load(base: str) -> ECGDataset:
+    """
+    Memory-map a dataset written by save(). Nothing is read until the arrays are used and the arrays are
+    read-only views of the files, so loading takes milliseconds whatever the size of the dataset.
+    """
+    if metadata(base).get('version') != FORMAT_VERSION:
+        raise FileNotFoundError(f'No dataset at {base}, convert the CSV first')
+    signals_path, labels_path, _ = dataset_paths(base)
+    return ECGDataset(np.load(signals_path, mmap_mode='r'), np.load(labels_path, mmap_mode='r'))
+
+
+def read_csv(path: str) -> np.ndarray:
+    return pd.read_csv(path, header=None, dtype=np.float32, engine='pyarrow').to_numpy()
+
+
+def convert_csv(csv_path: str, labels_csv: str = None, base: str = None) -> str:
+    """
+    Convert a CSV of heartbeats to the binary format, once. The class is the last column of each row,
+    or the only column of labels_csv for the features/labels CSVs of a test set.
+    The dataset is saved next to the CSV (./data/ptbdb_normal.csv gives ./data/ptbdb_normal.*) unless base is given.
+    Returns base.
+    """
+    base = base or os.path.splitext(csv_path)[0]
+    values = read_csv(csv_path)
+    if labels_csv is None:
+        signals, labels, sources = values[:, :-1], values[:, -1], [csv_path]
+    else:
+        signals, labels, sources = values, read_csv(labels_csv)[:, 0], [csv_path, labels_csv]
+    if signals.shape[1] != SIGNAL_LENGTH:
+        raise ValueError(f'{csv_path}: {signals.shape[1]} time steps instead of {SIGNAL_LENGTH}')
+    save(base, signals, labels, sources)
+    return base
+
+
+def load_csv(csv_path: str, labels_csv: str = None, base: str = None) -> ECGDataset:
+    """
+    Load the dataset of a CSV, converting it first if it was never converted or the CSV changed since.
+    """
+    base = base or os.path.splitext(csv_path)[0]
+    sources = [csv_path] if labels_csv is None else [csv_path, labels_csv]
+    if metadata(base).get('sources') != source_stamps(sources) and all(os.path.exists(path) for path in sources):
+        convert_csv(csv_path, labels_csv, base)
+    return load(base)
+
+
+def combine(base: str, parts: list[str]) -> str:
+    """
+    Save the datasets saved under parts, one after the other, as the dataset base. The rows are copied
+    COPY_ROWS at a time between memory-mapped files, so the datasets never have to fit in memory.
+    Returns base.
+    """
+    datasets = [load(part) for part in parts]
+    samples = sum(len(dataset.labels) for dataset in datasets)
+    signals_path, labels_path, _ = dataset_paths(base)
+    for path, shape, dtype, name in ((signals_path, (samples, SIGNAL_LENGTH, 1), np.float32, 'signals'),
+                                     (labels_path, (samples,), np.int64, 'labels')):
+        output = np.lib.format.open_memmap(f'{path}.tmp', mode='w+', dtype=dtype, shape=shape)
+        offset = 0
+        for dataset in datasets:
+            array = getattr(dataset, name)
+            for start in range(0, len(array), COPY_ROWS):
+                block = array[start:start + COPY_ROWS]
+                output[offset:offset + len(block)] = block
+                offset += len(block)
+        output.flush()
+        del output
+        os.replace(f'{path}.tmp', path)
+    part_metadata = [metadata(part) for part in parts]
+    classes = sorted({label for meta in part_metadata for label in meta['classes']})
+    write_metadata(base, samples, classes, {path: stamp for meta in part_metadata
+                                            for path, stamp in meta['sources'].items()})
+    return base
+
+
+def load_csvs(csv_paths: list[str], base: str) -> ECGDataset:
+    """
+    Load several CSVs as one memory-mapped dataset saved under base, e.g. the normal and abnormal PTB beats,
+    instead of concatenating their arrays in memory. Each CSV is converted if needed (see load_csv),
+    the combined dataset is written again when one of them changed.
+    """
+    for path in csv_paths:
+        load_csv(path)
+    if metadata(base).get('sources') != source_stamps(csv_paths) and all(os.path.exists(path) for path in csv_paths):
+        combine(base, [os.path.splitext(path)[0] for path in csv_paths])
+    return load(base)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert ECG heartbeat CSVs to memory-mapped float32 .npy files.')
+    parser.add_argument('csv', nargs='+', help='CSVs with the class in the last column, e.g. ./data/ptbdb_normal.csv')
+    parser.add_argument('--labels', help='CSV of the labels, when the single CSV given only has the signals.')
+    args = parser.parse_args()
+    if args.labels and len(args.csv) > 1:
+        parser.error('--labels goes with a single CSV of signals')
+
+    for path in args.csv:
+        base = convert_csv(path, args.labels)
+        dataset = load(base)
+        print(f'{path}: {dataset.signals.shape[0]} samples, classes {metadata(base)["classes"]} -> {base}.*')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import numpy as np
+import tensorflow as tf
+
+from ecg_dataset import SIGNAL_LENGTH
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+def augment_batch(signals: tf.Tensor, labels: tf.Tensor, max_scale: float = 0.1, max_shift: int = 10):
+    """
+    Random amplitude scaling (by 1 +/- max_scale) and time shift (by up to max_shift steps, the steps shifted
+    in are 0 like the padding at the end of the beats) of each signal of a batch, as whole-batch tensor ops.
+    """
+    batch_size = tf.shape(signals)[0]
+    scales = tf.random.uniform([batch_size, 1, 1], 1 - max_scale, 1 + max_scale)
+    shifts = tf.random.uniform([batch_size, 1], -max_shift, max_shift + 1, dtype=tf.int32)
+    # Position in the original signal of each time step of the shifted one
+    positions = tf.range(SIGNAL_LENGTH)[tf.newaxis, :] - shifts
+    inside = (positions >= 0) & (positions < SIGNAL_LENGTH)
+    shifted = tf.gather(signals, tf.clip_by_value(positions, 0, SIGNAL_LENGTH - 1), batch_dims=1)
+    shifted = tf.where(inside[:, :, tf.newaxis], shifted, tf.zeros_like(shifted))
+    return shifted * scales, labels
+
+
+def make_dataset(signals: np.ndarray, labels: np.ndarray, indices: np.ndarray = None, batch_size: int = 32,
+                 shuffle: bool = True, augment: bool = False, cache: str = None, num_shards: int = 1,
+                 shard_index: int = 0, read_rows: int = 1024, shuffle_buffer: int = 10000, seed: int = None):
+    """
+    tf.data pipeline of batches of (signals, labels) for model.fit, read from the arrays of
+    ecg_dataset.load (memory-mapped, so the dataset does not have to fit in memory) at the given indices.
+
+    - the indices are split with shard() between num_shards workers, this one reading shard_index
+    - rows are read read_rows at a time in parallel, in file order within each block and then put back
+      in the order of the indices
+    - cache: a file, or '' for memory, keeps the rows read on the first epoch for the next ones
+    - shuffle: without cache, the indices are reshuffled each epoch before reading; with cache, they are
+      shuffled once before it (so the cache is not in file order, e.g. one class after the other) and the
+      rows go through a shuffle buffer of shuffle_buffer rows after it
+    - augment: augment_batch on each batch, in parallel
+    - the next batches are prefetched while the model trains on the current one
+    """
+    indices = np.arange(len(signals)) if indices is None else np.asarray(indices)
+    if shuffle and cache is not None:
+        indices = np.random.default_rng(seed).permutation(indices)
+
+    def read(rows: np.ndarray):
+        # Sorted for sequential reads of the memory-mapped file, then back in the shuffled order
+        order = np.argsort(rows, kind='stable')
+        restore = np.argsort(order)
+        rows = rows[order]
+        return (signals[rows][restore].astype(np.float32, copy=False),
+                labels[rows][restore].astype(np.int64, copy=False))
+
+    def read_block(rows: tf.Tensor):
+        block_signals, block_labels = tf.numpy_function(read, [rows], (tf.float32, tf.int64))
+        block_signals.set_shape([None, SIGNAL_LENGTH, 1])
+        block_labels.set_shape([None])
+        return block_signals, block_labels
+
+    dataset = tf.data.Dataset.from_tensor_slices(indices).shard(num_shards, shard_index)
+    if shuffle and cache is None:
+        dataset = dataset.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(read_rows).map(read_block, num_parallel_calls=AUTOTUNE).unbatch()
+    if cache is not None:
+        dataset = dataset.cache(cache)
+        if shuffle:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size)
+    if augment:
+        dataset = dataset.map(augment_batch, num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
@@ -1,45 +1,38 @@
-﻿import pandas as pd
-import random
-from faker import Faker
-import datetime
+﻿import argparse
+import time
+from sales_generator import generate_sales_table, load_inputs
+from sales_shards import FORMATS, write_sales_shards, write_table
 
-# Initialize Faker for creating fake data
-fake = Faker()
 
-#Generation
-num_records = 10000
-sales_data = []
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic pet shop sales.')
+    parser.add_argument('--records', type=int, default=10000, help='Number of sales.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed, for the same sales on every run.')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--shard-rows', type=int, default=0,
+                        help='Write shards of this many rows to the --output folder instead of one file.')
+    parser.add_argument('--processes', type=int, default=1, help='Processes generating shards, 0 for one per core.')
+    parser.add_argument('--skew', type=float, default=0.0,
+                        help='Zipf exponent of the product and user popularity, 0 for uniform.')
+    parser.add_argument('--output', help='Output file, or folder with --shard-rows. salesdata_<records> by default.')
+    args = parser.parse_args()
 
-products_df = pd.read_csv('./input/productsdata.csv')
-clients_df = pd.read_csv('./input/clientsdata.csv')
-users_df = pd.read_csv('./input/usersdata.csv')
+    print ('Generating sales data...') 
+    start = time.perf_counter()
+    if args.shard_rows:
+        output = args.output or f'./salesdata_{args.records}'
+        write_sales_shards(output, args.records, args.shard_rows, args.format, seed=args.seed,
+                           processes=args.processes, skew=args.skew)
+        print (f'Generated {args.records} sales in {time.perf_counter() - start:.2f}s, saved to {output}')
+        return
 
-print ('Generating sales data...') 
+    products_df, clients_df, users_df = load_inputs('./input')
+    table = generate_sales_table(products_df, clients_df, users_df, args.records, seed=args.seed, skew=args.skew)
+    output = args.output or f'./salesdata_{args.records}.{args.format}'
+    write_table(table, output, args.format)
+    print (f'Generated {args.records} sales in {time.perf_counter() - start:.2f}s, saved to {output}')
+    print (table.slice(0, 5).to_pandas())
 
-for _ in range(num_records):
-    product = products_df.sample().iloc[0]
-    client = clients_df.sample().iloc[0]
-    user = users_df.sample().iloc[0]
-    
-    quantity = random.randint(1, 10)
-    total_price = round(product['price'] * quantity, 5) # Round to 5 decimal places
-    sale_date = fake.date_between(start_date='-1y', end_date='today')
-    
-    sales_data.append({
-        'sale_id': fake.uuid4(),
-        'product_id': product['id'],
-        'product_name': product['name'],
-        'client_id': client['id'],
-        'client_name': client['fullname'],
-        'user_id': user['id'],
-        'user_name': user['username'],
-        'quantity': quantity,
-        'total_price': total_price,
-        'sale_date': sale_date
-    })
 
-# Create a DataFrame and save to CSV
-df = pd.DataFrame(sales_data)
-df.to_csv(f'./salesdata_{num_records}.csv', index=False)
-print ('Sales data generation completed and saved to salesdata.csv')
-print (df.head())
\ No newline at end of file
+if __name__ == '__main__':
+    main()
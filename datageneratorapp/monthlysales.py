@@ -1,11 +1,10 @@
-﻿import pandas as pd
-import matplotlib.pyplot as plt
+﻿import matplotlib.pyplot as plt
+from sales_cube import load_or_build
 
-sales_df = pd.read_csv('./data/salesdata_10000.csv', parse_dates=['sale_date'])
-sales_df["month"] = sales_df["sale_date"].dt.to_period("M")
+# Built from the sales file on the first run, then read from salesdata_10000.cube.npz
+cube = load_or_build('./data/salesdata_10000.csv')
 
-
-monthly_sales = sales_df.groupby("month")["total_price"].sum().reset_index()
+monthly_sales = cube.rollup("month", "total_price").reset_index()
 
 print(monthly_sales.head(5))
 
@@ -1,10 +1,10 @@
 ﻿import tensorflow as tf
-import pandas as pd
 import numpy as np
 from sklearn.metrics import classification_report, confusion_matrix
 import matplotlib.pyplot as plt
 import seaborn as sns
 import random
+import ecg_dataset
 
 
 # --- 1. Configuration ---
@@ -28,8 +28,9 @@ except Exception as e:
 # --- 3. Load and Prepare the Test Data ---
 print(f"\nLoading test data from: {TEST_DATA_PATH}")
 
-X_test_loaded = pd.read_csv("./data/ptbdb_test_features.csv", header=None).values.reshape(-1, 187, 1)
-y_test_loaded = pd.read_csv("./data/ptbdb_test_labels.csv", header=None).values.flatten()
+# Memory-mapped, saved by one_d_cnn_train.py (or converted from the CSVs on the first run)
+X_test_loaded, y_test_loaded = ecg_dataset.load_csv("./data/ptbdb_test_features.csv",
+                                                    labels_csv="./data/ptbdb_test_labels.csv")
 
 print(f"Test data shape: {X_test_loaded.shape}")
 print(f"Test labels shape: {y_test_loaded.shape}")
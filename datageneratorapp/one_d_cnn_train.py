@@ -5,6 +5,20 @@ from keras.models import Sequential
 from keras.layers import Conv1D, MaxPooling1D, Flatten, Dense, Dropout
 from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
+import ecg_dataset
+from ecg_pipeline import make_dataset
+
+BATCH_SIZE = 32
+# Random scaling and time shifts of the training signals
+AUGMENT = False
+# None reads the batches from the memory-mapped dataset on every epoch. A file path caches the rows read on
+# the first epoch on disk; '' would cache them in memory, which the memory-mapped dataset is meant to avoid
+CACHE = None
+
+
+def cache_file(split: str):
+    # One cache file per dataset, a tf.data cache file holds the rows of a single pipeline
+    return f'{CACHE}.{split}' if CACHE else CACHE
 
 model = Sequential([
     # Convolutional Layer: Learns features from the signal
@@ -35,30 +49,30 @@ model.compile(optimizer='adam',
               loss='sparse_categorical_crossentropy',
               metrics=['accuracy'])
 
-ptbdb_normal_df = pd.read_csv('./data/ptbdb_normal.csv', header=None)
-ptbdb_abnormal_df = pd.read_csv('./data/ptbdb_abnormal.csv', header=None)
-
-combined_df = pd.concat([ptbdb_normal_df, ptbdb_abnormal_df], ignore_index=True)
-print(combined_df.head())
-
-labels = combined_df.iloc[:, -1]  # The last column is the label
-features = combined_df.drop(combined_df.columns[-1], axis=1)  # Drop the label column from features
+# Memory-mapped float32 arrays (samples, 187, 1) of the normal then abnormal beats,
+# converted from the CSVs to ./data/ptbdb.* on the first run
+X, y = ecg_dataset.load_csvs(['./data/ptbdb_normal.csv', './data/ptbdb_abnormal.csv'], './data/ptbdb')
 
-# Convert to NumPy and reshape to (samples, 187, 1)
-X = np.array(features).reshape(-1, 187, 1)
-y = np.array(labels).flatten()
 
+# Split into train and test, the batches are read from X and y by the tf.data pipelines
+train_indices, test_indices = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+X_test, y_test = X[test_indices], y[test_indices]
+# The last 20% of the training samples for validation, as validation_split did
+validation_size = int(len(train_indices) * 0.2)
+train_indices, validation_indices = train_indices[:-validation_size], train_indices[-validation_size:]
 
-# Split into train and test
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+print("X shape:", X.shape)  # Should be (num_samples, 187, 1)
+print("y shape:", y.shape)  # Should be (num_samples,)
 
-print("X shape:", X_train.shape)  # Should be (num_samples, 187, 1)
-print("y shape:", y_train.shape)  # Should be (num_samples,)
+print("Train samples:", len(train_indices), "validation samples:", len(validation_indices))
+print("Unique labels:", np.unique(y[train_indices])) 
 
-print("First few labels:", y_train[:5])
-print("Unique labels:", np.unique(y_train)) 
+train_dataset = make_dataset(X, y, train_indices, batch_size=BATCH_SIZE, augment=AUGMENT, cache=cache_file('train'),
+                             seed=42)
+validation_dataset = make_dataset(X, y, validation_indices, batch_size=BATCH_SIZE, shuffle=False,
+                                  cache=cache_file('validation'))
 
-model.fit(X_train, y_train, epochs=10, validation_split=0.2)
+model.fit(train_dataset, epochs=10, validation_data=validation_dataset)
 # Save the model
 model.save('one_d_cnn_model.keras')
 
@@ -66,7 +80,7 @@ model.save('one_d_cnn_model.keras')
 model.summary()
 
 # Evaluate the model on the test set
-loss, accuracy = model.evaluate(X_test, y_test)
+loss, accuracy = model.evaluate(make_dataset(X, y, test_indices, batch_size=BATCH_SIZE, shuffle=False))
 print(f"Test Accuracy: {accuracy:.2f}")
 
 predictions = model.predict(X_test)
@@ -74,7 +88,8 @@ confidences = np.max(predictions, axis=1)
 print("First few predictions:", np.argmax(predictions, axis=1)[:5])
 print("First few confidence scores:", confidences[:5])
 
-# Save test features and labels to CSV files
+# Save test features and labels to CSV files, and in the binary format loaded by one_d_cnn_tester.py
+X_test_signals, y_test_labels = X_test, y_test
 if not isinstance(X_test, pd.DataFrame):
     X_test = pd.DataFrame(X_test.reshape(X_test.shape[0], X_test.shape[1]))
 if not isinstance(y_test, pd.DataFrame):
@@ -82,4 +97,6 @@ if not isinstance(y_test, pd.DataFrame):
 
 X_test.to_csv('data/ptbdb_test_features.csv', index=False, header=False)
 y_test.to_csv('data/ptbdb_test_labels.csv', index=False, header=False)
+ecg_dataset.save('./data/ptbdb_test_features', X_test_signals, y_test_labels,
+                 sources=['data/ptbdb_test_features.csv', 'data/ptbdb_test_labels.csv'])
 
@@ -1,23 +1,20 @@
 ﻿#
-import pandas as pd
 import matplotlib.pyplot as plt
 import random
 import numpy as np 
+import ecg_dataset
 
-ptbdb_normal_df = pd.read_csv('./data/ptbdb_normal.csv')
-ptbdb_abnormal_df = pd.read_csv('./data/ptbdb_abnormal.csv')
+# signals only (samples, 187), the labels are kept apart
+ptbdb_normal = ecg_dataset.load_csv('./data/ptbdb_normal.csv').signals[:, :, 0]
+ptbdb_abnormal = ecg_dataset.load_csv('./data/ptbdb_abnormal.csv').signals[:, :, 0]
 
-#remove last column for graphing purposes
-ptbdb_normal_df = ptbdb_normal_df.drop(ptbdb_normal_df.columns[-1], axis=1)
-ptbdb_abnormal_df = ptbdb_abnormal_df.drop(ptbdb_abnormal_df.columns[-1], axis=1)
+columnsize = ptbdb_normal.shape[1]
 
-columnsize = len(ptbdb_normal_df.columns)
+plot1_index = random.randint(1, len(ptbdb_normal)-1)
+plot2_index = random.randint(1, len(ptbdb_normal)-1)
 
-plot1_index = random.randint(1, len(ptbdb_normal_df)-1)
-plot2_index = random.randint(1, len(ptbdb_normal_df)-1)
-
-plot3_index = random.randint(1, len(ptbdb_abnormal_df)-1)
-plot4_index = random.randint(1, len(ptbdb_abnormal_df)-1)
+plot3_index = random.randint(1, len(ptbdb_abnormal)-1)
+plot4_index = random.randint(1, len(ptbdb_abnormal)-1)
 
 #ptbdb_normal_df samples
 print(f"Normal Index: {plot1_index} {plot2_index}")  
@@ -31,17 +28,17 @@ x_values = np.arange(columnsize)
 fig, (ax) = plt.subplots(4, figsize=(14, 6)) # Adjust figsize as needed
 fig.suptitle('ECG Signal Comparison', fontsize=16)
 
-ax[0].plot(x_values, ptbdb_normal_df.iloc[plot1_index], color='blue')
+ax[0].plot(x_values, ptbdb_normal[plot1_index], color='blue')
 ax[0].set_title('Normal ECG Signal')
 ax[0].set_xlabel('Time')
 ax[0].set_ylabel('Amplitude')
 
-ax[1].plot(x_values, ptbdb_normal_df.iloc[plot2_index], color='blue')
+ax[1].plot(x_values, ptbdb_normal[plot2_index], color='blue')
 
-ax[2].plot(x_values, ptbdb_abnormal_df.iloc[plot3_index], color='red')
+ax[2].plot(x_values, ptbdb_abnormal[plot3_index], color='red')
 ax[2].set_title('Abnormal ECG Signal')
 
-ax[3].plot(x_values, ptbdb_abnormal_df.iloc[plot4_index], color='red')
+ax[3].plot(x_values, ptbdb_abnormal[plot4_index], color='red')
 
 plt.tight_layout()
 
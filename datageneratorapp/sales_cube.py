@@ -0,0 +1,316 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+DIMENSIONS = ('month', 'product', 'user')
+MEASURES = ('sales', 'quantity', 'total_price')
+# Columns of the sales file the cube is built from
+CUBE_COLUMNS = ['sale_date', 'product_name', 'user_name', 'quantity', 'total_price']
+CUBE_COLUMN_TYPES = {'sale_date': pa.date32(), 'product_name': pa.string(), 'user_name': pa.string(),
+                     'quantity': pa.int64(), 'total_price': pa.float64()}
+# About the size of a generated sales row in CSV, to read chunks of chunk_rows rows
+CSV_ROW_BYTES = 200
+# Label of the sales without a date, product or user, so they are counted apart instead of dropped
+MISSING_LABEL = '(missing)'
+
+
+def month_labels(sale_dates: pd.Series) -> np.ndarray:
+    """
+    'YYYY-MM' of each sale date, from a datetime column or the 'YYYY-MM-DD' text of the CSV.
+    Missing dates stay missing (None or NaN).
+    """
+    if pd.api.types.is_datetime64_any_dtype(sale_dates):
+        dates = sale_dates.to_numpy()
+        return np.where(np.isnat(dates), None, dates.astype('datetime64[M]').astype(str))
+    return sale_dates.astype(str).str.slice(0, 7).to_numpy()
+
+
+class SalesCube:
+    """
+    Sales rolled up by month, product and user. Only the combinations with sales are kept, as one cell
+    per (month, product, user) with the number of sales, the quantity and the total price, so the cube
+    stays small whatever the number of products and users. The labels of each dimension are kept in the
+    order they were first seen, so appending sales never renumbers the existing cells.
+    Reports and slices are computed from the cells with np.bincount, without reading the sales again.
+    """
+
+    def __init__(self):
+        self.labels: dict[str, np.ndarray] = {dimension: np.array([], dtype=str) for dimension in DIMENSIONS}
+        self.cells: dict[str, np.ndarray] = {dimension: np.array([], dtype=np.int32) for dimension in DIMENSIONS}
+        self.cells.update({'sales': np.array([], dtype=np.int64), 'quantity': np.array([], dtype=np.int64),
+                           'total_price': np.array([], dtype=np.float64)})
+        # Names of the sales files the cube was built from, see load_or_build
+        self.sources: list[str] = []
+
+    @classmethod
+    def from_frame(cls, sales_df: pd.DataFrame) -> 'SalesCube':
+        cube = cls()
+        cube.append(sales_df)
+        return cube
+
+    def __len__(self) -> int:
+        return len(self.cells['sales'])
+
+    def encode(self, dimension: str, values: np.ndarray) -> np.ndarray:
+        """
+        Codes of values in the labels of the dimension, adding the labels not seen before.
+        Missing values (None, NaN) get the MISSING_LABEL.
+        """
+        # Without the sentinel, missing values get a code like the others instead of -1
+        inverse, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = [MISSING_LABEL if pd.isna(label) else str(label) for label in uniques]
+        positions = {label: code for code, label in enumerate(self.labels[dimension])}
+        new_labels = list(dict.fromkeys(label for label in uniques if label not in positions))
+        if new_labels:
+            positions.update({label: code for code, label in enumerate(new_labels, start=len(positions))})
+            self.labels[dimension] = np.concatenate([self.labels[dimension], np.array(new_labels, dtype=str)])
+        return np.array([positions[label] for label in uniques], dtype=np.int32)[inverse]
+
+    def append(self, sales_df: pd.DataFrame):
+        """
+        Add sales (e.g. a new day) to the cube. Only the cells are aggregated again, not the previous sales.
+        """
+        values = {'month': month_labels(sales_df['sale_date']),
+                  'product': sales_df['product_name'].to_numpy(),
+                  'user': sales_df['user_name'].to_numpy()}
+        rows = {dimension: self.encode(dimension, values[dimension]) for dimension in DIMENSIONS}
+        rows.update({'sales': np.ones(len(sales_df), dtype=np.int64),
+                     'quantity': sales_df['quantity'].to_numpy(dtype=np.int64),
+                     'total_price': sales_df['total_price'].to_numpy(dtype=np.float64)})
+        self.merge(rows)
+
+    def combine(self, other: 'SalesCube'):
+        """
+        Add the cells of another cube, e.g. the partial cube of a chunk or a shard.
+        """
+        rows = {dimension: self.encode(dimension, other.labels[dimension])[other.cells[dimension]]
+                for dimension in DIMENSIONS}
+        rows.update({measure: other.cells[measure] for measure in MEASURES})
+        self.merge(rows)
+
+    def merge(self, rows: dict[str, np.ndarray]):
+        """
+        Add cells or rows, given as coordinate and measure arrays, and reduce the cells sharing coordinates.
+        """
+        combined = {name: np.concatenate([self.cells[name], rows[name]]) for name in self.cells}
+        shape = tuple(max(len(self.labels[dimension]), 1) for dimension in DIMENSIONS)
+        keys = np.ravel_multi_index(tuple(combined[dimension].astype(np.int64) for dimension in DIMENSIONS), shape)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        coordinates = np.unravel_index(unique_keys, shape)
+        self.cells = {dimension: coordinates[i].astype(np.int32) for i, dimension in enumerate(DIMENSIONS)}
+        for measure in MEASURES:
+            sums = np.bincount(inverse, weights=combined[measure], minlength=len(unique_keys))
+            self.cells[measure] = sums if measure == 'total_price' else sums.astype(np.int64)
+
+    def mask(self, months=None, products=None, users=None) -> np.ndarray:
+        """
+        Cells of the given months, products and users (lists of labels, None for all).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for dimension, selected in (('month', months), ('product', products), ('user', users)):
+            if selected is not None:
+                codes = np.flatnonzero(np.isin(self.labels[dimension], list(selected)))
+                mask &= np.isin(self.cells[dimension], codes)
+        return mask
+
+    def rollup(self, by: str, measure: str = 'total_price', **filters) -> pd.Series:
+        """
+        The measure summed by month, product or user over the cells matching the filters, sorted by label.
+        """
+        mask = self.mask(**filters)
+        codes = self.cells[by][mask]
+        minlength = len(self.labels[by])
+        totals = np.bincount(codes, weights=self.cells[measure][mask], minlength=minlength)
+        present = np.bincount(codes, minlength=minlength) > 0
+        series = pd.Series(totals[present], index=pd.Index(self.labels[by][present], name=by), name=measure)
+        if measure != 'total_price':
+            series = series.astype(np.int64)
+        return series.sort_index()
+
+    def pivot(self, rows: str = 'month', columns: str = 'product', measure: str = 'total_price',
+              **filters) -> pd.DataFrame:
+        """
+        The measure summed by two dimensions, e.g. rows = months and columns = products,
+        NaN where there were no sales, like DataFrame.pivot on a groupby.
+        """
+        mask = self.mask(**filters)
+        shape = (len(self.labels[rows]), len(self.labels[columns]))
+        keys = np.ravel_multi_index((self.cells[rows][mask], self.cells[columns][mask]), shape)
+        size = shape[0] * shape[1]
+        totals = np.bincount(keys, weights=self.cells[measure][mask], minlength=size).reshape(shape)
+        present = (np.bincount(keys, minlength=size) > 0).reshape(shape)
+        df = pd.DataFrame(np.where(present, totals, np.nan),
+                          index=pd.Index(self.labels[rows], name=rows), columns=pd.Index(self.labels[columns], name=columns))
+        df = df.loc[present.any(axis=1), present.any(axis=0)]
+        return df.sort_index().sort_index(axis=1)
+
+    def save(self, path: str):
+        np.savez_compressed(path, **{f'labels_{name}': labels for name, labels in self.labels.items()},
+                            **{f'cells_{name}': values for name, values in self.cells.items()},
+                            sources=np.array(self.sources, dtype=str))
+
+    @classmethod
+    def load(cls, path: str) -> 'SalesCube':
+        cube = cls()
+        with np.load(path) as data:
+            cube.labels = {dimension: data[f'labels_{dimension}'] for dimension in DIMENSIONS}
+            cube.cells = {name: data[f'cells_{name}'] for name in (*DIMENSIONS, *MEASURES)}
+            cube.sources = data['sources'].tolist() if 'sources' in data else []
+        return cube
+
+
+def sales_files(sales_path: str) -> list[str]:
+    """
+    The sales file, or the CSV and Parquet shards of a folder written by sales_shards.
+    """
+    if not os.path.isdir(sales_path):
+        return [sales_path]
+    return sorted(glob.glob(os.path.join(sales_path, '*.csv')) + glob.glob(os.path.join(sales_path, '*.parquet')))
+
+
+def read_chunks(path: str, chunk_rows: int = 1_000_000, row_groups: list[int] = None):
+    """
+    Yield the CUBE_COLUMNS of a CSV or Parquet sales file as DataFrames of about chunk_rows rows,
+    so only one chunk is in memory at a time. row_groups restricts a Parquet file to some of its row groups.
+    """
+    if path.endswith('.parquet'):
+        batches = pq.ParquetFile(path).iter_batches(chunk_rows, row_groups=row_groups, columns=CUBE_COLUMNS)
+    else:
+        batches = pa_csv.open_csv(
+            path, read_options=pa_csv.ReadOptions(block_size=chunk_rows * CSV_ROW_BYTES),
+            convert_options=pa_csv.ConvertOptions(column_types=CUBE_COLUMN_TYPES, include_columns=CUBE_COLUMNS))
+    for batch in batches:
+        yield batch.to_pandas(date_as_object=False)
+
+
+def aggregate_part(task: tuple) -> SalesCube:
+    """
+    Cube of a file, or of some row groups of a Parquet file, built chunk by chunk.
+    Runs in the worker processes of aggregate.
+    """
+    path, row_groups, chunk_rows = task
+    cube = SalesCube()
+    for chunk in read_chunks(path, chunk_rows, row_groups):
+        cube.append(chunk)
+    return cube
+
+
+def aggregate(sales_path: str, chunk_rows: int = 1_000_000, processes: int = 1) -> SalesCube:
+    """
+    Build the cube of a sales file or folder of shards larger than memory. The files are read in chunks
+    of chunk_rows rows, each chunk is added to the cells of the cube and dropped, so the memory used
+    depends on the chunk size and on the number of (month, product, user) combinations, not on the
+    number of sales. With processes > 1 (0 for one per core), the shards and the row groups of Parquet
+    files are aggregated in a process pool and the partial cubes are combined at the end.
+    A single CSV file is read by one process.
+    """
+    tasks = []
+    for path in sales_files(sales_path):
+        if processes != 1 and path.endswith('.parquet'):
+            tasks.extend((path, [row_group], chunk_rows) for row_group in range(pq.ParquetFile(path).num_row_groups))
+        else:
+            tasks.append((path, None, chunk_rows))
+
+    cube = SalesCube()
+    if processes == 1 or len(tasks) == 1:
+        for part in map(aggregate_part, tasks):
+            cube.combine(part)
+        return cube
+    with ProcessPoolExecutor(max_workers=processes or None) as executor:
+        for part in executor.map(aggregate_part, tasks):
+            cube.combine(part)
+    return cube
+
+
+def cube_path(sales_path: str) -> str:
+    return f'{os.path.splitext(sales_path.rstrip(os.sep))[0]}.cube.npz'
+
+
+def parts_folder(path: str) -> str:
+    """
+    Folder of the cubes of each file of a folder of shards, next to the cube at path.
+    """
+    return f'{os.path.splitext(path)[0]}_parts'
+
+
+def is_newer(path: str, than: str) -> bool:
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(than)
+
+
+def build_parts(files: list[str], parts_dir: str, chunk_rows: int = 1_000_000, processes: int = 1) -> SalesCube:
+    """
+    Cube of a folder of shards, combined from a cube per shard kept in parts_dir. Only the shards that are new
+    or changed since their cube was saved are read, the cubes of the shards removed since are deleted.
+    """
+    os.makedirs(parts_dir, exist_ok=True)
+    part_paths = {file: os.path.join(parts_dir, f'{os.path.basename(file)}.cube.npz') for file in files}
+    for name in set(os.listdir(parts_dir)) - {os.path.basename(part) for part in part_paths.values()}:
+        os.remove(os.path.join(parts_dir, name))
+
+    stale = [file for file in files if not is_newer(part_paths[file], file)]
+    tasks = [(file, None, chunk_rows) for file in stale]
+    if processes == 1 or len(tasks) <= 1:
+        parts = map(aggregate_part, tasks)
+        for file, part in zip(stale, parts):
+            part.save(part_paths[file])
+    else:
+        with ProcessPoolExecutor(max_workers=processes or None) as executor:
+            for file, part in zip(stale, executor.map(aggregate_part, tasks)):
+                part.save(part_paths[file])
+
+    cube = SalesCube()
+    for file in files:
+        cube.combine(SalesCube.load(part_paths[file]))
+    return cube
+
+
+def load_or_build(sales_path: str, path: str = None, chunk_rows: int = 1_000_000, processes: int = 1) -> SalesCube:
+    """
+    Load the cube of a sales file or folder of shards, building it with aggregate and saving it next to
+    the sales the first time or when they changed since. For a folder, only the shards added or changed
+    since are aggregated and combined with the cubes of the others (see build_parts).
+    A folder without sales files gives an empty cube.
+    """
+    path = path or cube_path(sales_path)
+    files = sales_files(sales_path)
+    if not files:
+        return SalesCube()
+    sources = [os.path.basename(file) for file in files]
+    if os.path.exists(path):
+        cube = SalesCube.load(path)
+        if cube.sources == sources and all(is_newer(path, file) for file in files):
+            return cube
+    if os.path.isdir(sales_path):
+        cube = build_parts(files, parts_folder(path), chunk_rows, processes)
+    else:
+        cube = aggregate(sales_path, chunk_rows, processes)
+    cube.sources = sources
+    cube.save(path)
+    return cube
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the rollup cube of a sales file or folder of shards.')
+    parser.add_argument('sales', help='Sales CSV or Parquet file, or folder of shards.')
+    parser.add_argument('--chunk-rows', type=int, default=1_000_000, help='Rows read at a time.')
+    parser.add_argument('--processes', type=int, default=1, help='Processes aggregating shards, 0 for one per core.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    # Saved with its sources, so the reports load it instead of aggregating the sales again
+    cube = load_or_build(args.sales, chunk_rows=args.chunk_rows, processes=args.processes)
+    print(f'Aggregated {cube.cells["sales"].sum()} sales into {len(cube)} cells in {time.perf_counter() - start:.2f}s, '
+          f'saved to {cube_path(args.sales)}')
+    print(cube.rollup('month'))
+
+
+if __name__ == '__main__':
+    main()
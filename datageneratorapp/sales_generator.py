@@ -0,0 +1,122 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# The two hex digits of every byte value, as one uint16 per byte
+HEX_PAIRS = np.frombuffer(b''.join(b'%02x' % value for value in range(256)), dtype=np.uint16)
+# (start, end) of the hex digits of each UUID group, and where the group starts in the 36 characters
+UUID_GROUPS = ((0, 8, 0), (8, 12, 9), (12, 16, 14), (16, 20, 19), (20, 32, 24))
+UUID_LENGTH = 36
+
+# Columns of the generated sales, as read by the monthly report scripts
+SALES_COLUMNS = ['sale_id', 'product_id', 'product_name', 'client_id', 'client_name',
+                 'user_id', 'user_name', 'quantity', 'total_price', 'sale_date']
+
+
+def load_inputs(input_dir='./input') -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Read the products, clients and users the sales are drawn from.
+    """
+    products_df = pd.read_csv(f'{input_dir}/productsdata.csv')
+    clients_df = pd.read_csv(f'{input_dir}/clientsdata.csv')
+    users_df = pd.read_csv(f'{input_dir}/usersdata.csv')
+    return products_df, clients_df, users_df
+
+
+def random_uuid4s(rng: np.random.Generator, count: int) -> pa.Array:
+    """
+    Random version 4 UUIDs as an Arrow string array. The characters are written into one byte matrix
+    which becomes the data buffer of the array, instead of formatting one uuid4() per row.
+    """
+    data = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    data[:, 6] = (data[:, 6] & 0x0F) | 0x40  # version 4
+    data[:, 8] = (data[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    digits = HEX_PAIRS[data].view(np.uint8)
+    chars = np.full((count, UUID_LENGTH), ord('-'), dtype=np.uint8)
+    for start, end, position in UUID_GROUPS:
+        chars[:, position:position + end - start] = digits[:, start:end]
+    offsets = np.arange(0, UUID_LENGTH * (count + 1), UUID_LENGTH, dtype=np.int64)
+    return pa.Array.from_buffers(pa.large_string(), count, [None, pa.py_buffer(offsets), pa.py_buffer(chars)])
+
+
+def random_dates(rng: np.random.Generator, count: int, start_date: datetime.date,
+                 end_date: datetime.date) -> np.ndarray:
+    """
+    Dates drawn uniformly between start_date and end_date, both included.
+    """
+    days = (end_date - start_date).days + 1
+    return np.datetime64(start_date, 'D') + rng.integers(0, days, count).astype('timedelta64[D]')
+
+
+def zipf_weights(count: int, skew: float) -> np.ndarray:
+    """
+    Probability of each of count items when the popularity follows a Zipf law: the item of rank r
+    (its position in the input file) is drawn proportionally to 1 / r ** skew. skew 0 is uniform.
+    """
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+
+def draw(rng: np.random.Generator, count: int, num_records: int, skew: float = 0.0) -> np.ndarray:
+    """
+    num_records indices in range(count), uniform or Zipf-skewed.
+    """
+    if not skew:
+        return rng.integers(0, count, num_records)
+    # Inverse transform sampling, cheaper than rng.choice(p=...) for millions of draws
+    cumulative = np.cumsum(zipf_weights(count, skew))
+    return np.minimum(np.searchsorted(cumulative, rng.random(num_records), side='right'), count - 1)
+
+
+def take(values: pd.Series, indices: np.ndarray) -> pa.Array:
+    """
+    values[indices] as an Arrow array, the join of an input attribute on the drawn rows.
+    """
+    return pa.array(values.to_numpy()).take(pa.array(indices))
+
+
+def generate_sales_table(products_df: pd.DataFrame, clients_df: pd.DataFrame, users_df: pd.DataFrame,
+                         num_records: int, seed=None, start_date: datetime.date = None,
+                         end_date: datetime.date = None, skew: float = 0.0) -> pa.Table:
+    """
+    Generate num_records sales of random products, clients and users, with a quantity from 1 to 10
+    and a sale date in the last year (or between start_date and end_date), as an Arrow table.
+    Every column is drawn in one call and the product, client and user attributes are joined by indexing
+    their arrays. The same seed (an int or a numpy SeedSequence) gives the same sales.
+    With skew > 0, products and users are drawn from a Zipf distribution (see zipf_weights).
+    """
+    rng = np.random.default_rng(seed)
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date - datetime.timedelta(days=365)
+
+    product = draw(rng, len(products_df), num_records, skew)
+    client = rng.integers(0, len(clients_df), num_records)
+    user = draw(rng, len(users_df), num_records, skew)
+    quantity = rng.integers(1, 11, num_records)
+
+    return pa.table({
+        'sale_id': random_uuid4s(rng, num_records),
+        'product_id': take(products_df['id'], product),
+        'product_name': take(products_df['name'], product),
+        'client_id': take(clients_df['id'], client),
+        'client_name': take(clients_df['fullname'], client),
+        'user_id': take(users_df['id'], user),
+        'user_name': take(users_df['username'], user),
+        'quantity': quantity,
+        'total_price': np.round(products_df['price'].to_numpy()[product] * quantity, 5),  # Round to 5 decimal places
+        'sale_date': random_dates(rng, num_records, start_date, end_date),
+    })
+
+
+def generate_sales(products_df: pd.DataFrame, clients_df: pd.DataFrame, users_df: pd.DataFrame,
+                   num_records: int, seed=None, start_date: datetime.date = None,
+                   end_date: datetime.date = None, skew: float = 0.0) -> pd.DataFrame:
+    """
+    generate_sales_table as a DataFrame with the SALES_COLUMNS.
+    """
+    table = generate_sales_table(products_df, clients_df, users_df, num_records, seed, start_date, end_date,
+                                 skew)
+    # date_as_object=False converts the dates to datetime64 instead of one datetime.date per row
+    return table.to_pandas(date_as_object=False)
@@ -0,0 +1,145 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+
+from sales_cube import SalesCube, load_or_build
+
+FORMATS = ('png', 'svg')
+# Above this number of lines the legend would hide the chart
+MAX_LEGEND_ENTRIES = 20
+
+
+def email_domains(users_df: pd.DataFrame) -> pd.Series:
+    """
+    Domain of the email of each user, indexed by username.
+    """
+    return users_df.set_index('username')['email'].str.rsplit('@', n=1).str[-1].rename('domain')
+
+
+def report_charts(cube: SalesCube, users_df: pd.DataFrame = None) -> list[dict]:
+    """
+    The charts of the monthly report, each with the monthly total price of its lines
+    (rows = months, columns = lines): total, by product, by user and, given the users, by email domain.
+    Months without sales are NaN, drawn as gaps.
+    """
+    by_user = cube.pivot('month', 'user')
+    charts = [
+        {'name': 'monthly_sales', 'title': 'Monthly Sales Over Time', 'legend': None,
+         'frame': cube.rollup('month').to_frame('Total')},
+        {'name': 'monthly_sales_by_product', 'title': 'Monthly Sales by Product', 'legend': 'Product Name',
+         'frame': cube.pivot('month', 'product')},
+        {'name': 'monthly_sales_by_user', 'title': 'Monthly Sales by username', 'legend': 'Username',
+         'frame': by_user},
+    ]
+    if users_df is not None:
+        domains = email_domains(users_df).reindex(by_user.columns).fillna('unknown')
+        charts.append({'name': 'monthly_sales_by_domain', 'title': 'Monthly Sales by email domain',
+                       'legend': 'Domain', 'frame': by_user.T.groupby(domains.to_numpy()).sum(min_count=1).T})
+    return charts
+
+
+def line_colors(count: int) -> np.ndarray:
+    """
+    RGBA colors of count lines, from the tab10 or tab20 colormap (repeated for more lines).
+    """
+    colormap = matplotlib.colormaps['tab10' if count <= 10 else 'tab20']
+    return colormap(np.arange(count) % colormap.N)
+
+
+def draw_lines(ax, frame: pd.DataFrame, legend: str = None):
+    """
+    Draw one line per column of frame against its index, with a marker on each point, as a single
+    LineCollection and a single scatter, instead of one plot call (and one Line2D artist) per column.
+    The lines break at the NaN values, like plot does.
+    """
+    x = np.arange(len(frame.index), dtype=float)
+    values = frame.to_numpy(dtype=float).T
+    # (lines, months, 2) array of the (x, y) points of each line
+    points = np.stack([np.broadcast_to(x, values.shape), values], axis=-1)
+    colors = line_colors(len(frame.columns))
+    # One segment per pair of consecutive points, kept when both are present
+    segments = np.stack([points[:, :-1], points[:, 1:]], axis=2)
+    present = ~np.isnan(values)
+    drawn = present[:, :-1] & present[:, 1:]
+    segment_colors = np.broadcast_to(colors[:, None], drawn.shape + (4,))
+    ax.add_collection(LineCollection(segments[drawn], colors=segment_colors[drawn], linewidths=1.5))
+    point_colors = np.broadcast_to(colors[:, None], present.shape + (4,))
+    ax.scatter(points[present][:, 0], points[present][:, 1], c=point_colors[present], marker='o', s=36, zorder=3)
+    ax.autoscale_view()
+    ax.set_xticks(x, frame.index, rotation=45)
+    if legend and len(frame.columns) <= MAX_LEGEND_ENTRIES:
+        handles = [Line2D([], [], color=color, marker='o') for color in colors]
+        ax.legend(handles, frame.columns, title=legend)
+
+
+def render_chart(task: dict) -> list[str]:
+    """
+    Draw a chart of report_charts and save it in each format. Uses a Figure without pyplot,
+    so it renders with Agg (or the SVG backend) and needs no display. Runs in the worker processes.
+    """
+    chart = task['chart']
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    draw_lines(ax, chart['frame'], chart['legend'])
+    ax.set_title(chart['title'])
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Total Price')
+    ax.grid(True)
+    fig.tight_layout()
+    paths = []
+    for file_format in task['formats']:
+        path = os.path.join(task['output_dir'], f'{chart["name"]}.{file_format}')
+        fig.savefig(path, format=file_format)
+        paths.append(path)
+    return paths
+
+
+def render_report(cube: SalesCube, output_dir: str, formats=('png',), processes: int = 1,
+                  users_df: pd.DataFrame = None) -> list[str]:
+    """
+    Render every chart of the report to output_dir, one file per chart and format.
+    With processes > 1 (0 for one per core), the charts are rendered in a process pool.
+    Returns the paths of the files.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f'Unknown format: {", ".join(sorted(unknown))}')
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [{'chart': chart, 'output_dir': output_dir, 'formats': formats}
+             for chart in report_charts(cube, users_df)]
+    if processes == 1:
+        results = map(render_chart, tasks)
+        return [path for paths in results for path in paths]
+    with ProcessPoolExecutor(max_workers=processes or None) as executor:
+        return [path for paths in executor.map(render_chart, tasks) for path in paths]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the monthly sales report charts without a display.')
+    parser.add_argument('sales', nargs='?', default='./data/salesdata_10000.csv',
+                        help='Sales CSV or Parquet file, or folder of shards.')
+    parser.add_argument('--output', default='./report', help='Folder of the charts.')
+    parser.add_argument('--format', choices=FORMATS, action='append', help='Format of the charts, png by default.')
+    parser.add_argument('--processes', type=int, default=1, help='Processes rendering charts, 0 for one per core.')
+    parser.add_argument('--users', default='./input/usersdata.csv', help='Users, for the chart by email domain.')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    cube = load_or_build(args.sales, processes=args.processes)
+    users_df = pd.read_csv(args.users) if os.path.exists(args.users) else None
+    paths = render_report(cube, args.output, args.format or ['png'], args.processes, users_df)
+    print(f'Rendered {len(paths)} charts in {time.perf_counter() - start:.2f}s')
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import datetime
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from sales_generator import generate_sales_table, load_inputs
+
+FORMATS = ('csv', 'parquet')
+
+
+def shard_path(output_dir: str, index: int, file_format: str) -> str:
+    return os.path.join(output_dir, f'sales-{index:05d}.{file_format}')
+
+
+def write_table(table: pa.Table, path: str, file_format: str = 'csv'):
+    """
+    Write the sales as CSV or Parquet. The file appears under its name once complete.
+    """
+    tmp_path = f'{path}.tmp'
+    if file_format == 'parquet':
+        pq.write_table(table, tmp_path)
+    else:
+        pa_csv.write_csv(table, tmp_path, write_options=pa_csv.WriteOptions(quoting_style='needed'))
+    os.replace(tmp_path, path)
+
+
+def write_shard(task: dict) -> tuple[str, int, float]:
+    """
+    Generate and write one shard. Runs in the worker processes, task holds everything it needs.
+    """
+    start = time.perf_counter()
+    products_df, clients_df, users_df = task['inputs']
+    table = generate_sales_table(products_df, clients_df, users_df, task['rows'], seed=task['seed'],
+                                 start_date=task['start_date'], end_date=task['end_date'], skew=task['skew'])
+    write_table(table, task['path'], task['format'])
+    return task['path'], task['rows'], time.perf_counter() - start
+
+
+def write_sales_shards(output_dir: str, num_records: int, shard_rows: int = 1_000_000, file_format: str = 'csv',
+                       seed=None, processes: int = 1, skew: float = 0.0, start_date: datetime.date = None,
+                       end_date: datetime.date = None, input_dir: str = './input') -> list[str]:
+    """
+    Generate num_records sales as shards of shard_rows rows, written one after the other, so the memory
+    used depends on the shard size and not on num_records. With processes > 1 the shards are generated
+    in a process pool. Each shard has its own seed spawned from seed, so the output is the same
+    whatever the number of processes. Returns the paths of the shards.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f'Unknown format: {file_format}')
+    os.makedirs(output_dir, exist_ok=True)
+    inputs = load_inputs(input_dir)
+    # Fixed once, so the shards written around midnight share the same date range
+    end_date = end_date or datetime.date.today()
+    start_date = start_date or end_date - datetime.timedelta(days=365)
+
+    shards = math.ceil(num_records / shard_rows)
+    seed_sequence = np.random.SeedSequence(seed)
+    if seed is None:
+        print(f'Seed: {seed_sequence.entropy}')
+    tasks = [{
+        'inputs': inputs,
+        'rows': min(shard_rows, num_records - index * shard_rows),
+        'seed': shard_seed,
+        'path': shard_path(output_dir, index, file_format),
+        'format': file_format,
+        'start_date': start_date,
+        'end_date': end_date,
+        'skew': skew,
+    } for index, shard_seed in enumerate(seed_sequence.spawn(shards))]
+
+    if processes == 1:
+        results = map(write_shard, tasks)
+        return [path for path, _, _ in report(results, shards)]
+    with ProcessPoolExecutor(max_workers=processes or None) as executor:
+        return [path for path, _, _ in report(executor.map(write_shard, tasks), shards)]
+
+
+def report(results, shards: int):
+    for done, (path, rows, seconds) in enumerate(results, start=1):
+        print(f'[{done}/{shards}] {path}: {rows} rows in {seconds:.2f}s')
+        yield path, rows, seconds
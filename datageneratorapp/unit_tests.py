@@ -0,0 +1,324 @@
+import datetime
+import os
+import tempfile
+import unittest
+import uuid
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+import ecg_dataset
+import sales_cube
+
+try:
+    import ecg_pipeline
+    import tensorflow as tf
+except ImportError:
+    # TensorFlow is not installed
+    ecg_pipeline = None
+
+from sales_cube import MISSING_LABEL, SalesCube, aggregate, load_or_build
+from sales_generator import SALES_COLUMNS, generate_sales, load_inputs, random_uuid4s, zipf_weights
+from sales_report import draw_lines, render_report, report_charts
+from sales_shards import write_sales_shards
+
+
+class TestSalesGenerator(unittest.TestCase):
+    def setUp(self):
+        self.products_df, self.clients_df, self.users_df = load_inputs('./input')
+
+    def generate(self, num_records: int, seed=42, **kwargs):
+        return generate_sales(self.products_df, self.clients_df, self.users_df, num_records, seed=seed, **kwargs)
+
+    def test_sales_join_the_inputs(self):
+        df = self.generate(1000, start_date=datetime.date(2025, 1, 1), end_date=datetime.date(2025, 1, 31))
+        self.assertEqual(list(df.columns), SALES_COLUMNS)
+        products = self.products_df.set_index('id')
+        self.assertTrue((products.loc[df['product_id'], 'name'].to_numpy() == df['product_name'].to_numpy()).all())
+        self.assertTrue(np.allclose(products.loc[df['product_id'], 'price'].to_numpy() * df['quantity'],
+                                    df['total_price']))
+        self.assertTrue(df['quantity'].between(1, 10).all())
+        self.assertGreaterEqual(df['sale_date'].min(), pd.Timestamp('2025-01-01'))
+        self.assertLessEqual(df['sale_date'].max(), pd.Timestamp('2025-01-31'))
+
+    def test_same_seed_same_sales(self):
+        self.assertTrue(self.generate(500).equals(self.generate(500)))
+        self.assertFalse(self.generate(500).equals(self.generate(500, seed=7)))
+
+    def test_uuids_are_version_4(self):
+        ids = random_uuid4s(np.random.default_rng(1), 1000).to_pylist()
+        self.assertEqual(len(set(ids)), 1000)
+        self.assertTrue(all(uuid.UUID(value).version == 4 and str(uuid.UUID(value)) == value for value in ids))
+
+    def test_skew_favours_the_first_items(self):
+        df = self.generate(20000, skew=1.2)
+        counts = df['product_name'].value_counts()
+        self.assertEqual(counts.index[0], self.products_df['name'][0])
+        self.assertAlmostEqual(counts.iloc[0] / len(df), zipf_weights(len(self.products_df), 1.2)[0], delta=0.02)
+
+
+class TestSalesShards(unittest.TestCase):
+    def test_shards_do_not_depend_on_the_processes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            dates = {'start_date': datetime.date(2025, 1, 1), 'end_date': datetime.date(2025, 12, 31)}
+            one = write_sales_shards(os.path.join(folder, 'one'), 2500, 1000, seed=3, **dates)
+            two = write_sales_shards(os.path.join(folder, 'two'), 2500, 1000, seed=3, processes=2, **dates)
+            self.assertEqual([os.path.basename(path) for path in two],
+                             ['sales-00000.csv', 'sales-00001.csv', 'sales-00002.csv'])
+            frames = [pd.read_csv(path) for path in two]
+            self.assertEqual([len(df) for df in frames], [1000, 1000, 500])
+            self.assertEqual(list(frames[0].columns), SALES_COLUMNS)
+            for a, b in zip(one, two):
+                with open(a, 'rb') as f, open(b, 'rb') as g:
+                    self.assertEqual(f.read(), g.read())
+
+
+class TestSalesCube(unittest.TestCase):
+    def setUp(self):
+        products_df, clients_df, users_df = load_inputs('./input')
+        self.sales_df = generate_sales(products_df, clients_df, users_df, 20000, seed=5)
+        self.sales_df['month'] = self.sales_df['sale_date'].dt.to_period('M').astype(str)
+
+    def test_reports_match_groupby(self):
+        cube = SalesCube.from_frame(self.sales_df)
+        monthly = self.sales_df.groupby('month')['total_price'].sum()
+        self.assertEqual(list(cube.rollup('month').index), list(monthly.index))
+        self.assertTrue(np.allclose(cube.rollup('month').to_numpy(), monthly.to_numpy()))
+        for dimension, column in (('product', 'product_name'), ('user', 'user_name')):
+            expected = self.sales_df.pivot_table(index='month', columns=column, values='total_price', aggfunc='sum')
+            pivot = cube.pivot('month', dimension)
+            self.assertEqual(list(pivot.columns), list(expected.columns))
+            self.assertTrue(np.allclose(pivot.to_numpy(), expected.to_numpy(), equal_nan=True))
+
+    def test_slices(self):
+        cube = SalesCube.from_frame(self.sales_df)
+        month = cube.rollup('month').index[0]
+        product = self.sales_df['product_name'].iloc[0]
+        selected = self.sales_df[(self.sales_df['month'] == month) & (self.sales_df['product_name'] == product)]
+        quantities = cube.rollup('user', 'quantity', months=[month], products=[product])
+        self.assertTrue(quantities.equals(selected.groupby('user_name')['quantity'].sum().rename_axis('user')
+                                          .rename('quantity')))
+        self.assertEqual(cube.rollup('month', 'sales', products=[product]).sum(),
+                         (self.sales_df['product_name'] == product).sum())
+
+    def test_append_equals_build(self):
+        days = self.sales_df.sort_values('sale_date')
+        cube = SalesCube.from_frame(days.iloc[:15000])
+        cube.append(days.iloc[15000:])
+        full = SalesCube.from_frame(self.sales_df)
+        self.assertEqual(len(cube), len(full))
+        for by in ('month', 'product', 'user'):
+            for measure in ('sales', 'quantity', 'total_price'):
+                self.assertTrue(np.allclose(cube.rollup(by, measure), full.rollup(by, measure)))
+
+    def test_load_or_build_saves_the_cube(self):
+        with tempfile.TemporaryDirectory() as folder:
+            sales_path = os.path.join(folder, 'sales.csv')
+            self.sales_df.drop(columns='month').to_csv(sales_path, index=False)
+            cube = load_or_build(sales_path)
+            self.assertTrue(os.path.exists(os.path.join(folder, 'sales.cube.npz')))
+            loaded = load_or_build(sales_path)
+            self.assertTrue(loaded.pivot('month', 'user').equals(cube.pivot('month', 'user')))
+
+    def test_cube_built_by_the_cli_is_reused(self):
+        with tempfile.TemporaryDirectory() as folder:
+            sales_path = os.path.join(folder, 'sales.csv')
+            self.sales_df.drop(columns='month').to_csv(sales_path, index=False)
+            with mock.patch('sys.argv', ['sales_cube.py', sales_path]), mock.patch('builtins.print'):
+                sales_cube.main()
+            with mock.patch('sales_cube.aggregate', side_effect=AssertionError('aggregated again')):
+                cube = load_or_build(sales_path)
+            self.assertEqual(cube.cells['sales'].sum(), len(self.sales_df))
+
+    def test_missing_values_have_their_own_label(self):
+        sales_df = pd.DataFrame({'sale_date': ['2025-01-05', '2025-01-06', None],
+                                 'product_name': ['a', None, 'b'], 'user_name': ['u', 'u', 'v'],
+                                 'quantity': [1, 1, 1], 'total_price': [1.0, 10.0, 100.0]})
+        for cube in (SalesCube.from_frame(sales_df),
+                     SalesCube.from_frame(sales_df.assign(sale_date=pd.to_datetime(sales_df['sale_date'])))):
+            self.assertEqual(cube.rollup('product').to_dict(), {MISSING_LABEL: 10.0, 'a': 1.0, 'b': 100.0})
+            self.assertEqual(cube.rollup('month').to_dict(), {MISSING_LABEL: 100.0, '2025-01': 11.0})
+
+    def test_load_or_build_only_reads_the_new_shards(self):
+        with tempfile.TemporaryDirectory() as folder:
+            shards = os.path.join(folder, 'shards')
+            os.makedirs(shards)
+            self.assertEqual(len(load_or_build(shards)), 0)
+            sales_df = self.sales_df.drop(columns='month')
+            sales_df.iloc[:12000].to_csv(os.path.join(shards, 'sales-00000.csv'), index=False)
+            load_or_build(shards)
+            part = os.path.join(folder, 'shards.cube_parts', 'sales-00000.csv.cube.npz')
+            built = os.stat(part).st_mtime_ns
+            sales_df.iloc[12000:].to_csv(os.path.join(shards, 'sales-00001.csv'), index=False)
+            cube = load_or_build(shards)
+            self.assertEqual(os.stat(part).st_mtime_ns, built)
+            self.assertEqual(cube.sources, ['sales-00000.csv', 'sales-00001.csv'])
+            self.assertTrue(np.allclose(cube.rollup('user'), SalesCube.from_frame(sales_df).rollup('user')))
+
+    def test_aggregate_reads_the_shards_in_chunks(self):
+        with tempfile.TemporaryDirectory() as folder:
+            dates = {'start_date': datetime.date(2025, 1, 1), 'end_date': datetime.date(2025, 12, 31)}
+            for file_format in ('csv', 'parquet'):
+                output = os.path.join(folder, file_format)
+                paths = write_sales_shards(output, 5000, 2000, file_format, seed=9, **dates)
+                sales_df = pd.concat([pd.read_csv(path) if file_format == 'csv' else pd.read_parquet(path)
+                                      for path in paths])
+                expected = SalesCube.from_frame(sales_df).pivot('month', 'product')
+                for processes in (1, 2):
+                    cube = aggregate(output, chunk_rows=700, processes=processes)
+                    self.assertEqual(cube.cells['sales'].sum(), 5000)
+                    pivot = cube.pivot('month', 'product')
+                    self.assertEqual(list(pivot.columns), list(expected.columns))
+                    self.assertTrue(np.allclose(pivot.to_numpy(), expected.to_numpy(), equal_nan=True))
+
+
+class TestSalesReport(unittest.TestCase):
+    def setUp(self):
+        products_df, clients_df, self.users_df = load_inputs('./input')
+        self.cube = SalesCube.from_frame(generate_sales(products_df, clients_df, self.users_df, 5000, seed=11))
+
+    def test_charts_by_domain_add_up_to_the_total(self):
+        charts = {chart['name']: chart['frame'] for chart in report_charts(self.cube, self.users_df)}
+        total = charts['monthly_sales']['Total']
+        self.assertEqual(sorted(charts['monthly_sales_by_domain'].columns), ['pet.com', 'test.com', 'tx.com'])
+        for name in ('monthly_sales_by_product', 'monthly_sales_by_user', 'monthly_sales_by_domain'):
+            self.assertTrue(np.allclose(charts[name].sum(axis=1), total))
+
+    def test_missing_months_are_gaps(self):
+        frame = pd.DataFrame({'a': [1.0, np.nan, 3.0, 4.0], 'b': [np.nan, 2.0, np.nan, 5.0]},
+                             index=['2025-01', '2025-02', '2025-03', '2025-04'])
+        ax = Figure().add_subplot()
+        draw_lines(ax, frame, 'Line')
+        lines, = ax.collections[:1]
+        self.assertEqual([segment.tolist() for segment in lines.get_segments()], [[[2.0, 3.0], [3.0, 4.0]]])
+        markers = ax.collections[1].get_offsets()
+        self.assertEqual(sorted(map(tuple, markers.tolist())), [(0, 1), (1, 2), (2, 3), (3, 4), (3, 5)])
+
+    def test_render_report(self):
+        with tempfile.TemporaryDirectory() as folder:
+            paths = render_report(self.cube, folder, ('png', 'svg'), processes=2, users_df=self.users_df)
+            self.assertEqual(len(paths), 8)
+            for path in paths:
+                with open(path, 'rb') as f:
+                    header = f.read(8)
+                self.assertEqual(header[:4] == b'\x89PNG', path.endswith('.png'))
+            with self.assertRaises(ValueError):
+                render_report(self.cube, folder, ('jpg',))
+
+
+class TestECGDataset(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        rng = np.random.default_rng(0)
+        self.signals = rng.random((50, ecg_dataset.SIGNAL_LENGTH), dtype=np.float32)
+        self.labels = rng.integers(0, 2, 50)
+        self.csv_path = os.path.join(self.folder.name, 'ptbdb_normal.csv')
+        pd.DataFrame(np.column_stack([self.signals, self.labels])).to_csv(self.csv_path, header=False, index=False)
+
+    def test_load_csv_converts_once_and_memory_maps(self):
+        dataset = ecg_dataset.load_csv(self.csv_path)
+        self.assertIsInstance(dataset.signals, np.memmap)
+        self.assertEqual(dataset.signals.shape, (50, ecg_dataset.SIGNAL_LENGTH, 1))
+        self.assertEqual(dataset.signals.dtype, np.float32)
+        self.assertTrue(np.array_equal(dataset.signals[:, :, 0], self.signals))
+        self.assertTrue(np.array_equal(dataset.labels, self.labels))
+        self.assertEqual(ecg_dataset.metadata(os.path.join(self.folder.name, 'ptbdb_normal'))['samples'], 50)
+
+        signals_path = ecg_dataset.dataset_paths(os.path.join(self.folder.name, 'ptbdb_normal'))[0]
+        converted = os.stat(signals_path).st_mtime_ns
+        ecg_dataset.load_csv(self.csv_path)
+        self.assertEqual(os.stat(signals_path).st_mtime_ns, converted)
+
+        pd.DataFrame(np.column_stack([self.signals, self.labels])[:10]).to_csv(self.csv_path, header=False, index=False)
+        self.assertEqual(len(ecg_dataset.load_csv(self.csv_path).signals), 10)
+
+    def test_features_and_labels_csvs(self):
+        features_csv = os.path.join(self.folder.name, 'test_features.csv')
+        labels_csv = os.path.join(self.folder.name, 'test_labels.csv')
+        pd.DataFrame(self.signals).to_csv(features_csv, header=False, index=False)
+        pd.DataFrame(self.labels).to_csv(labels_csv, header=False, index=False)
+        signals, labels = ecg_dataset.load_csv(features_csv, labels_csv=labels_csv)
+        self.assertTrue(np.array_equal(signals[:, :, 0], self.signals))
+        self.assertTrue(np.array_equal(labels, self.labels))
+        with self.assertRaises(ValueError):
+            ecg_dataset.convert_csv(labels_csv, labels_csv)
+
+    def test_load_csvs_combines_the_files_memory_mapped(self):
+        abnormal_csv = os.path.join(self.folder.name, 'ptbdb_abnormal.csv')
+        pd.DataFrame(np.column_stack([self.signals[:20] + 1, np.ones(20)])).to_csv(abnormal_csv, header=False,
+                                                                                   index=False)
+        base = os.path.join(self.folder.name, 'ptbdb')
+        with mock.patch.object(ecg_dataset, 'COPY_ROWS', 7):
+            signals, labels = ecg_dataset.load_csvs([self.csv_path, abnormal_csv], base)
+        self.assertIsInstance(signals, np.memmap)
+        self.assertTrue(np.array_equal(signals[:, :, 0], np.concatenate([self.signals, self.signals[:20] + 1])))
+        self.assertTrue(np.array_equal(labels, np.concatenate([self.labels, np.ones(20)])))
+        self.assertEqual(ecg_dataset.metadata(base)['samples'], 70)
+
+        combined = os.stat(ecg_dataset.dataset_paths(base)[0]).st_mtime_ns
+        ecg_dataset.load_csvs([self.csv_path, abnormal_csv], base)
+        self.assertEqual(os.stat(ecg_dataset.dataset_paths(base)[0]).st_mtime_ns, combined)
+
+
+@unittest.skipUnless(ecg_pipeline, 'TensorFlow is not installed')
+class TestECGPipeline(unittest.TestCase):
+    def setUp(self):
+        # Each signal is filled with its row number, the label is the row number too
+        self.rows = 300
+        self.signals = np.repeat(np.arange(self.rows, dtype=np.float32), ecg_dataset.SIGNAL_LENGTH)
+        self.signals = self.signals.reshape(self.rows, ecg_dataset.SIGNAL_LENGTH, 1)
+        self.labels = np.arange(self.rows)
+
+    def rows_of(self, dataset) -> list:
+        rows = []
+        for signals, labels in dataset.as_numpy_iterator():
+            self.assertTrue(np.array_equal(signals[:, 0, 0], labels))
+            rows.extend(labels.tolist())
+        return rows
+
+    def test_rows_are_read_in_the_order_of_the_indices(self):
+        indices = np.random.default_rng(0).permutation(self.rows)
+        dataset = ecg_pipeline.make_dataset(self.signals, self.labels, indices, batch_size=16, shuffle=False,
+                                            read_rows=64)
+        self.assertEqual(self.rows_of(dataset), indices.tolist())
+
+    def test_shuffled_epochs_cover_every_row(self):
+        for cache in (None, ''):
+            dataset = ecg_pipeline.make_dataset(self.signals, self.labels, batch_size=32, cache=cache, read_rows=64,
+                                                shuffle_buffer=50, seed=1)
+            first, second = self.rows_of(dataset), self.rows_of(dataset)
+            self.assertEqual(sorted(first), list(range(self.rows)))
+            self.assertEqual(sorted(second), list(range(self.rows)))
+            self.assertNotEqual(first, second)
+            # Mixed across the whole file, not only within a block or the shuffle buffer
+            self.assertGreater(max(first[:32]), 100)
+
+    def test_shards_split_the_rows(self):
+        shards = [self.rows_of(ecg_pipeline.make_dataset(self.signals, self.labels, num_shards=3, shard_index=index,
+                                                         shuffle=False))
+                  for index in range(3)]
+        self.assertEqual(sorted(sum(shards, [])), list(range(self.rows)))
+        self.assertEqual(shards[1][:2], [1, 4])
+
+    def test_augment_batch_scales_and_shifts(self):
+        signals = tf.ones([8, ecg_dataset.SIGNAL_LENGTH, 1])
+        labels = tf.range(8)
+        augmented, augmented_labels = ecg_pipeline.augment_batch(signals, labels, max_scale=0.2, max_shift=5)
+        augmented = augmented.numpy()[:, :, 0]
+        self.assertEqual(augmented.shape, (8, ecg_dataset.SIGNAL_LENGTH))
+        self.assertTrue(np.array_equal(augmented_labels.numpy(), np.arange(8)))
+        for signal in augmented:
+            scale = signal.max()
+            self.assertTrue(0.8 <= scale <= 1.2)
+            # A shifted run of ones, at most 5 steps shifted in as zeros at one end
+            nonzero = np.flatnonzero(signal)
+            self.assertGreaterEqual(len(nonzero), ecg_dataset.SIGNAL_LENGTH - 5)
+            self.assertTrue(np.allclose(signal[nonzero], scale))
+            self.assertTrue(nonzero[0] == 0 or nonzero[-1] == ecg_dataset.SIGNAL_LENGTH - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,26 @@
+import importlib
+import time
+
 __version__ = "1.0.0"
-from .loaders import sales_loader
-from .routes import item_routes
-from .routes import user_routes
-from .routes import sales_routes
+
+# Start of the startup report, see petshopapi.startup
+started_at = time.perf_counter()
+
+# Submodules imported on first access, so importing petshopapi (e.g. petshopapi.config)
+# does not load FastAPI, pandas and the Azure SDK
+LAZY_SUBMODULES = {
+    "sales_loader": "petshopapi.loaders.sales_loader",
+    "item_routes": "petshopapi.routes.item_routes",
+    "user_routes": "petshopapi.routes.user_routes",
+    "sales_routes": "petshopapi.routes.sales_routes",
+}
+
+
+def __getattr__(name: str):
+    if name not in LAZY_SUBMODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from petshopapi.startup import startup_report
+    with startup_report.phase(f"import {name}"):
+        module = importlib.import_module(LAZY_SUBMODULES[name])
+    globals()[name] = module
+    return module
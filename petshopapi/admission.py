@@ -0,0 +1,183 @@
+import math
+import time
+from dataclasses import dataclass
+
+from fastapi import Request
+
+from petshopapi.config import settings
+from petshopapi.metrics import registry
+
+# Uploads accepted but not finished: spooling, queued or running
+max_ingestions = settings["settings"].get("admission_max_ingestions", 8)
+# Bytes of those uploads, against the temporary disk and the Table Storage throughput
+max_bytes_in_flight = settings["settings"].get("admission_max_bytes_in_flight", 4 * 1024 ** 3)
+client_uploads_per_minute = settings["settings"].get("admission_client_uploads_per_minute", 30)
+client_burst = settings["settings"].get("admission_client_burst", 5)
+# Header naming the client (e.g. X-Forwarded-For behind a proxy), empty to use the peer address
+client_header = settings["settings"].get("admission_client_header", "")
+# Retry-After sent when a global limit is reached, the time a queued job usually takes to free a slot
+retry_after_seconds = settings["settings"].get("admission_retry_after_seconds", 10)
+
+# Idle clients are forgotten beyond this number of buckets
+MAX_CLIENTS = 10000
+
+
+class AdmissionRejected(Exception):
+    """
+    An upload over one of the limits. reason is "ingestions", "bytes" or "client".
+    """
+
+    def __init__(self, reason: str, retry_after: float, detail: str):
+        super().__init__(detail)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.detail = detail
+
+    def headers(self) -> dict:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, now: float) -> float:
+        """
+        Take a token. Returns 0 when one was available, otherwise the seconds until the next one.
+        """
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else float(retry_after_seconds)
+
+
+@dataclass
+class Ticket:
+    client: str
+    size: int
+    released: bool = False
+
+
+class AdmissionController:
+    """
+    Admission control of the sales uploads, checked before the request body is read.
+    Each client has a token bucket of client_burst uploads refilled at client_uploads_per_minute, and the
+    worker accepts at most max_ingestions uploads and max_bytes_in_flight bytes until their jobs finish.
+    Rejected uploads get 429 with Retry-After instead of slowing down the jobs already running.
+    The limits apply to each server worker process.
+    """
+
+    def __init__(self, max_ingestions: int = max_ingestions, max_bytes: int = max_bytes_in_flight,
+                 uploads_per_minute: float = client_uploads_per_minute, burst: int = client_burst,
+                 retry_after: float = retry_after_seconds):
+        self.max_ingestions = max_ingestions
+        self.max_bytes = max_bytes
+        self.rate = uploads_per_minute / 60
+        self.burst = burst
+        self.retry_after = retry_after
+        self.buckets: dict[str, TokenBucket] = {}
+        self.ingestions = 0
+        self.bytes_in_flight = 0
+        self.rejections: dict[str, int] = {"ingestions": 0, "bytes": 0, "client": 0}
+
+    def admit(self, client: str, size: int) -> Ticket:
+        """
+        Reserve a slot and size bytes (the Content-Length, 0 when unknown) for an upload of client,
+        or raise AdmissionRejected. Release the ticket when the upload is done with.
+        """
+        if self.ingestions >= self.max_ingestions:
+            self.reject("ingestions", self.retry_after, f"Too many uploads in progress ({self.ingestions})")
+        # A file larger than the limit is still accepted when nothing else is in flight
+        if self.bytes_in_flight and self.bytes_in_flight + size > self.max_bytes:
+            self.reject("bytes", self.retry_after, f"Too many bytes in flight ({self.bytes_in_flight})")
+
+        now = time.monotonic()
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            self.forget_idle_clients(now)
+            bucket = self.buckets[client] = TokenBucket(self.rate, self.burst, now)
+        wait = bucket.take(now)
+        if wait:
+            self.reject("client", wait, f"Upload rate limit of {client} exceeded")
+
+        self.ingestions += 1
+        self.bytes_in_flight += size
+        return Ticket(client=client, size=size)
+
+    def resize(self, ticket: Ticket, size: int):
+        """
+        Account the actual size of the upload once it is known, e.g. after the body was spooled.
+        """
+        if not ticket.released:
+            self.bytes_in_flight += size - ticket.size
+            ticket.size = size
+
+    def release(self, ticket: Ticket):
+        if not ticket.released:
+            ticket.released = True
+            self.ingestions -= 1
+            self.bytes_in_flight -= ticket.size
+
+    def reject(self, reason: str, retry_after: float, detail: str):
+        self.rejections[reason] += 1
+        raise AdmissionRejected(reason, retry_after, detail)
+
+    def forget_idle_clients(self, now: float):
+        if len(self.buckets) < MAX_CLIENTS:
+            return
+        for client, bucket in list(self.buckets.items()):
+            bucket.refill(now)
+            if bucket.tokens >= bucket.capacity:
+                del self.buckets[client]
+
+    def stats(self) -> dict:
+        return {
+            "ingestions": self.ingestions,
+            "max_ingestions": self.max_ingestions,
+            "bytes_in_flight": self.bytes_in_flight,
+            "max_bytes_in_flight": self.max_bytes,
+            "clients": len(self.buckets),
+            "rejections": dict(self.rejections),
+        }
+
+
+def client_id(request: Request) -> str:
+    """
+    Client of the request: the first address of client_header when it is set and present, else the peer address.
+    """
+    if client_header:
+        value = request.headers.get(client_header, "").split(",")[0].strip()
+        if value:
+            return value
+    return request.client.host if request.client else "unknown"
+
+
+def content_length(request: Request) -> int:
+    """
+    Content-Length of the request, or of its compressed body as received when CompressionMiddleware
+    decompresses it (the header is removed then). 0 when unknown, e.g. for a chunked body.
+    """
+    value = request.headers.get("content-length") or request.scope.get("state", {}).get("wire_content_length", 0)
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+upload_admission = AdmissionController()
+
+registry.gauge("sales_admission_ingestions", "Uploads admitted and not finished.") \
+    .set_function(lambda: upload_admission.ingestions)
+registry.gauge("sales_admission_bytes_in_flight", "Bytes of the uploads admitted and not finished.") \
+    .set_function(lambda: upload_admission.bytes_in_flight)
+for reason in ("ingestions", "bytes", "client"):
+    registry.counter(f"sales_admission_rejections_{reason}_total", f"Uploads rejected by the {reason} limit.") \
+        .set_function(lambda reason=reason: upload_admission.rejections[reason])
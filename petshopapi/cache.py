@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Iterable
+
+from petshopapi.config import settings
+from petshopapi.metrics import registry
+
+cache_max_entries = settings["settings"].get("cache_max_entries", 1024)
+cache_ttl_seconds = settings["settings"].get("cache_ttl_seconds", 60)
+
+
+class AsyncTTLCache:
+    """
+    Bounded in-process cache with TTL expiry and LRU eviction.
+    Keys are tuples whose first element is the domain (None for queries across all domains),
+    so writes can invalidate the entries of the partitions they touched.
+    Concurrent misses on the same key are coalesced: only one loader runs, the other callers await its result.
+    The cache lives in one worker process; other workers see the writes once their entries expire.
+    """
+
+    def __init__(self, max_entries: int = cache_max_entries, ttl_seconds: float = cache_ttl_seconds):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.inflight: dict[Hashable, asyncio.Future] = {}
+        # Bumped on every invalidation, so a load that started before a write is not cached after it
+        self.generations: dict[str, int] = {}
+        self.invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def generation(self, key: tuple) -> int:
+        domain = key[0]
+        return self.invalidations if domain is None else self.generations.get(domain, 0)
+
+    async def get_or_load(self, key: tuple, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for key, or await loader() and cache its result.
+        """
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        future = self.inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The request running the loader went away, load it for this caller instead
+                return await self.get_or_load(key, loader)
+
+        self.misses += 1
+        generation = self.generation(key)
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else is waiting on it
+            future.exception()
+            raise
+        finally:
+            del self.inflight[key]
+        future.set_result(value)
+        if self.generation(key) == generation:
+            self.set(key, value)
+        return value
+
+    def set(self, key: tuple, value: Any):
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate_domains(self, domains: Iterable[str]):
+        """
+        Drop the entries of the given domains and the entries spanning all domains.
+        """
+        domains = set(domains)
+        if not domains:
+            return
+        for domain in domains:
+            self.generations[domain] = self.generations.get(domain, 0) + 1
+        self.invalidations += 1
+        for key in [key for key in self.entries if key[0] is None or key[0] in domains]:
+            del self.entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else None,
+        }
+
+
+# Cache of the sales aggregate endpoints
+sales_cache = AsyncTTLCache()
+
+for counter in ("hits", "misses", "coalesced", "evictions", "invalidations"):
+    registry.counter(f"sales_cache_{counter}_total", f"Sales aggregate cache {counter}.") \
+        .set_function(lambda counter=counter: getattr(sales_cache, counter))
+registry.gauge("sales_cache_entries", "Entries in the sales aggregate cache.") \
+    .set_function(lambda: len(sales_cache.entries))
@@ -0,0 +1,57 @@
+from petshopapi.config import settings
+from petshopapi.logger_config import logger
+from petshopapi.startup import startup_report
+from petshopapi.storage.sales_store import SalesStore
+
+sales_backend = settings["settings"].get("sales_backend", "azure_tables")
+
+# Shared sales store, opened once per process in the FastAPI lifespan hook
+sales_store: SalesStore = None
+
+
+def create_sales_store(backend: str = sales_backend) -> SalesStore:
+    """
+    Create the sales store for the configured backend: azure_tables, sqlite or parquet.
+    Only the module of that backend, and its SDK, is imported.
+    """
+    with startup_report.phase(f"import {backend} store"):
+        if backend == "azure_tables":
+            from petshopapi.storage.azure_table_store import AzureTableSalesStore
+            return AzureTableSalesStore()
+        if backend == "sqlite":
+            from petshopapi.storage.sqlite_store import SqliteSalesStore
+            return SqliteSalesStore()
+        if backend == "parquet":
+            from petshopapi.storage.parquet_store import ParquetSalesStore
+            return ParquetSalesStore()
+    raise ValueError(f"Unknown sales backend: {backend}")
+
+
+async def open_clients():
+    """
+    Create and open the shared sales store.
+    """
+    global sales_store
+    sales_store = create_sales_store()
+    with startup_report.phase(f"open {sales_store.name} store"):
+        await sales_store.open()
+    logger.info(f"Using {sales_store.name} sales backend")
+
+
+async def close_clients():
+    """
+    Close the shared sales store and release its connections.
+    """
+    global sales_store
+    if sales_store is not None:
+        await sales_store.close()
+    sales_store = None
+
+
+def get_sales_store() -> SalesStore:
+    """
+    Return the shared sales store. open_clients must have been awaited first.
+    """
+    if sales_store is None:
+        raise RuntimeError("The sales store is not initialized. It is opened in the app lifespan.")
+    return sales_store
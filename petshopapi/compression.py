@@ -0,0 +1,275 @@
+import zlib
+from abc import ABC, abstractmethod
+
+from petshopapi.config import settings
+from petshopapi.logger_config import logger
+
+try:
+    import zstandard
+except ImportError:
+    # zstd is optional, without it only gzip is negotiated
+    zstandard = None
+
+DECOMPRESSION_ERRORS = (zlib.error,) if zstandard is None else (zlib.error, zstandard.ZstdError)
+
+minimum_size = settings["settings"].get("compression_minimum_size", 1024)
+gzip_level = settings["settings"].get("compression_gzip_level", 6)
+zstd_level = settings["settings"].get("compression_zstd_level", 3)
+# Limit of a decompressed request body, against compression bombs
+max_decompressed_bytes = settings["settings"].get("max_decompressed_request_bytes", 1024 ** 3)
+
+# Largest piece of decompressed body produced at a time
+DECOMPRESS_BLOCK_SIZE = 1024 * 1024
+# zstd has no output limit per call, its input is fed in slices this small instead: a zstd block of 128 KiB
+# can be encoded in 3 bytes, so a slice decompresses to about 45 MiB at most
+ZSTD_INPUT_SLICE = 1024
+
+
+def supported_encodings() -> list[str]:
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def choose_encoding(accept_encoding: str) -> str:
+    """
+    Pick the response encoding from the Accept-Encoding header, zstd first. Returns None for identity.
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip())
+    for encoding in supported_encodings():
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def compressor(encoding: str):
+    """
+    Streaming compressor with compress(data) and flush() methods.
+    """
+    if encoding == "gzip":
+        return zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+    return zstandard.ZstdCompressor(level=zstd_level).compressobj()
+
+
+class BodyDecoder(ABC):
+    """
+    Decompresses a request body piece by piece: pieces(data, final) yields the decompressed data
+    in pieces of about DECOMPRESS_BLOCK_SIZE bytes, so a small compressed message never expands in memory
+    all at once, and raises ValueError once the body goes over max_bytes.
+    Concatenated gzip members and zstd frames are decompressed one after the other, a body ending
+    in the middle of one is an error.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.decoder = self.new_decoder()
+        # Whether the current member or frame got data, an empty body or one ending between members is complete
+        self.started = False
+
+    @abstractmethod
+    def new_decoder(self):
+        """
+        A decompressor for the next member or frame.
+        """
+
+    @abstractmethod
+    def decompress(self, data: bytes):
+        """
+        Yield the decompressed pieces of data, restarting the decoder at the end of each member or frame.
+        """
+
+    def count(self, piece: bytes) -> bytes:
+        self.total += len(piece)
+        if self.total > self.max_bytes:
+            raise ValueError(f"Decompressed request body larger than {self.max_bytes} bytes")
+        return piece
+
+    def next_member(self, unused_data: bytes) -> bytes:
+        self.decoder = self.new_decoder()
+        self.started = False
+        return unused_data
+
+    def pieces(self, data: bytes, final: bool):
+        for piece in self.decompress(data):
+            if piece:
+                yield self.count(piece)
+        if final and self.started:
+            raise ValueError("Invalid compressed request body: truncated")
+
+
+class GzipBodyDecoder(BodyDecoder):
+    def new_decoder(self):
+        return zlib.decompressobj(31)
+
+    def decompress(self, data: bytes):
+        while True:
+            self.started = self.started or bool(data)
+            piece = self.decoder.decompress(data, DECOMPRESS_BLOCK_SIZE)
+            yield piece
+            data = self.decoder.unconsumed_tail
+            if self.decoder.eof:
+                data = self.next_member(self.decoder.unused_data + data)
+            # A full piece may leave output in the decoder even without input left
+            if not data and len(piece) < DECOMPRESS_BLOCK_SIZE:
+                return
+
+
+class ZstdBodyDecoder(BodyDecoder):
+    def new_decoder(self):
+        return zstandard.ZstdDecompressor().decompressobj(write_size=DECOMPRESS_BLOCK_SIZE)
+
+    def decompress(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            self.started = True
+            piece = self.decoder.decompress(view[:ZSTD_INPUT_SLICE].tobytes())
+            view = view[ZSTD_INPUT_SLICE:]
+            for start in range(0, len(piece), DECOMPRESS_BLOCK_SIZE):
+                yield piece[start:start + DECOMPRESS_BLOCK_SIZE]
+            if self.decoder.eof:
+                view = memoryview(self.next_member(self.decoder.unused_data + view.tobytes()))
+
+
+def decompressor(encoding: str, max_bytes: int = None):
+    """
+    BodyDecoder of an encoding, None for an unsupported encoding.
+    """
+    max_bytes = max_decompressed_bytes if max_bytes is None else max_bytes
+    if encoding == "gzip":
+        return GzipBodyDecoder(max_bytes)
+    if encoding == "zstd" and zstandard is not None:
+        return ZstdBodyDecoder(max_bytes)
+    return None
+
+
+def replace_headers(headers: list, names: set[bytes], extra: list = ()) -> list:
+    return [(name, value) for name, value in headers if name.lower() not in names] + list(extra)
+
+
+async def send_error(send, status: int, detail: bytes):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain"), (b"content-length", str(len(detail)).encode())]})
+    await send({"type": "http.response.body", "body": detail})
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware for compressed bodies in both directions.
+    Requests with Content-Encoding gzip or zstd are decompressed chunk by chunk as the app reads them,
+    so the multipart parser and the upload spool see the plain body without holding it in memory.
+    Responses of minimum_size bytes or more are compressed with zstd or gzip, per the Accept-Encoding header.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_encoding = headers.get(b"content-encoding", b"").decode("latin-1").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            decoder = decompressor(content_encoding)
+            if decoder is None:
+                await send_error(send, 415, f"Unsupported Content-Encoding: {content_encoding}".encode())
+                return
+            # Updated in place: the outer middlewares read what the router adds to this scope
+            scope["headers"] = replace_headers(scope["headers"], {b"content-encoding", b"content-length"})
+            # The length of the decompressed body is unknown, the compressed one is kept for the admission control
+            if b"content-length" in headers:
+                scope.setdefault("state", {})["wire_content_length"] = headers[b"content-length"].decode("latin-1")
+            receive = self.decompressing_receive(receive, decoder)
+
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is not None:
+            send = self.compressing_send(send, encoding)
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    def decompressing_receive(receive, decoder: BodyDecoder):
+        """
+        Each call returns the next decompressed piece of the body, a received message that decompresses
+        to several pieces is returned over several calls. Once the body is complete, receive is called directly.
+        """
+        pieces = iter(())
+        last_message = False
+        finished = False
+
+        async def receive_decompressed():
+            nonlocal pieces, last_message, finished
+            while not finished:
+                try:
+                    piece = next(pieces, None)
+                except DECOMPRESSION_ERRORS as e:
+                    logger.warning(f"Invalid compressed request body: {e}")
+                    raise ValueError(f"Invalid compressed request body: {e}") from e
+                if piece is not None:
+                    return {"type": "http.request", "body": piece, "more_body": True}
+                if last_message:
+                    finished = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                message = await receive()
+                if message["type"] != "http.request":
+                    return message
+                last_message = not message.get("more_body", False)
+                pieces = decoder.pieces(message.get("body", b""), last_message)
+            return await receive()
+
+        return receive_decompressed
+
+    @staticmethod
+    def compressing_send(send, encoding: str):
+        start_message = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start_message, encoder
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start_message is not None:
+                start, start_message = start_message, None
+                response_headers = dict(start.get("headers", []))
+                skip = b"content-encoding" in response_headers \
+                    or response_headers.get(b"content-type", b"").startswith(b"text/event-stream") \
+                    or (not more_body and len(body) < minimum_size)
+                if skip:
+                    await send(start)
+                    await send(message)
+                    return
+                encoder = compressor(encoding)
+                body = encoder.compress(body)
+                if not more_body:
+                    body += encoder.flush()
+                    extra = [(b"content-length", str(len(body)).encode())]
+                else:
+                    extra = []
+                vary = b", ".join(value for name, value in start.get("headers", []) if name.lower() == b"vary")
+                extra += [(b"content-encoding", encoding.encode()),
+                          (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding")]
+                await send({**start, "headers": replace_headers(start.get("headers", []),
+                                                                {b"content-length", b"vary"}, extra)})
+                await send({**message, "body": body})
+                return
+
+            if encoder is None:
+                await send(message)
+                return
+            body = encoder.compress(body)
+            if not more_body:
+                body += encoder.flush()
+            await send({**message, "body": body})
+
+        return send_compressed
@@ -1,9 +1,21 @@
 import json
 import os
 
+# Environment variables named PETSHOPAPI_<SETTING> override the entries of the "settings" section,
+# e.g. PETSHOPAPI_SALES_BACKEND=sqlite
+ENV_PREFIX = "PETSHOPAPI_"
+
 def load_settings():
     config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "petshopapi" , "appsettings.json")
     with open(config_path, "r") as f:
-        return json.load(f)
+        config = json.load(f)
+    for key, value in os.environ.items():
+        if key.startswith(ENV_PREFIX):
+            name = key[len(ENV_PREFIX):].lower()
+            try:
+                config["settings"][name] = json.loads(value)
+            except ValueError:
+                config["settings"][name] = value
+    return config
 
-settings = load_settings()
\ No newline at end of file
+settings = load_settings()
@@ -0,0 +1,373 @@
+import asyncio
+import fcntl
+import hashlib
+import importlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional, TextIO
+
+from petshopapi.config import settings
+from petshopapi.loaders.checkpoints import IngestionCheckpoint
+from petshopapi.logger_config import logger
+from petshopapi.startup import startup_report
+from petshopapi.storage.sales_store import WriteMode, default_write_mode
+
+ingestion_workers = settings["settings"].get("ingestion_workers", 2)
+max_finished_jobs = settings["settings"].get("ingestion_max_finished_jobs", 1000)
+# Job status files, shared by the server worker processes of the node
+jobs_dir = settings["settings"].get("ingestion_jobs_dir") or os.path.join(tempfile.gettempdir(), "petshopapi_jobs")
+# Time given to the running jobs to finish when the server shuts down
+drain_seconds = settings["settings"].get("ingestion_drain_seconds", 25)
+# Checkpoints of the failed uploads are kept this long for a re-upload of the same file to resume
+checkpoint_max_age_hours = settings["settings"].get("ingestion_checkpoint_max_age_hours", 72)
+# Minimum time between two writes of the status file of a running job, the worker process reports it from memory
+status_save_seconds = settings["settings"].get("ingestion_status_save_seconds", 1)
+
+SPOOL_BLOCK_SIZE = 1 << 20
+
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadInProgress(Exception):
+    """
+    An upload of a file that a queued or running job, in this or another worker process, is already ingesting.
+    """
+
+    def __init__(self, content_hash: str):
+        self.detail = f"The same file (sha256 {content_hash}) is already being ingested"
+        super().__init__(self.detail)
+
+
+class UploadSpool:
+    """
+    Temporary file an upload is copied to as it is received, hashed on the way.
+    write() and close() do file I/O, call them on a thread.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = tempfile.NamedTemporaryFile(prefix="sales_", delete=False)
+        self.path = self.file.name
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.digest.update(data)
+        self.file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.file.close()
+
+    def discard(self):
+        self.file.close()
+        remove_file(self.path)
+
+    @property
+    def content_hash(self) -> str:
+        return self.digest.hexdigest()
+
+
+@dataclass
+class IngestionJob:
+    id: str
+    filename: str
+    path: str
+    total_bytes: int
+    mode: WriteMode = default_write_mode
+    status: str = "queued"  # queued, running, completed, completed_with_errors, failed
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    rows_processed: int = 0
+    duplicates_dropped: int = 0
+    rejections: dict = field(default_factory=dict)
+    rows_written: int = 0
+    bytes_processed: int = 0
+    failed_batches: list = field(default_factory=list)
+    error: Optional[str] = None
+    content_hash: Optional[str] = None  # sha256 of the uploaded file, keys its checkpoint
+    resumed_chunks: int = 0
+
+    def to_dict(self) -> dict:
+        """
+        Report the job progress, including throughput in rows/sec and the estimated time left in seconds.
+        """
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        rows_per_second = self.rows_processed / elapsed if elapsed else None
+        eta_seconds = None
+        if self.status == "running" and self.bytes_processed and elapsed:
+            eta_seconds = elapsed * (self.total_bytes - self.bytes_processed) / self.bytes_processed
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "mode": self.mode.value,
+            "status": self.status,
+            "total_bytes": self.total_bytes,
+            "bytes_processed": self.bytes_processed,
+            "rows_processed": self.rows_processed,
+            "duplicates_dropped": self.duplicates_dropped,
+            "rows_rejected": self.rejections.get("rows_rejected", 0),
+            "rejections": self.rejections,
+            "rows_written": self.rows_written,
+            "failed_batches": self.failed_batches,
+            "error": self.error,
+            "content_hash": self.content_hash,
+            "resumed_chunks": self.resumed_chunks,
+            "elapsed_seconds": elapsed,
+            "rows_per_second": rows_per_second,
+            "eta_seconds": eta_seconds,
+        }
+
+
+class IngestionJobManager:
+    """
+    Queue of sales uploads drained by a pool of async workers running in the API process.
+    Uploads are spooled to a temporary file (UploadSpool) so the HTTP request can return as soon as the job is queued.
+    The status of every job is also written to jobs_dir, so any server worker process can report it.
+    Status files are written on a thread, at most every status_save_seconds while the job runs.
+    Each job saves a checkpoint keyed by the file content in jobs_dir/checkpoints, kept when it fails or
+    has failed batches: uploading the same file again resumes from it. While a job is queued or running it holds
+    a lock on the checkpoint, so a second upload of the same file is rejected with UploadInProgress instead of
+    sharing it.
+    """
+
+    def __init__(self, workers: int = ingestion_workers, max_finished: int = max_finished_jobs,
+                 jobs_dir: str = jobs_dir):
+        self.workers = workers
+        self.max_finished = max_finished
+        self.jobs_dir = jobs_dir
+        self.jobs: OrderedDict[str, IngestionJob] = OrderedDict()
+        self.queue: asyncio.Queue = None
+        # petshopapi.loaders.sales_loader, imported when the workers start (it loads pandas)
+        self.loader = None
+        self.tasks: list[asyncio.Task] = []
+        # Called once the job finished, e.g. to release its admission ticket
+        self.on_finish: dict[str, Callable[[], None]] = {}
+        # Checkpoint lock file of each queued or running job
+        self.checkpoint_locks: dict[str, TextIO] = {}
+
+    async def start(self):
+        with startup_report.phase("import sales_loader"):
+            self.loader = importlib.import_module("petshopapi.loaders.sales_loader")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        await asyncio.to_thread(self._remove_old_checkpoints)
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} ingestion workers.")
+
+    async def stop(self, timeout: float = drain_seconds):
+        """
+        Let the running jobs finish for up to timeout seconds, then cancel them.
+        Queued jobs that did not start are marked as failed.
+        """
+        while not self.queue.empty():
+            job = self.queue.get_nowait()
+            job.status = "failed"
+            job.error = "The server shut down before the job started"
+            await self._finish(job)
+            self.queue.task_done()
+        # One stop marker per worker, each worker exits after its current job
+        for _ in self.tasks:
+            self.queue.put_nowait(None)
+        if self.tasks:
+            _, pending = await asyncio.wait(self.tasks, timeout=timeout)
+            if pending:
+                logger.warning(f"{len(pending)} ingestion jobs still running after {timeout}s, cancelling them.")
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info("Ingestion workers stopped.")
+
+    async def submit(self, spool: UploadSpool, mode: WriteMode = default_write_mode,
+                     on_finish: Optional[Callable[[], None]] = None) -> IngestionJob:
+        """
+        Queue a spooled upload for ingestion, the job removes the spool file once done.
+        Raises UploadInProgress, and removes the spool file, when a job is already ingesting the same file.
+        on_finish is called when the job completes or fails.
+        """
+        job_id = uuid.uuid4().hex
+        try:
+            lock = await asyncio.to_thread(self._lock_checkpoint, spool.content_hash)
+        except BaseException:
+            await asyncio.to_thread(spool.discard)
+            raise
+        self.checkpoint_locks[job_id] = lock
+        job = IngestionJob(id=job_id, filename=spool.filename, path=spool.path, total_bytes=spool.size,
+                           mode=mode, content_hash=spool.content_hash)
+        self.jobs[job_id] = job
+        if on_finish is not None:
+            self.on_finish[job_id] = on_finish
+        await self._save(job)
+        await self._evict_finished()
+        await self.queue.put(job)
+        logger.info(f"Queued ingestion job {job_id} for {job.filename} ({job.total_bytes} bytes)")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """
+        Return the job, from memory or from the status file written by another worker process.
+        """
+        job = self.jobs.get(job_id)
+        if job is None and JOB_ID_PATTERN.fullmatch(job_id):
+            try:
+                with open(self._status_path(job_id), "r") as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                return None
+            job = IngestionJob(**{**data, "mode": WriteMode(data["mode"])})
+        return job
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    async def _save(self, job: IngestionJob):
+        """
+        Write the status file of the job on a thread, from a copy of the job taken on the event loop.
+        """
+        data = {**asdict(job), "mode": job.mode.value}
+        await asyncio.to_thread(self._write_status, job.id, data)
+
+    def _write_status(self, job_id: str, data: dict):
+        path = self._status_path(job_id)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(f"{path}.tmp", path)
+
+    async def _finish(self, job: IngestionJob):
+        job.finished_at = time.time()
+        await asyncio.to_thread(remove_file, job.path)
+        await self._save(job)
+        lock = self.checkpoint_locks.pop(job.id, None)
+        if lock is not None:
+            lock.close()
+        callback = self.on_finish.pop(job.id, None)
+        if callback is not None:
+            callback()
+
+    def _checkpoint_path(self, content_hash: str) -> str:
+        return os.path.join(self.jobs_dir, "checkpoints", f"{content_hash}.json")
+
+    def _lock_checkpoint(self, content_hash: str) -> TextIO:
+        """
+        Take the lock of the checkpoint of a file, held until the job finishes. It is a flock on a file next to
+        the checkpoint, so it works across the worker processes and is released if the process dies.
+        """
+        path = f"{self._checkpoint_path(content_hash)}.lock"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lock = open(path, "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise UploadInProgress(content_hash)
+        # Keeps the lock file from the cleanup of the old checkpoints
+        os.utime(path)
+        return lock
+
+    def _remove_old_checkpoints(self):
+        directory = os.path.join(self.jobs_dir, "checkpoints")
+        if not os.path.isdir(directory):
+            return
+        oldest = time.time() - checkpoint_max_age_hours * 3600
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            try:
+                if os.path.getmtime(path) >= oldest:
+                    continue
+                if not name.endswith(".lock"):
+                    os.remove(path)
+                    continue
+                with open(path, "a") as lock:
+                    # Held by a job of another worker process, e.g. queued for longer than the max age
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+            except (FileNotFoundError, BlockingIOError):
+                pass
+
+    async def _evict_finished(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        evicted = finished[:max(0, len(finished) - self.max_finished)]
+        for job_id in evicted:
+            del self.jobs[job_id]
+        if evicted:
+            await asyncio.to_thread(self._remove_status_files, evicted)
+
+    def _remove_status_files(self, job_ids: list[str]):
+        for job_id in job_ids:
+            remove_file(self._status_path(job_id))
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job is None:
+                    return
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        await self._save(job)
+        logger.info(f"Running ingestion job {job.id}")
+        checkpoint = IngestionCheckpoint(self._checkpoint_path(job.content_hash)) if job.content_hash else None
+        # Status write in progress, a new one starts only once it is done and status_save_seconds passed
+        saving: Optional[asyncio.Task] = None
+        last_save = time.monotonic()
+        try:
+            with open(job.path, "rb") as f:
+                def progress(totals: dict):
+                    nonlocal saving, last_save
+                    job.resumed_chunks = totals["resumed_chunks"]
+                    job.rows_processed = totals["rows"]
+                    job.duplicates_dropped = totals["duplicates_dropped"]
+                    job.rejections = totals["rejections"]
+                    job.rows_written = totals["rows_written"]
+                    job.failed_batches = totals["failed_batches"]
+                    job.bytes_processed = f.tell()
+                    if time.monotonic() - last_save >= status_save_seconds and (saving is None or saving.done()):
+                        last_save = time.monotonic()
+                        saving = asyncio.create_task(self._save(job))
+
+                result = await self.loader.process_sales_stream(f, mode=job.mode, progress=progress,
+                                                                checkpoint=checkpoint)
+                progress(result)
+            job.status = "completed_with_errors" if job.failed_batches or job.rejections.get("rows_rejected") \
+                else "completed"
+            if checkpoint is not None and not job.failed_batches:
+                # Nothing left to retry, a new upload of the file writes it again
+                checkpoint.delete()
+        except asyncio.CancelledError:
+            job.status = "failed"
+            job.error = "Interrupted by the server shutdown"
+            raise
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            if saving is not None:
+                # The final status is written once the last progress write is done, so it is never overwritten
+                await asyncio.gather(saving, return_exceptions=True)
+            await self._finish(job)
+
+
+job_manager = IngestionJobManager()
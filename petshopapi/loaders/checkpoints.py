@@ -0,0 +1,58 @@
+import json
+import os
+from typing import Optional
+
+
+class IngestionCheckpoint:
+    """
+    Progress of an upload, saved after each written chunk so that an upload of the same file that
+    failed or was interrupted continues where it stopped instead of writing everything again.
+    For each chunk written it keeps the number of batches, the rows written and the batches that failed:
+    a resumed upload skips the chunks that were written and only writes the failed batches of the others.
+    The chunk and batch numbering depends on the file, the chunk size, the batch size and the store,
+    so the checkpoint only applies to an upload with the same signature.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.signature: dict = {}
+        self.chunks: list[dict] = []
+        self.resumed_chunks = 0
+
+    def start(self, signature: dict):
+        """
+        Load the chunks written by a previous upload with the same signature, if any.
+        """
+        self.signature = signature
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = {}
+        self.chunks = data.get("chunks", []) if data.get("signature") == signature else []
+        self.resumed_chunks = len(self.chunks)
+
+    def chunk(self, index: int) -> Optional[dict]:
+        """
+        Return {"batches", "rows_written", "failed_batches"} of a chunk written before, None for a new chunk.
+        """
+        return self.chunks[index] if index < len(self.chunks) else None
+
+    def record(self, index: int, result: dict):
+        entry = {"batches": result["batches"], "rows_written": result["rows_written"],
+                 "failed_batches": result["failed_batches"]}
+        if index < len(self.chunks):
+            self.chunks[index] = entry
+        else:
+            self.chunks.append(entry)
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump({"signature": self.signature, "chunks": self.chunks}, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -1,41 +1,221 @@
-from petshopapi.logger_config  import logger
+from petshopapi.logger_config  import SampledLogger, logger
 from petshopapi.config import settings
+from petshopapi import clients
+from petshopapi.cache import sales_cache
+from petshopapi import metrics
+from petshopapi.loaders import sales_readers, sales_schema
+from petshopapi.loaders.checkpoints import IngestionCheckpoint
+from petshopapi.storage.sales_store import WriteMode, default_write_mode
 
+import asyncio
+import numpy as np
 import pandas as pd
 import io
-from azure.data.tables import TableClient, TableServiceClient
-from azure.identity import DefaultAzureCredential
+import time
+from typing import BinaryIO, Callable, Optional
 
-storate_account_url = settings["settings"]["azure_storage_account_url"]    
-table_name = settings["settings"]["azure_table_name"]
+csv_chunk_rows = settings["settings"].get("csv_chunk_rows", 10000)
+# CSV parser: arrow (pyarrow.csv streaming reader) or pandas (C parser)
+csv_engine = settings["settings"].get("csv_engine", "arrow")
 
-credentials = DefaultAzureCredential()
-table_service_client = TableServiceClient(
-        endpoint=storate_account_url, credential=credentials
-    )
+# Number of parsed chunks waiting for the writer. Bounds memory while parsing overlaps with writing.
+PIPELINE_DEPTH = 2
 
-async def process_sales_data(file_content: bytes) -> str:
+# Row level logs of the ingestion loop are rate limited, a bad file would otherwise log every line
+rejected_row_log = SampledLogger(logger, per_second=2, burst=10)
+
+
+class SeenKeys:
+    """
+    64-bit hashes of the (PartitionKey, RowKey) of the chunks already parsed. Memory grows with the upload,
+    by 8 bytes per sale (80 MB for 10M sales), about a tenth of a Python set of the same hashes.
+    The hashes are kept in a few sorted uint64 arrays: a new chunk's array is merged with the last ones while
+    they are not larger, so there are at most log2(sales) arrays and adding or looking up a chunk stays cheap.
+    """
+
+    def __init__(self):
+        self.runs: list[np.ndarray] = []
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        # Looked up in sorted order, the binary searches then walk the runs in order instead of at random
+        order = np.argsort(hashes)
+        ordered = hashes[order]
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, ordered), len(run) - 1)
+            found[order] |= run[positions] == ordered
+        return found
+
+    def add(self, hashes: np.ndarray):
+        """
+        Add hashes that are not in the set yet.
+        """
+        run = np.sort(hashes)
+        while self.runs and len(self.runs[-1]) <= len(run):
+            # The stable sort (timsort) merges the two sorted halves in linear time
+            run = np.sort(np.concatenate([self.runs.pop(), run]), kind="stable")
+        if len(run):
+            self.runs.append(run)
+
+
+def drop_seen_keys(df: pd.DataFrame, seen: SeenKeys) -> tuple[pd.DataFrame, int]:
+    """
+    Drop the rows whose (PartitionKey, RowKey) was in an earlier chunk and add the keys of this chunk to seen.
+    """
+    hashes = pd.util.hash_pandas_object(df[["PartitionKey", "RowKey"]], index=False).to_numpy()
+    repeated = seen.contains(hashes)
+    seen.add(hashes[~repeated])
+    repeats = int(repeated.sum())
+    return (df[~repeated] if repeats else df), repeats
+
+
+def prepare_sales_chunk(df: pd.DataFrame, seen: Optional[SeenKeys] = None) -> tuple[pd.DataFrame, dict]:
+    """
+    Validate the chunk against the sales schema, rename the sales columns to the Table Storage keys
+    and drop duplicated (domain, saleid) rows, the last occurrence within the chunk wins.
+    With seen, the keys of the earlier chunks (see drop_seen_keys), the rows repeating a key of an earlier
+    chunk are dropped too: there the first occurrence wins.
+    Returns the chunk and its stats: the number of duplicates dropped and the rejection report.
+    """
+    # Bad rows are dropped here, before paying for a network call on them
+    df, rejections = sales_schema.validate_sales_frame(df)
+    df = df.rename(columns={"domain":"PartitionKey", "saleid":"RowKey"})
+    # A transaction fails as a whole if it contains the same entity twice, so dedup before any network I/O
+    duplicated = df.duplicated(subset=["PartitionKey", "RowKey"], keep="last")
+    duplicates = int(duplicated.sum())
+    if duplicates:
+        df = df[~duplicated]
+    if seen is not None:
+        df, repeats = drop_seen_keys(df, seen)
+        duplicates += repeats
+    return df, {"duplicates": duplicates, "rejections": rejections}
+
+
+def record_chunk_metrics(backend: str, rows: int, stats: dict, result: dict, seconds: float):
+    """
+    Count the rows of a chunk by outcome and update the ingestion throughput.
+    """
+    failed_rows = sum(batch["rows"] for batch in result["failed_batches"])
+    metrics.ingested_rows.labels(backend, "written").inc(result["rows_written"])
+    metrics.ingested_rows.labels(backend, "failed").inc(failed_rows)
+    metrics.ingested_rows.labels(backend, "rejected").inc(stats["rejections"]["rows_rejected"])
+    metrics.ingested_rows.labels(backend, "duplicate").inc(stats["duplicates"])
+    if seconds > 0:
+        metrics.ingestion_rows_per_second.set(rows / seconds)
+
+
+async def process_sales_data(file_content: bytes, mode: WriteMode = default_write_mode) -> dict:
     """
     Process the sales data from the file content.
-    This function should contain the logic to parse and process the sales data.
     """
     logger.info(f"Processing {len(file_content)} bytes of sales data.")
-    logger.info(f"Connected to Azure Table Service at {storate_account_url}")
-    
-    # Removing the check for table existence for simplicity and performance
-    # Assuming the table already exists. If not, you have to create it on azure portal or via Bicep.
-    table_client : TableClient = table_service_client.get_table_client(table_name = table_name)
-    logger.info(f"Connected to table: {table_name}")
-    # Assuming the file content is in CSV format
     # Convert bytes to a BytesIO stream for pandas to read
-    bytes_stream = io.BytesIO(file_content)
-    df = pd.read_csv(bytes_stream, sep=',', header=0)
-    df.rename(columns={"domain":"PartitionKey", "saleid":"RowKey"}, inplace=True)
-    
-    for index, row in df.iterrows():
-        logger.warning(f"Processing row {index}: {row.to_dict()}")
-        table_client.create_entity(entity=row.to_dict())
-        # Here you would add logic to process each row, e.g., saving to a database
-        # Add sales to azure table or any other storage
-
-    return "Sales data processed successfully."
+    return await process_sales_stream(io.BytesIO(file_content), mode=mode)
+
+
+async def write_chunk(store, chunk: pd.DataFrame, mode: WriteMode, batch_offset: int,
+                      written: Optional[dict]) -> tuple[dict, dict]:
+    """
+    Write a chunk, or only its failed batches when written is the checkpoint of a previous attempt.
+    Returns the result of the chunk, including the rows written before, and the result of this write.
+    """
+    if written is None:
+        result = await store.write(chunk, mode=mode, batch_offset=batch_offset)
+        return result, result
+    retry = {batch["batch"] for batch in written["failed_batches"]}
+    if retry:
+        result = await store.write(chunk, mode=mode, batch_offset=batch_offset, batches=retry)
+    else:
+        result = {"rows_written": 0, "batches": written["batches"], "failed_batches": []}
+    return {**result, "rows_written": written["rows_written"] + result["rows_written"]}, result
+
+
+async def process_sales_stream(file: BinaryIO, mode: WriteMode = default_write_mode,
+                               progress: Optional[Callable[[dict], None]] = None,
+                               checkpoint: Optional[IngestionCheckpoint] = None) -> dict:
+    """
+    Process the sales data from a binary file object (CSV or Parquet) in chunks of csv_chunk_rows rows.
+    Chunks are parsed on a worker thread and pipelined into the configured sales store,
+    so only a few chunks are held in memory regardless of the file size.
+    Duplicates are dropped within each chunk, the last one wins. Across chunks, in create mode a sale
+    repeating an earlier chunk is dropped (it would fail its whole transaction as a conflict), so the first
+    one wins; in the upsert modes it is written, and as the chunks are written one after the other the last
+    one wins. Use one of the upsert modes to make re-uploads idempotent.
+    progress is called with the running totals after each chunk is written.
+    With a checkpoint, the chunks written by a previous attempt on the same file are parsed again
+    but not written, except for their failed batches, and every written chunk is recorded.
+    """
+    store = clients.get_sales_store()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+    totals = {"backend": store.name, "mode": mode.value, "rows": 0, "chunks": 0, "duplicates_dropped": 0, "rows_rejected": 0,
+              "rejections": {}, "rows_written": 0, "batches": 0, "failed_batches": [], "resumed_chunks": 0}
+    if checkpoint is not None:
+        checkpoint.start({"backend": store.name, "mode": mode.value, "chunk_rows": csv_chunk_rows,
+                          "csv_engine": csv_engine, "batch_size": getattr(store, "batch_size", None)})
+        totals["resumed_chunks"] = checkpoint.resumed_chunks
+        if checkpoint.resumed_chunks:
+            logger.info(f"Resuming the upload after {checkpoint.resumed_chunks} chunks written before.")
+
+    # Keys of the chunks already parsed, to drop the sales repeated across chunks in create mode
+    seen = SeenKeys() if mode == WriteMode.CREATE else None
+
+    async def produce():
+        # Every column is read as text, the schema validation does the type coercion.
+        # The reader is a generator, each next() call reads and parses one chunk on a thread.
+        reader = sales_readers.read_sales_file(file, csv_chunk_rows, csv_engine)
+        try:
+            while True:
+                chunk = await asyncio.to_thread(next, reader, None)
+                if chunk is None:
+                    break
+                await queue.put(await asyncio.to_thread(prepare_sales_chunk, chunk, seen))
+        finally:
+            reader.close()
+        await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            chunk, stats = item
+            written = checkpoint.chunk(totals["chunks"]) if checkpoint is not None else None
+            start = time.perf_counter()
+            try:
+                with metrics.track_storage_call(store.name, "write"):
+                    result, write_result = await write_chunk(store, chunk, mode, totals["batches"], written)
+            finally:
+                # Write-through invalidation of the cached aggregates of the partitions this chunk touched
+                sales_cache.invalidate_domains(chunk["PartitionKey"].unique())
+            if checkpoint is not None:
+                await asyncio.to_thread(checkpoint.record, totals["chunks"], result)
+            totals["rows"] += len(chunk) + stats["duplicates"] + stats["rejections"]["rows_rejected"]
+            totals["chunks"] += 1
+            totals["duplicates_dropped"] += stats["duplicates"]
+            sales_schema.merge_rejection_reports(totals["rejections"], stats["rejections"])
+            totals["rows_rejected"] = totals["rejections"]["rows_rejected"]
+            for sample in stats["rejections"]["samples"]:
+                rejected_row_log.warning("Rejected line %s: %s", sample["line"], ", ".join(sample["reasons"]))
+            totals["rows_written"] += result["rows_written"]
+            totals["batches"] += result["batches"]
+            totals["failed_batches"].extend(result["failed_batches"])
+            if written is None:
+                record_chunk_metrics(store.name, len(chunk), stats, result, time.perf_counter() - start)
+            else:
+                # The rows of a resumed chunk were counted by the previous attempt, except the ones written now
+                metrics.ingested_rows.labels(store.name, "written").inc(write_result["rows_written"])
+            if progress is not None:
+                progress(totals)
+
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            tg.create_task(consume())
+    except ExceptionGroup as eg:
+        # Surface the original parsing or writing error to the caller
+        raise eg.exceptions[0]
+
+    logger.info(f"Processed {totals['rows']} rows in {totals['chunks']} chunks, {totals['rows_rejected']} rows rejected.")
+    status = "Sales data processed successfully." if not totals["failed_batches"] and not totals["rows_rejected"] \
+        else "Sales data processed with errors."
+    return {"status": status, **totals}
@@ -0,0 +1,139 @@
+from typing import BinaryIO, Iterator
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from petshopapi.loaders.sales_schema import SALES_SCHEMA
+
+PARQUET_MAGIC = b"PAR1"
+# Files compressed before the upload, decompressed by Arrow as they are parsed
+COMPRESSION_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+# Bytes read by each Arrow CSV block, the batches are then re-sliced to the chunk size
+ARROW_BLOCK_SIZE = 1 << 20
+
+
+class UnclosedFile:
+    """
+    File object whose close() leaves the wrapped file open. Arrow closes its input stream when the stream
+    is released, while the ingestion job still reads the file position for its progress and closes the file itself.
+    """
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+
+    def __getattr__(self, name: str):
+        return getattr(self.file, name)
+
+    def close(self):
+        pass
+
+
+def detect_format(file: BinaryIO) -> str:
+    """
+    Return "parquet", "gzip", "zstd" or "csv" from the first bytes of the file, and rewind it.
+    """
+    file.seek(0)
+    magic = file.read(len(PARQUET_MAGIC))
+    file.seek(0)
+    if magic == PARQUET_MAGIC:
+        return "parquet"
+    for prefix, compression in COMPRESSION_MAGIC.items():
+        if magic.startswith(prefix):
+            return compression
+    return "csv"
+
+
+def to_frame(table: pa.Table, offset: int) -> pd.DataFrame:
+    """
+    Convert a slice of the file to pandas. The index is the row number in the file, like the chunks of
+    pd.read_csv, so the rejection report points at the right lines. Strings stay Arrow backed.
+    """
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    return df
+
+
+def rechunk(batches: Iterator[pa.RecordBatch], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Group the record batches of a reader into DataFrames of chunk_rows rows, without copying the columns.
+    """
+    pending: list[pa.RecordBatch] = []
+    pending_rows = 0
+    offset = 0
+    for batch in batches:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+        while pending_rows >= chunk_rows:
+            table = pa.Table.from_batches(pending)
+            yield to_frame(table.slice(0, chunk_rows), offset)
+            offset += chunk_rows
+            rest = table.slice(chunk_rows)
+            pending, pending_rows = rest.to_batches(), rest.num_rows
+    if pending_rows:
+        yield to_frame(pa.Table.from_batches(pending), offset)
+
+
+def read_csv_pandas(file: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the CSV with the pandas C parser. Every column is read as text, the schema validation does the coercion.
+    """
+    with pd.read_csv(file, sep=',', header=0, chunksize=chunk_rows, dtype=str, keep_default_na=False) as reader:
+        yield from reader
+
+
+def read_csv_arrow(file: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the CSV with the multithreaded, streaming Arrow parser. The sales columns are read as text
+    and empty fields stay empty strings, as with the pandas reader.
+    """
+    convert_options = pa_csv.ConvertOptions(column_types={spec.name: pa.string() for spec in SALES_SCHEMA},
+                                            strings_can_be_null=False)
+    reader = pa_csv.open_csv(file, read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE),
+                             convert_options=convert_options)
+    try:
+        yield from rechunk(reader, chunk_rows)
+    finally:
+        reader.close()
+
+
+def read_parquet(file: BinaryIO, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """
+    Read a Parquet file one row group batch at a time. Typed columns are cast to text so the chunks
+    go through the same validation as the CSV ones.
+    """
+    parquet_file = pq.ParquetFile(file)
+    columns = [spec.name for spec in SALES_SCHEMA if spec.name in parquet_file.schema_arrow.names]
+    batches = (pa.RecordBatch.from_arrays([pc.cast(column, pa.string()) for column in batch.columns],
+                                          names=batch.schema.names)
+               for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns))
+    try:
+        yield from rechunk(batches, chunk_rows)
+    finally:
+        parquet_file.close()
+
+
+READERS = {
+    "pandas": read_csv_pandas,
+    "arrow": read_csv_arrow,
+}
+
+
+def read_sales_file(file: BinaryIO, chunk_rows: int, csv_engine: str = "arrow") -> Iterator[pd.DataFrame]:
+    """
+    Iterate over the chunks of a CSV or Parquet sales file, as DataFrames of text columns.
+    gzip and zstd compressed CSV files are decompressed while they are parsed, they stay compressed on disk.
+    csv_engine selects the CSV parser: arrow or pandas.
+    """
+    file_format = detect_format(file)
+    if file_format == "parquet":
+        return read_parquet(file, chunk_rows)
+    if file_format in COMPRESSION_MAGIC.values():
+        # Reads from the file as the parser consumes the stream, so file.tell() still reports the progress
+        file = pa.CompressedInputStream(pa.PythonFile(UnclosedFile(file), mode="r"), file_format)
+    if csv_engine not in READERS:
+        raise ValueError(f"Unknown csv_engine: {csv_engine}")
+    return READERS[csv_engine](file, chunk_rows)
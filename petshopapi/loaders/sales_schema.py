@@ -0,0 +1,139 @@
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+class SalesSchemaError(ValueError):
+    """
+    Raised when a sales file cannot be validated at all, e.g. a required column is missing.
+    """
+
+
+@dataclass(frozen=True)
+class ColumnSpec:
+    name: str
+    dtype: str  # key, string, int, float or date
+    required: bool = True
+    min_value: Optional[float] = None
+
+
+# Columns of the sales CSV (see data/sales.csv). domain and saleid become the PartitionKey and RowKey.
+SALES_SCHEMA = [
+    ColumnSpec("saleid", "key"),
+    ColumnSpec("productname", "string"),
+    ColumnSpec("clienttaxnum", "string"),
+    ColumnSpec("username", "string"),
+    ColumnSpec("quantity", "int", min_value=1),
+    ColumnSpec("price", "float", min_value=0),
+    ColumnSpec("domain", "key"),
+    # Optional, used by the date range queries and the monthly aggregates. Stored as YYYY-MM-DD text.
+    ColumnSpec("saledate", "date", required=False),
+]
+
+# Characters Table Storage does not allow in PartitionKey and RowKey
+INVALID_KEY_PATTERN = r"[/\\#?\x00-\x1f\x7f-\x9f]"
+MAX_KEY_LENGTH = 1024
+
+# Number of rejected rows kept as examples in the report
+MAX_REJECTION_SAMPLES = 10
+
+
+def parse_numbers(values: pd.Series) -> pd.Series:
+    """
+    Parse a text column as float64. Most chunks are clean, so the vectorized cast is tried first;
+    pd.to_numeric, which turns the bad values into NaN, is several times slower and only used when it fails.
+    """
+    try:
+        return values.astype("float64")
+    except (TypeError, ValueError):
+        return pd.to_numeric(values, errors="coerce").astype("float64")
+
+
+def validate_sales_frame(df: pd.DataFrame, schema: list[ColumnSpec] = SALES_SCHEMA) -> tuple[pd.DataFrame, dict]:
+    """
+    Validate and coerce a chunk of sales read with dtype=str.
+    Every check is a column-wise operation producing a boolean mask of bad rows.
+    Returns the valid rows, with numeric columns coerced, and a rejection report.
+    """
+    missing = [spec.name for spec in schema if spec.required and spec.name not in df.columns]
+    if missing:
+        raise SalesSchemaError(f"Missing required columns: {', '.join(missing)}")
+
+    columns = [spec.name for spec in schema if spec.name in df.columns]
+    df = df[columns].copy()
+    reasons: dict[str, pd.Series] = {}
+
+    for spec in schema:
+        if spec.name not in df.columns:
+            continue
+        values = df[spec.name]
+        if spec.dtype in ("key", "string"):
+            values = values.fillna("").astype(str).str.strip()
+            if spec.required:
+                reasons[f"missing_{spec.name}"] = values == ""
+            if spec.dtype == "key":
+                reasons[f"invalid_{spec.name}"] = values.str.contains(INVALID_KEY_PATTERN, regex=True) \
+                    | (values.str.len() > MAX_KEY_LENGTH)
+            df[spec.name] = values
+        elif spec.dtype == "date":
+            values = values.fillna("").astype(str).str.strip()
+            dates = pd.to_datetime(values, errors="coerce", format="ISO8601")
+            invalid = dates.isna() & (values != "")
+            if spec.required:
+                invalid |= values == ""
+            reasons[f"invalid_{spec.name}"] = invalid
+            df[spec.name] = dates.dt.strftime("%Y-%m-%d")
+        else:
+            numbers = parse_numbers(values)
+            invalid = ~np.isfinite(numbers)
+            if spec.dtype == "int":
+                invalid |= (numbers % 1 != 0)
+            if spec.min_value is not None:
+                invalid |= numbers < spec.min_value
+            if spec.required:
+                reasons[f"invalid_{spec.name}"] = invalid
+            else:
+                numbers = numbers.where(~invalid)
+            df[spec.name] = numbers
+
+    rejected = np.zeros(len(df), dtype=bool)
+    for mask in reasons.values():
+        rejected |= mask.to_numpy()
+
+    report = {
+        "rows_rejected": int(rejected.sum()),
+        "reasons": {reason: int(mask.sum()) for reason, mask in reasons.items() if mask.any()},
+        "samples": [],
+    }
+    if report["rows_rejected"]:
+        sample_index = df.index[rejected][:MAX_REJECTION_SAMPLES]
+        for index in sample_index:
+            report["samples"].append({
+                # +2: the index is 0-based and the first line is the header
+                "line": int(index) + 2,
+                "reasons": [reason for reason, mask in reasons.items() if mask.at[index]],
+            })
+        df = df[~rejected]
+
+    for spec in schema:
+        if spec.dtype == "int" and spec.required and spec.name in df.columns:
+            df[spec.name] = df[spec.name].astype("int64")
+        elif spec.dtype == "float" and spec.name in df.columns:
+            # to_numeric returns integers when every value of the chunk is integral
+            df[spec.name] = df[spec.name].astype("float64")
+    return df, report
+
+
+def merge_rejection_reports(total: dict, report: dict) -> dict:
+    """
+    Add the rejections of one chunk to the running report of the file.
+    """
+    total["rows_rejected"] = total.get("rows_rejected", 0) + report["rows_rejected"]
+    reasons = total.setdefault("reasons", {})
+    for reason, count in report["reasons"].items():
+        reasons[reason] = reasons.get(reason, 0) + count
+    samples = total.setdefault("samples", [])
+    samples.extend(report["samples"][:MAX_REJECTION_SAMPLES - len(samples)])
+    return total
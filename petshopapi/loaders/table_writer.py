@@ -0,0 +1,122 @@
+import asyncio
+from typing import Iterator, Optional
+
+import pandas as pd
+from azure.data.tables import UpdateMode
+from azure.data.tables.aio import TableClient
+
+from petshopapi.loaders.write_retry import AIMDLimiter, RetryPolicy, classify_error, retry_after
+from petshopapi.logger_config import SampledLogger, logger
+from petshopapi.metrics import storage_concurrency_limit, storage_retries, track_storage_call
+from petshopapi.storage.sales_store import WriteMode
+
+# Azure Table Storage accepts at most 100 operations per transaction,
+# and every operation in a transaction must share the same PartitionKey.
+MAX_BATCH_SIZE = 100
+
+# Throttling can fail hundreds of batches in a row, keep the error log readable
+failed_batch_log = SampledLogger(logger, per_second=1, burst=10)
+chunk_log = SampledLogger(logger, per_second=1)
+retry_log = SampledLogger(logger, per_second=1, burst=5)
+
+
+def build_operations(entities: list[dict], mode: WriteMode = WriteMode.CREATE) -> list[tuple]:
+    """
+    Build the transaction operations for the entities in the given write mode.
+    """
+    if mode == WriteMode.UPSERT_MERGE:
+        return [("upsert", entity, {"mode": UpdateMode.MERGE}) for entity in entities]
+    if mode == WriteMode.UPSERT_REPLACE:
+        return [("upsert", entity, {"mode": UpdateMode.REPLACE}) for entity in entities]
+    return [("create", entity) for entity in entities]
+
+
+def build_batches(df: pd.DataFrame, batch_size: int = MAX_BATCH_SIZE) -> Iterator[tuple[str, list[dict]]]:
+    """
+    Split the sales DataFrame into (partition_key, entities) batches.
+    Rows are grouped by PartitionKey and each group is sliced into chunks of batch_size.
+    """
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+    for partition_key, group in df.groupby("PartitionKey", sort=False):
+        # to_dict("records") converts the whole group in one call and returns native Python types
+        entities = group.to_dict("records")
+        if group.isna().values.any():
+            # Optional columns left empty are not stored as properties
+            entities = [{key: value for key, value in entity.items() if not pd.isna(value)} for entity in entities]
+        for start in range(0, len(entities), batch_size):
+            yield str(partition_key), entities[start:start + batch_size]
+
+
+async def write_entities(table_client: TableClient, df: pd.DataFrame,
+                         batch_size: int = MAX_BATCH_SIZE, max_concurrency: int = 8,
+                         batch_offset: int = 0, mode: WriteMode = WriteMode.CREATE,
+                         limiter: Optional[AIMDLimiter] = None, retry_policy: Optional[RetryPolicy] = None,
+                         batches: Optional[set[int]] = None) -> dict:
+    """
+    Write the DataFrame rows to Azure Table Storage as transactions using the async client.
+    The transactions in flight are bounded by limiter, which adapts to the throttling of the table
+    (by default a limiter of max_concurrency for this call only; pass a shared one to adapt across calls).
+    Throttled and transient failures are retried per retry_policy, honouring the service retry hints.
+    Returns a summary with the rows written and the batches that failed.
+    batch_offset numbers the batches when a file is written in several chunks. When batches is given,
+    only the batches with those numbers are written, e.g. the failed ones of a resumed upload.
+    The upsert modes make re-uploading a file (e.g. after a partial failure) safe.
+    """
+    limiter = limiter or AIMDLimiter(max_concurrency)
+    retry_policy = retry_policy or RetryPolicy()
+    failed_batches: list[dict] = []
+    rows_written = 0
+
+    async def submit(index: int, partition_key: str, entities: list[dict]):
+        nonlocal rows_written
+        operations = build_operations(entities, mode)
+        attempt = 0
+        while True:
+            attempt += 1
+            async with limiter:
+                try:
+                    with track_storage_call("azure_tables", "submit_transaction"):
+                        # Retries are made here, adapting the concurrency, not by the SDK pipeline
+                        await table_client.submit_transaction(operations, retry_total=0)
+                    limiter.on_success()
+                    rows_written += len(entities)
+                    return
+                except Exception as e:
+                    error = e
+                    kind = classify_error(e)
+                    if kind == "throttled":
+                        limiter.on_throttle()
+                    storage_concurrency_limit.labels("azure_tables").set(limiter.limit)
+            if kind is None or attempt >= retry_policy.attempts:
+                break
+            storage_retries.labels("azure_tables", kind).inc()
+            delay = retry_policy.delay(attempt - 1, retry_after(error))
+            retry_log.warning("Batch %s for partition %s %s, retrying in %.2fs (concurrency %s): %s",
+                              index, partition_key, kind, delay, int(limiter.limit), error)
+            await asyncio.sleep(delay)
+
+        failed_batch_log.error("Batch %s for partition %s failed after %s attempts: %s",
+                               index, partition_key, attempt, error)
+        failed_batches.append({
+            "batch": index,
+            "partition_key": partition_key,
+            "first_row_key": entities[0]["RowKey"],
+            "rows": len(entities),
+            "attempts": attempt,
+            "error": str(error),
+        })
+
+    # Converting rows to entities is CPU-bound, keep it off the event loop
+    all_batches = await asyncio.to_thread(lambda: list(build_batches(df, batch_size)))
+    tasks = [submit(index, partition_key, entities)
+             for index, (partition_key, entities) in enumerate(all_batches, start=batch_offset)
+             if batches is None or index in batches]
+    await asyncio.gather(*tasks)
+    storage_concurrency_limit.labels("azure_tables").set(limiter.limit)
+
+    chunk_log.info("Wrote %s rows in %s batches, %s batches failed.", rows_written, len(tasks), len(failed_batches))
+    return {
+        "rows_written": rows_written,
+        "batches": len(all_batches),
+        "failed_batches": sorted(failed_batches, key=lambda b: b["batch"]),
+    }
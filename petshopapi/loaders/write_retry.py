@@ -0,0 +1,122 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+from petshopapi.config import settings
+
+retry_attempts = settings["settings"].get("table_retry_attempts", 6)
+retry_base_delay = settings["settings"].get("table_retry_base_delay", 0.5)
+retry_max_delay = settings["settings"].get("table_retry_max_delay", 30)
+
+# Table Storage answers 503 ServerBusy (or 429 on the Cosmos DB endpoint) when a partition or the account is throttled
+THROTTLING_STATUS = {429, 503}
+THROTTLING_CODES = {"ServerBusy", "TooManyRequests", "OperationTimedOut"}
+TRANSIENT_STATUS = {408, 500, 502, 504}
+
+# Retry hints sent by the service, the millisecond ones are more precise than Retry-After
+RETRY_AFTER_MS_HEADERS = ("x-ms-retry-after-ms", "retry-after-ms")
+
+
+def classify_error(error: Exception) -> Optional[str]:
+    """
+    Return "throttled" or "transient" for the errors worth retrying, None for the ones that would fail again
+    (conflicts, invalid entities, authentication).
+    """
+    if isinstance(error, HttpResponseError) and error.status_code is not None:
+        if error.status_code in THROTTLING_STATUS or getattr(error, "error_code", None) in THROTTLING_CODES:
+            return "throttled"
+        return "transient" if error.status_code in TRANSIENT_STATUS else None
+    if isinstance(error, (ServiceRequestError, ServiceResponseError, ConnectionError, asyncio.TimeoutError)):
+        return "transient"
+    return None
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Seconds to wait before retrying, from the x-ms-retry-after-ms, retry-after-ms or Retry-After response headers.
+    """
+    response = getattr(error, "response", None)
+    if response is None or not response.headers:
+        return None
+    headers = {name.lower(): value for name, value in response.headers.items()}
+    for name in RETRY_AFTER_MS_HEADERS:
+        if name in headers:
+            try:
+                return max(0.0, float(headers[name]) / 1000)
+            except ValueError:
+                pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter: the n-th retry waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** n), so the batches throttled together don't retry together.
+    A retry hint of the server is honoured, with a little jitter on top.
+    """
+
+    def __init__(self, attempts: int = retry_attempts, base_delay: float = retry_base_delay,
+                 max_delay: float = retry_max_delay):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry: int, hint: Optional[float] = None) -> float:
+        if hint is not None:
+            return min(hint, self.max_delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class AIMDLimiter:
+    """
+    Concurrency limit adapted to the throttling of the store, like TCP congestion control:
+    each success adds 1 / limit (about one more slot per round of limit calls), a throttled call
+    multiplies the limit by decrease_factor, at most once per cooldown seconds so a burst of throttled
+    calls counts as one congestion signal. Use it as an async context manager around each call.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease_factor: float = 0.5, cooldown: float = 1.0):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self.throttled = 0
+        self.last_decrease = float("-inf")
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify(max(1, int(self.limit) - self.in_flight))
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self):
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self.last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+            self.last_decrease = now
@@ -1,11 +1,141 @@
+import atexit
+import json
 import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
 from petshopapi.config import settings
 
-logging.basicConfig(
-    #level=logging.INFO,
-    level = settings["settings"]["log_level"].upper(),
-    format="     ←[%(asctime)s | %(levelname)-8s | %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S"
-)
+TEXT_FORMAT = "     ←[%(asctime)s | %(levelname)-8s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Attributes every LogRecord has; anything else was passed with extra= and is added to the JSON document
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON document per line, with the fields passed through extra= as top level keys.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                document[key] = value
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that only merges the message arguments on the calling thread.
+    The standard handler formats the whole record before enqueueing it; here the formatting
+    and the write to the stream happen on the listener thread, off the event loop.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class SampledLogger:
+    """
+    Rate limited and sampled logging for a single call site of a hot loop.
+    At most per_second records are emitted (with bursts up to burst), and only one call out of sample_every
+    is considered. The next emitted record reports how many were suppressed in its "suppressed" field.
+    Check allow() before building an expensive message, or call log() with %-style arguments.
+    """
+
+    def __init__(self, logger: logging.Logger, per_second: float = 1.0, burst: int = 5, sample_every: int = 1):
+        self.logger = logger
+        self.per_second = per_second
+        self.burst = burst
+        self.sample_every = sample_every
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.calls = 0
+        self.suppressed = 0
+        self.lock = threading.Lock()
+
+    def allow(self, level: int = logging.INFO) -> bool:
+        if not self.logger.isEnabledFor(level):
+            return False
+        with self.lock:
+            self.calls += 1
+            if self.calls % self.sample_every:
+                self.suppressed += 1
+                return False
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.per_second)
+            self.updated_at = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+            return True
+
+    def log(self, level: int, msg: str, *args, **kwargs):
+        if not self.allow(level):
+            return
+        with self.lock:
+            suppressed, self.suppressed = self.suppressed, 0
+        if suppressed:
+            kwargs["extra"] = {**kwargs.get("extra", {}), "suppressed": suppressed}
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, msg: str, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg: str, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg: str, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg: str, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+
+def configure_logging() -> QueueListener:
+    """
+    Route every record through a queue to a listener thread that formats and writes it to stderr.
+    """
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if settings["settings"].get("log_format", "json") == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(settings["settings"]["log_level"].upper())
+
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    # Flush the records still in the queue when the process exits
+    atexit.register(stop_logging)
+    return listener
+
+
+def stop_logging():
+    """
+    Write the records still in the queue and stop the listener thread.
+    """
+    if listener._thread is not None:
+        listener.stop()
+
+
+listener = configure_logging()
 
 logger = logging.getLogger(__name__)
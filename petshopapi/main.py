@@ -1,9 +1,15 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
  #import user_router
 from petshopapi import item_routes, user_routes, sales_routes
 from petshopapi.logger_config import logger
 from petshopapi.config import settings
+from petshopapi import clients
+from petshopapi.ingestion_jobs import job_manager
+from petshopapi.compression import CompressionMiddleware
+from petshopapi.metrics import MetricsMiddleware, registry
+from petshopapi.startup import startup_report
 
 initializer: str = None
 
@@ -14,17 +20,33 @@ async def lifespan(app: FastAPI):
     logger.info(f"Starting up PetShopAPI. version: {settings["version"]}")
     global initializer 
     initializer = "ML model loaded"  # Placeholder for actual model loading logic
+    # Runs in every server worker process: each one opens its own clients and ingestion workers
+    await clients.open_clients()
+    with startup_report.phase("start ingestion workers"):
+        await job_manager.start()
+    startup_report.finish()
     yield
     # Clean up the ML models and release the resources
     logger.info("PetShop API Shutting down...")
+    # Waits up to ingestion_drain_seconds for the running ingestion jobs
+    await job_manager.stop()
+    await clients.close_clients()
 
 app = FastAPI(lifespan=lifespan)
+# The last middleware added is the outermost one, so the metrics include the compression time
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 @app.get("/")
 async def read_root():
     global initializer 
     return {"status": f"{initializer}" }
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 app.include_router(item_routes.router, prefix="/items", tags=["items"])
 app.include_router(user_routes.router, prefix="/users", tags=["users"])
 app.include_router(sales_routes.router, prefix="/sales", tags=["sales"])
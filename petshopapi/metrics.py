@@ -0,0 +1,263 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Latency buckets in seconds, from a cached aggregate to a large chunk write
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    Base class of the metrics. Children hold the value of each label combination.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: dict[tuple, object] = {}
+        self.lock = threading.Lock()
+        self.function: Optional[Callable[[], float]] = None
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Read the value from function at collection time, for values owned by another component.
+        """
+        self.function = function
+
+    @abstractmethod
+    def new_child(self):
+        """
+        The value of a new label combination.
+        """
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """
+        The sample lines of the metric in the text exposition format.
+        """
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Value:
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def new_child(self):
+        return Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def samples(self) -> list[str]:
+        if self.function is not None:
+            return [f"{self.name} {format_value(self.function())}"]
+        return [f"{self.name}{format_labels(self.labelnames, values)} {format_value(child.value)}"
+                for values, child in list(self.children.items())]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class HistogramValue:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def samples(self) -> list[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), child.counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, values, f'le="{format_value(float(bound))}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """
+    Metrics of the worker process, rendered in the Prometheus text exposition format.
+    Each uvicorn worker has its own registry, scrape every worker or aggregate by instance.
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter("http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+http_request_duration = registry.histogram("http_request_duration_seconds", "HTTP request latency.",
+                                           ("method", "route"))
+http_requests_in_flight = registry.gauge("http_requests_in_flight", "HTTP requests being handled.")
+
+ingested_rows = registry.counter("sales_ingested_rows_total",
+                                 "Sales rows read by the ingestion jobs, by outcome "
+                                 "(written, rejected, duplicate, failed).", ("backend", "outcome"))
+ingestion_rows_per_second = registry.gauge("sales_ingestion_rows_per_second",
+                                           "Throughput of the last chunk written by the ingestion jobs.")
+storage_call_duration = registry.histogram("sales_storage_call_duration_seconds",
+                                           "Latency of the calls to the sales store.", ("backend", "operation"))
+storage_errors = registry.counter("sales_storage_errors_total", "Failed calls to the sales store.",
+                                  ("backend", "operation"))
+storage_retries = registry.counter("sales_storage_retries_total", "Calls to the sales store retried, by reason.",
+                                   ("backend", "reason"))
+storage_concurrency_limit = registry.gauge("sales_storage_concurrency_limit",
+                                           "Writes allowed in flight by the adaptive concurrency limit.", ("backend",))
+
+
+@contextmanager
+def track_storage_call(backend: str, operation: str):
+    """
+    Record the latency of a call to the sales store, and count it as an error if it raises.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        storage_errors.labels(backend, operation).inc()
+        raise
+    finally:
+        storage_call_duration.labels(backend, operation).observe(time.perf_counter() - start)
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the route that handled the request, e.g. /sales/jobs/{job_id}, as set in the scope
+    by the router. Requests that did not match a route are grouped as "unmatched".
+    """
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # path_format drops the convertors of the parameters, e.g. {job_id:str}
+    return getattr(route, "path_format", None) or route.path
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording the latency, status and in-flight count of every HTTP request.
+    The route label is the path template (e.g. /sales/jobs/{job_id}) so the label set stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        start = time.perf_counter()
+        in_flight = http_requests_in_flight.labels()
+        in_flight.inc()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_flight.dec()
+            path = route_template(scope)
+            method = scope["method"]
+            http_request_duration.labels(method, path).observe(time.perf_counter() - start)
+            http_requests.labels(method, path, status).inc()
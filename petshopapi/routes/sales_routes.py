@@ -1,16 +1,126 @@
-from fastapi import APIRouter, File, UploadFile
-from typing import Annotated
-from petshopapi.loaders import sales_loader
+from datetime import date
+from typing import Annotated, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from petshopapi import clients
+from petshopapi.admission import AdmissionRejected, client_id, content_length, upload_admission
+from petshopapi.cache import sales_cache
+from petshopapi.metrics import track_storage_call
+from petshopapi.ingestion_jobs import UploadInProgress, job_manager
+from petshopapi.storage.sales_store import GroupBy, SalesFilter, WriteMode, default_write_mode
+from petshopapi.uploads import MultipartUpload
 from petshopapi.logger_config  import logger
 router = APIRouter()
 
-@router.post("/upload")
-async def create_sales_by_file(file: Annotated[bytes, File()]):
+def sales_filter(domain: Union[str, None] = None, username: Union[str, None] = None,
+                 start_date: Union[date, None] = None, end_date: Union[date, None] = None) -> SalesFilter:
+    """
+    Filters shared by the sales query endpoints. Dates are inclusive and match the saledate column.
+    """
+    return SalesFilter(domain=domain, username=username,
+                       start_date=start_date.isoformat() if start_date else None,
+                       end_date=end_date.isoformat() if end_date else None)
+
+@router.get("")
+async def list_sales(filters: Annotated[SalesFilter, Depends(sales_filter)],
+                     page_size: Annotated[int, Query(ge=1, le=1000)] = 100,
+                     continuation_token: Union[str, None] = None):
+    """
+    List sales filtered by domain, user and date range, one page at a time.
+    Pass the continuation_token of the response to get the next page. Filtering by domain
+    only reads that partition.
+    """
+    store = clients.get_sales_store()
+    try:
+        with track_storage_call(store.name, "query"):
+            return await store.query(filters, page_size=page_size, continuation_token=continuation_token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/aggregates/{group_by}")
+async def aggregate_sales(group_by: GroupBy, filters: Annotated[SalesFilter, Depends(sales_filter)]):
+    """
+    Number of sales, total quantity and total price per product, user or month.
+    Results are cached per domain, filters and date range, and invalidated when sales are written to the domain.
+    """
+    key = (filters.domain, "aggregate", group_by.value, filters.username, filters.start_date, filters.end_date)
+    store = clients.get_sales_store()
+
+    async def load():
+        with track_storage_call(store.name, "aggregate"):
+            return await store.aggregate(filters, group_by)
+
+    items = await sales_cache.get_or_load(key, load)
+    return {"group_by": group_by.value, "items": items}
+
+@router.get("/cache/stats")
+async def read_sales_cache_stats():
+    """
+    Hit, miss and eviction counters of the sales aggregate cache.
+    """
+    return sales_cache.stats()
+
+# The body is streamed to the job spool in the endpoint, after the admission check, so it is described here for the docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}},
+        }}},
+    }
+}
+
+@router.post("/upload", status_code=status.HTTP_202_ACCEPTED, openapi_extra=UPLOAD_REQUEST_BODY)
+async def create_sales_by_file(request: Request, mode: WriteMode = default_write_mode):
     """
     Create sales from a file.
-    The file should contain sales data in a specific format.
+    The file should contain sales data in a specific format, as CSV or Parquet.
+    mode selects how existing sales are handled: create, upsert-merge or upsert-replace.
+    The upload is queued as an ingestion job and the job id is returned immediately.
+    Use GET /sales/jobs/{job_id} to follow the progress.
+    Over the admission limits the upload is rejected with 429 and a Retry-After header, before it is read.
+    An upload of a file that is already being ingested is rejected with 409.
+    """
+    client = client_id(request)
+    try:
+        ticket = upload_admission.admit(client, content_length(request))
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected upload from {client}: {e.detail}")
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=e.detail, headers=e.headers())
+    try:
+        try:
+            upload = MultipartUpload(request.headers.get("content-type", ""))
+            spool = await upload.read(request.stream())
+        except ValueError as e:
+            # Invalid multipart or compressed body, see CompressionMiddleware
+            raise HTTPException(status_code=400, detail=f"There was an error parsing the body: {e}")
+        if spool is None:
+            raise HTTPException(status_code=422, detail="The file field is required")
+        logger.info(f"Received file {spool.filename} with {spool.size} bytes")
+        try:
+            job = await job_manager.submit(spool, mode=mode, on_finish=lambda: upload_admission.release(ticket))
+        except UploadInProgress as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=e.detail)
+    except BaseException:
+        upload_admission.release(ticket)
+        raise
+    upload_admission.resize(ticket, job.total_bytes)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/sales/jobs/{job.id}"}
+
+@router.get("/admission/stats")
+async def read_admission_stats():
+    """
+    Uploads and bytes in flight against the admission limits, and the rejected uploads by limit.
+    """
+    return upload_admission.stats()
+
+@router.get("/jobs/{job_id}")
+async def read_sales_job(job_id: str):
+    """
+    Report the progress of an ingestion job: rows processed, throughput, failures and ETA.
     """
-    logger.info(f"Received file with {len(file)} bytes")
-    response = await sales_loader.process_sales_data(file)
-    # This is a placeholder for the actual file processing logic
-    return {"status": response}
\ No newline at end of file
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job.to_dict()
@@ -0,0 +1,51 @@
+import os
+
+import uvicorn
+
+from petshopapi.config import settings
+from petshopapi.logger_config import logger
+
+server_host = settings["settings"].get("server_host", "0.0.0.0")
+server_port = settings["settings"].get("server_port", 8000)
+# 0 starts one worker process per core
+server_workers = settings["settings"].get("server_workers", 0)
+server_graceful_shutdown_seconds = settings["settings"].get("server_graceful_shutdown_seconds", 30)
+server_access_log = settings["settings"].get("server_access_log", True)
+
+
+def worker_count(workers: int = server_workers) -> int:
+    """
+    Number of worker processes, one per core available to the process when workers is 0.
+    """
+    if workers > 0:
+        return workers
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def main():
+    """
+    Production entry point: python -m petshopapi.server
+    Runs uvicorn without the reloader, with one process per core. Each worker runs the app lifespan,
+    so the sales store clients and the ingestion workers are created once per process.
+    uvloop and httptools are used when installed (uvicorn[standard]).
+    """
+    workers = worker_count()
+    logger.info(f"Starting {workers} server workers on {server_host}:{server_port}")
+    uvicorn.run(
+        "petshopapi.main:app",
+        host=server_host,
+        port=server_port,
+        workers=workers,
+        loop="auto",
+        http="auto",
+        # Keep the logging configured in logger_config, uvicorn's records go through the same queue
+        log_config=None,
+        access_log=server_access_log,
+        timeout_graceful_shutdown=server_graceful_shutdown_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
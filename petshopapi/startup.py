@@ -0,0 +1,51 @@
+import time
+from contextlib import contextmanager
+
+import petshopapi
+from petshopapi.logger_config import logger
+from petshopapi.metrics import registry
+
+startup_seconds = registry.gauge("petshopapi_startup_seconds",
+                                 "Time spent importing and initializing each component at startup.", ("phase",))
+
+
+class StartupReport:
+    """
+    Time spent importing and initializing each component of the worker process, in the order they ran.
+    Phases may be nested, e.g. the import of the sales store backend happens while opening the store.
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.finished_at: float = None
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+            startup_seconds.labels(name).set(self.phases[name])
+
+    def to_dict(self) -> dict:
+        return {
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "total_seconds": round((self.finished_at or time.perf_counter()) - self.started_at, 4),
+        }
+
+    def finish(self):
+        """
+        Mark the worker as ready and log the report.
+        """
+        self.finished_at = time.perf_counter()
+        startup_seconds.labels("total").set(self.finished_at - self.started_at)
+        report = self.to_dict()
+        phases = ", ".join(f"{name}: {seconds:.3f}s" for name, seconds in report["phases"].items())
+        logger.info(f"Started in {report['total_seconds']:.3f}s ({phases})", extra={"startup": report})
+
+
+# The total starts when the petshopapi package is first imported, so it includes the imports of the app
+startup_report = StartupReport(petshopapi.started_at)
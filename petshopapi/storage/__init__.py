@@ -0,0 +1 @@
+__version__ = "1.0.0"
\ No newline at end of file
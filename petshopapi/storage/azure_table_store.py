@@ -0,0 +1,143 @@
+import os
+from typing import Optional
+from azure.data.tables.aio import TableClient, TableServiceClient
+import pandas as pd
+
+from petshopapi.config import settings
+from petshopapi.logger_config import logger
+from petshopapi.loaders import table_writer
+from petshopapi.loaders.write_retry import AIMDLimiter, RetryPolicy
+from petshopapi.storage.sales_store import (GroupBy, SalesFilter, SalesStore, WriteMode, aggregate_frame,
+                                            decode_continuation_token, encode_continuation_token)
+
+# Properties read to compute each aggregate, to keep the scanned payload small
+AGGREGATE_COLUMNS = {
+    GroupBy.PRODUCT: ["productname", "quantity", "price"],
+    GroupBy.USER: ["username", "quantity", "price"],
+    GroupBy.MONTH: ["saledate", "quantity", "price"],
+}
+
+# azure.identity.aio credential of each azure_credential setting. "default" tries the credential sources
+# one after the other at the first token request; naming the one available on the host skips that probing.
+CREDENTIAL_CLASSES = {
+    "default": "DefaultAzureCredential",
+    "managed_identity": "ManagedIdentityCredential",
+    "workload_identity": "WorkloadIdentityCredential",
+    "environment": "EnvironmentCredential",
+    "azure_cli": "AzureCliCredential",
+}
+
+
+def build_filter(filters: SalesFilter) -> tuple[str, dict]:
+    """
+    Build the OData filter and its parameters. The domain filter maps to the PartitionKey,
+    so the query only reads that partition.
+    """
+    conditions, parameters = [], {}
+    for name, prop, operator, value in (("domain", "PartitionKey", "eq", filters.domain),
+                                        ("username", "username", "eq", filters.username),
+                                        ("start_date", "saledate", "ge", filters.start_date),
+                                        ("end_date", "saledate", "le", filters.end_date)):
+        if value is not None:
+            conditions.append(f"{prop} {operator} @{name}")
+            parameters[name] = value
+    return " and ".join(conditions), parameters
+
+
+def create_credential(kind: str):
+    """
+    Create the credential of the account url. azure.identity is only imported here,
+    it is not needed with a connection string.
+    """
+    if kind not in CREDENTIAL_CLASSES:
+        raise ValueError(f"Unknown azure_credential: {kind}")
+    from azure.identity import aio
+    return getattr(aio, CREDENTIAL_CLASSES[kind])()
+
+
+def entity_to_sale(entity) -> dict:
+    """
+    Convert a table entity back to the sales CSV columns.
+    """
+    sale = dict(entity)
+    sale["domain"] = sale.pop("PartitionKey")
+    sale["saleid"] = sale.pop("RowKey")
+    return sale
+
+
+class AzureTableSalesStore(SalesStore):
+    """
+    Sales stored in Azure Table Storage (or Azurite), written as transactions of up to 100 entities.
+    """
+    name = "azure_tables"
+
+    def __init__(self):
+        self.storage_account_url = settings["settings"]["azure_storage_account_url"]
+        self.table_name = settings["settings"]["azure_table_name"]
+        # A connection string (e.g. "UseDevelopmentStorage=true" for Azurite) takes precedence over the account url
+        self.connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING",
+                                                settings["settings"].get("azure_storage_connection_string", ""))
+        self.batch_size = settings["settings"].get("table_batch_size", table_writer.MAX_BATCH_SIZE)
+        self.max_concurrency = settings["settings"].get("table_max_concurrency", 8)
+        self.min_concurrency = settings["settings"].get("table_min_concurrency", 1)
+        # Shared by the chunks and jobs written by this worker, so the throttling of one slows them all down
+        self.limiter: AIMDLimiter = None
+        self.retry_policy = RetryPolicy()
+        self.credential_kind = settings["settings"].get("azure_credential", "default")
+        self.credentials = None
+        self.table_service_client: TableServiceClient = None
+        self.table_client: TableClient = None
+
+    async def open(self):
+        self.limiter = AIMDLimiter(self.max_concurrency, minimum=self.min_concurrency)
+        if self.connection_string:
+            self.table_service_client = TableServiceClient.from_connection_string(conn_str=self.connection_string)
+        else:
+            self.credentials = create_credential(self.credential_kind)
+            self.table_service_client = TableServiceClient(endpoint=self.storage_account_url,
+                                                           credential=self.credentials)
+        # Removing the check for table existence for simplicity and performance
+        # Assuming the table already exists. If not, you have to create it on azure portal or via Bicep.
+        self.table_client = self.table_service_client.get_table_client(table_name=self.table_name)
+        logger.info(f"Connected to Azure Table Service at {self.table_service_client.url}, table: {self.table_name}")
+
+    async def close(self):
+        if self.table_client is not None:
+            await self.table_client.close()
+        if self.table_service_client is not None:
+            await self.table_service_client.close()
+        if self.credentials is not None:
+            await self.credentials.close()
+        self.credentials, self.table_service_client, self.table_client = None, None, None
+
+    async def write(self, df: pd.DataFrame, mode: WriteMode = WriteMode.CREATE, batch_offset: int = 0,
+                    batches: Optional[set[int]] = None) -> dict:
+        return await table_writer.write_entities(self.table_client, df, batch_size=self.batch_size,
+                                                 max_concurrency=self.max_concurrency,
+                                                 batch_offset=batch_offset, mode=mode, limiter=self.limiter,
+                                                 retry_policy=self.retry_policy, batches=batches)
+
+    def list_sales(self, filters: SalesFilter, **kwargs):
+        query_filter, parameters = build_filter(filters)
+        if not query_filter:
+            return self.table_client.list_entities(**kwargs)
+        return self.table_client.query_entities(query_filter, parameters=parameters, **kwargs)
+
+    async def query(self, filters: SalesFilter, page_size: int = 100,
+                    continuation_token: Optional[str] = None) -> dict:
+        pages = self.list_sales(filters, results_per_page=page_size) \
+            .by_page(continuation_token=decode_continuation_token(continuation_token))
+        items = []
+        try:
+            page = await pages.__anext__()
+            items = [entity_to_sale(entity) async for entity in page]
+        except StopAsyncIteration:
+            pass
+        return {"items": items, "continuation_token": encode_continuation_token(pages.continuation_token)}
+
+    async def aggregate(self, filters: SalesFilter, group_by: GroupBy) -> list[dict]:
+        if filters.domain is None:
+            logger.warning(f"Aggregating sales by {group_by.value} without a domain scans every partition")
+        columns = AGGREGATE_COLUMNS[group_by]
+        rows = [entity async for entity in self.list_sales(filters, select=columns, results_per_page=1000)]
+        return aggregate_frame(pd.DataFrame.from_records(rows, columns=columns), group_by)
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from petshopapi.config import settings
+from petshopapi.logger_config import logger
+from petshopapi.loaders.sales_schema import SALES_SCHEMA
+from petshopapi.storage.sales_store import (GroupBy, SalesFilter, SalesStore, WriteMode, aggregate_frame,
+                                            decode_continuation_token, encode_continuation_token)
+
+KEY_COLUMNS = {"PartitionKey": "domain", "RowKey": "saleid"}
+
+ARROW_TYPES = {"key": pa.string(), "string": pa.string(), "int": pa.int64(), "float": pa.float64(), "date": pa.string()}
+
+# Every file gets the full schema, so files written with and without the optional columns can be read together
+ARROW_SCHEMA = pa.schema([(spec.name, ARROW_TYPES[spec.dtype]) for spec in SALES_SCHEMA])
+
+# Increasing number of the write that stored each row: of the copies of a sale, the one of the last write wins.
+# Files written before it was added have no sequence and count as older.
+SEQUENCE_COLUMN = "writeseq"
+STORE_SCHEMA = ARROW_SCHEMA.append(pa.field(SEQUENCE_COLUMN, pa.int64()))
+# Schema of the dataset as read: the partition column is read as text, not as a dictionary
+READ_SCHEMA = pa.schema([field for field in STORE_SCHEMA if field.name != "domain"] + [pa.field("domain", pa.string())])
+
+
+def key_after(domain: str, saleid: str, inclusive: bool = False) -> pc.Expression:
+    """
+    Arrow filter of the rows whose (domain, saleid) comes after the given key, or at it when inclusive.
+    """
+    saleid_after = pc.field("saleid") >= saleid if inclusive else pc.field("saleid") > saleid
+    return (pc.field("domain") > domain) | ((pc.field("domain") == domain) & saleid_after)
+
+
+def key_until(domain: str, saleid: str) -> pc.Expression:
+    """
+    Arrow filter of the rows whose (domain, saleid) comes before the given key or is that key.
+    """
+    return (pc.field("domain") < domain) | ((pc.field("domain") == domain) & (pc.field("saleid") <= saleid))
+
+
+def latest_copies(df: pd.DataFrame, latest: pd.Series) -> pd.DataFrame:
+    """
+    The rows of df that are the last written copy of their sale, given the latest sequence of each
+    (domain, saleid). Copies written by the same write are the same row, one is kept.
+    """
+    sequences = df[SEQUENCE_COLUMN].fillna(-1).to_numpy()
+    df = df[sequences == latest.reindex(pd.MultiIndex.from_frame(df[["domain", "saleid"]])).to_numpy()]
+    return df.drop_duplicates(subset=["domain", "saleid"], keep="last")
+
+
+class ParquetSalesStore(SalesStore):
+    """
+    Append-only Parquet sink, partitioned by domain (path/domain=<domain>/part-*.parquet).
+    Every chunk becomes new files: the write mode is ignored, so re-uploaded sales are
+    appended again and are deduplicated on (domain, saleid) when the files are read, keeping the copy
+    with the highest write sequence (a nanosecond timestamp, increasing within the process).
+    Rows are written sorted by saleid, so the row group statistics skip the groups outside a key range.
+    """
+    name = "parquet"
+
+    def __init__(self, path: str = None):
+        self.path = path or settings["settings"].get("parquet_path", "./data/sales_parquet")
+        self.last_sequence = 0
+        self.sequence_lock = threading.Lock()
+
+    def next_sequence(self) -> int:
+        with self.sequence_lock:
+            self.last_sequence = max(time.time_ns(), self.last_sequence + 1)
+            return self.last_sequence
+
+    async def open(self):
+        os.makedirs(self.path, exist_ok=True)
+        logger.info(f"Opened Parquet sales sink at {self.path}")
+
+    async def write(self, df: pd.DataFrame, mode: WriteMode = WriteMode.CREATE, batch_offset: int = 0,
+                    batches: Optional[set[int]] = None) -> dict:
+        if mode != WriteMode.CREATE:
+            logger.debug(f"Parquet sink is append-only, ignoring write mode {mode.value}")
+        # The chunk is written as a single batch
+        if batches is not None and batch_offset not in batches:
+            return {"rows_written": 0, "batches": 1, "failed_batches": []}
+        await asyncio.to_thread(self._write, df)
+        return {"rows_written": len(df), "batches": 1, "failed_batches": []}
+
+    def _write(self, df: pd.DataFrame):
+        sequence = self.next_sequence()
+        df = df.rename(columns=KEY_COLUMNS).reindex(columns=ARROW_SCHEMA.names).assign(**{SEQUENCE_COLUMN: sequence})
+        df = df.sort_values(["domain", "saleid"])
+        table = pa.Table.from_pandas(df, schema=STORE_SCHEMA, preserve_index=False)
+        # The sequence in the name too, so the files list in write order
+        pq.write_to_dataset(table, self.path, partition_cols=["domain"],
+                            basename_template=f"part-{sequence:020d}-{uuid.uuid4().hex[:8]}-{{i}}.parquet")
+
+    def read_table(self, conditions: list, columns: list[str] = None, expression: pc.Expression = None) -> pa.Table:
+        """
+        Read the rows matching the conditions (a list of (column, operator, value)) and the expression.
+        """
+        if conditions:
+            expression = pq.filters_to_expression(conditions) if expression is None \
+                else pq.filters_to_expression(conditions) & expression
+        return pq.read_table(self.path, schema=READ_SCHEMA, filters=expression, columns=columns)
+
+    def has_partitions(self) -> bool:
+        return any(name.startswith("domain=") for name in os.listdir(self.path))
+
+    @staticmethod
+    def conditions(filters: SalesFilter) -> tuple[list, list]:
+        """
+        The conditions of the domain partition, and the conditions of all the filters.
+        """
+        partition = [("domain", "=", filters.domain)] if filters.domain is not None else []
+        conditions = list(partition)
+        for column, operator, value in (("username", "=", filters.username),
+                                        ("saledate", ">=", filters.start_date), ("saledate", "<=", filters.end_date)):
+            if value is not None:
+                conditions.append((column, operator, value))
+        return partition, conditions
+
+    def read(self, filters: SalesFilter) -> pd.DataFrame:
+        """
+        Read the sales matching the filters, the last written copy of each sale.
+        The domain filter only opens the files of that partition. The latest copy is found on the keys
+        of the partitions read, before the username and date filters: a sale whose last copy no longer
+        matches them must not come back from an older copy. The rows are then read with all the filters,
+        which skip the row groups outside them.
+        """
+        if not self.has_partitions():
+            return pd.DataFrame(columns=ARROW_SCHEMA.names)
+        partition, conditions = self.conditions(filters)
+        df = self.read_table(conditions).to_pandas()
+        if len(conditions) > len(partition):
+            keys = self.read_table(partition, ["domain", "saleid", SEQUENCE_COLUMN]).to_pandas()
+        else:
+            keys = df[["domain", "saleid", SEQUENCE_COLUMN]]
+        latest = keys[SEQUENCE_COLUMN].fillna(-1).groupby([keys["domain"], keys["saleid"]]).max()
+        return latest_copies(df, latest)[ARROW_SCHEMA.names]
+
+    def latest_keys(self, partition: list, after: Optional[dict]) -> pa.Table:
+        """
+        (domain, saleid, latest sequence) of the sales after the continuation key, sorted by key.
+        Only the key columns are read, the continuation key and the domain filter are pushed down to Arrow.
+        """
+        expression = key_after(after["domain"], after["saleid"]) if after else None
+        keys = self.read_table(partition, ["domain", "saleid", SEQUENCE_COLUMN], expression)
+        keys = keys.set_column(keys.schema.get_field_index(SEQUENCE_COLUMN), SEQUENCE_COLUMN,
+                               pc.fill_null(keys[SEQUENCE_COLUMN], -1))
+        latest = keys.group_by(["domain", "saleid"]).aggregate([(SEQUENCE_COLUMN, "max")])
+        return latest.sort_by([("domain", "ascending"), ("saleid", "ascending")])
+
+    async def query(self, filters: SalesFilter, page_size: int = 100,
+                    continuation_token: Optional[str] = None) -> dict:
+        return await asyncio.to_thread(self._query, filters, page_size, continuation_token)
+
+    def _query(self, filters: SalesFilter, page_size: int, continuation_token: Optional[str]) -> dict:
+        """
+        One page of sales. The keys after the continuation key are deduplicated in Arrow, then the full rows
+        are read and filtered for a window of page_size + 1 of those keys at a time (doubled each time the
+        filters leave the page short), so a page converts and deduplicates about the rows it returns.
+        """
+        if not self.has_partitions():
+            return {"items": [], "continuation_token": None}
+        token = decode_continuation_token(continuation_token)
+        partition, conditions = self.conditions(filters)
+        latest = self.latest_keys(partition, token)
+        frames, rows, start, window = [], 0, 0, page_size + 1
+        while start < latest.num_rows and rows <= page_size:
+            keys = latest.slice(start, window).to_pandas()
+            first, last = keys.iloc[0], keys.iloc[-1]
+            between = key_after(first["domain"], first["saleid"], inclusive=True) & key_until(last["domain"],
+                                                                                                last["saleid"])
+            df = self.read_table(conditions, expression=between).to_pandas()
+            sequences = keys.set_index(["domain", "saleid"])[f"{SEQUENCE_COLUMN}_max"]
+            frames.append(latest_copies(df, sequences))
+            rows += len(frames[-1])
+            start += window
+            window *= 2
+        if not frames:
+            return {"items": [], "continuation_token": None}
+        df = pd.concat(frames)[ARROW_SCHEMA.names].sort_values(["domain", "saleid"])
+        page = df.head(page_size)
+        items = page.astype(object).where(page.notna(), None).to_dict("records")
+        next_token = None
+        if len(df) > page_size:
+            next_token = encode_continuation_token({"domain": items[-1]["domain"], "saleid": items[-1]["saleid"]})
+        return {"items": items, "continuation_token": next_token}
+
+    async def aggregate(self, filters: SalesFilter, group_by: GroupBy) -> list[dict]:
+        return await asyncio.to_thread(lambda: aggregate_frame(self.read(filters), group_by))
@@ -0,0 +1,128 @@
+import base64
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import TYPE_CHECKING, Optional
+
+from petshopapi.config import settings
+
+if TYPE_CHECKING:
+    # pandas is imported by the backends, this module is also used by the routes and the job manager
+    import pandas as pd
+
+
+class WriteMode(str, Enum):
+    CREATE = "create"  # fails on existing sales
+    UPSERT_MERGE = "upsert-merge"  # inserts, or merges the columns into the existing sale
+    UPSERT_REPLACE = "upsert-replace"  # inserts, or replaces the existing sale
+
+
+default_write_mode = WriteMode(settings["settings"].get("table_write_mode", "create"))
+
+
+class GroupBy(str, Enum):
+    PRODUCT = "product"
+    USER = "user"
+    MONTH = "month"
+
+
+@dataclass(frozen=True)
+class SalesFilter:
+    domain: Optional[str] = None
+    username: Optional[str] = None
+    start_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+    end_date: Optional[str] = None  # YYYY-MM-DD, inclusive
+
+
+def encode_continuation_token(token: Optional[dict]) -> Optional[str]:
+    """
+    Encode a backend continuation token as an opaque url-safe string.
+    """
+    if not token:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(token).encode()).decode()
+
+
+def decode_continuation_token(token: Optional[str]) -> Optional[dict]:
+    """
+    Decode a continuation token returned by encode_continuation_token. Raises ValueError if it is malformed.
+    """
+    if not token:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid continuation token: {token}") from e
+
+
+def filter_frame(df: "pd.DataFrame", filters: SalesFilter) -> "pd.DataFrame":
+    """
+    Apply the sales filters to a DataFrame with the sales CSV columns.
+    """
+    import pandas as pd
+    mask = pd.Series(True, index=df.index)
+    if filters.domain is not None:
+        mask &= df["domain"] == filters.domain
+    if filters.username is not None:
+        mask &= df["username"] == filters.username
+    if filters.start_date is not None:
+        mask &= df["saledate"] >= filters.start_date
+    if filters.end_date is not None:
+        mask &= df["saledate"] <= filters.end_date
+    return df[mask]
+
+
+def aggregate_frame(df: "pd.DataFrame", group_by: GroupBy) -> list[dict]:
+    """
+    Sum quantity and price and count the sales per product, user or month.
+    """
+    if group_by == GroupBy.MONTH:
+        keys = df["saledate"].str.slice(0, 7)
+    else:
+        keys = df["productname" if group_by == GroupBy.PRODUCT else "username"]
+    totals = df.groupby(keys.rename("key")).agg(
+        sales=("price", "size"), quantity=("quantity", "sum"), total_price=("price", "sum"))
+    return totals.reset_index().sort_values("key").to_dict("records")
+
+
+class SalesStore(ABC):
+    """
+    Storage backend for the ingested sales.
+    Chunks arrive validated and deduplicated, keyed by PartitionKey (domain) and RowKey (saleid).
+    """
+    name: str = None
+
+    async def open(self):
+        """
+        Open the connections or files used by the store. Called once per process in the app lifespan.
+        """
+
+    async def close(self):
+        """
+        Release the resources opened by the store.
+        """
+
+    @abstractmethod
+    async def write(self, df: "pd.DataFrame", mode: WriteMode = WriteMode.CREATE, batch_offset: int = 0,
+                    batches: Optional[set[int]] = None) -> dict:
+        """
+        Write a chunk of sales.
+        Returns a summary with rows_written, batches and failed_batches. batch_offset numbers the
+        batches when a file is written in several chunks. When batches is given, only the batches
+        with those numbers are written (the failed ones of a resumed upload); batches still counts them all.
+        """
+
+    @abstractmethod
+    async def query(self, filters: SalesFilter, page_size: int = 100,
+                    continuation_token: Optional[str] = None) -> dict:
+        """
+        Return one page of sales matching the filters, ordered by domain and saleid, as
+        {"items": [...], "continuation_token": str or None}. Pass the token back to get the next page.
+        """
+
+    @abstractmethod
+    async def aggregate(self, filters: SalesFilter, group_by: GroupBy) -> list[dict]:
+        """
+        Return the number of sales, total quantity and total price per product, user or month.
+        """
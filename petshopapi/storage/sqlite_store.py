@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+import pandas as pd
+
+from petshopapi.config import settings
+from petshopapi.logger_config import SampledLogger, logger
+from petshopapi.loaders.sales_schema import SALES_SCHEMA
+from petshopapi.storage.sales_store import (GroupBy, SalesFilter, SalesStore, WriteMode,
+                                            decode_continuation_token, encode_continuation_token)
+
+SQL_TYPES = {"key": "TEXT NOT NULL", "string": "TEXT", "int": "INTEGER", "float": "REAL", "date": "TEXT"}
+
+GROUP_BY_EXPRESSIONS = {
+    GroupBy.PRODUCT: "productname",
+    GroupBy.USER: "username",
+    GroupBy.MONTH: "substr(saledate, 1, 7)",
+}
+
+# The store keeps the column names of the sales CSV, the loader uses the Table Storage key names
+KEY_COLUMNS = {"PartitionKey": "domain", "RowKey": "saleid"}
+
+failed_batch_log = SampledLogger(logger, per_second=1, burst=10)
+
+
+class SqliteSalesStore(SalesStore):
+    """
+    Sales stored in an embedded SQLite database in WAL mode.
+    Each chunk is inserted with a single executemany in one transaction. In create mode the sales that
+    already exist are skipped and reported as a failed batch, the other rows of the chunk are written.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = None):
+        self.path = path or settings["settings"].get("sqlite_path", "./data/sales.db")
+        self.columns = [spec.name for spec in SALES_SCHEMA]
+        self.conn: sqlite3.Connection = None
+        # sqlite3 connections are not safe to share between threads without serializing the calls
+        self.lock = threading.Lock()
+
+    async def open(self):
+        await asyncio.to_thread(self._open)
+        logger.info(f"Opened SQLite sales store at {self.path}")
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL only fsyncs on checkpoints, which is what makes bulk inserts fast
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = ", ".join(f"{spec.name} {SQL_TYPES[spec.dtype]}" for spec in SALES_SCHEMA)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS sales ({columns}, PRIMARY KEY (domain, saleid))")
+        # Databases created before a column was added to the schema get it as a nullable column
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(sales)")}
+        for spec in SALES_SCHEMA:
+            if spec.name not in existing:
+                sql_type = SQL_TYPES[spec.dtype].replace(" NOT NULL", "")
+                self.conn.execute(f"ALTER TABLE sales ADD COLUMN {spec.name} {sql_type}")
+        # The primary key serves the domain filters, these indexes the user and date range filters
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_username ON sales (domain, username)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_sales_saledate ON sales (domain, saledate)")
+        self.conn.commit()
+
+    async def close(self):
+        if self.conn is not None:
+            await asyncio.to_thread(self.conn.close)
+            self.conn = None
+
+    def build_insert(self, mode: WriteMode) -> str:
+        """
+        Build the INSERT statement for the write mode.
+        """
+        columns = ", ".join(self.columns)
+        placeholders = ", ".join("?" for _ in self.columns)
+        if mode == WriteMode.UPSERT_REPLACE:
+            return f"INSERT OR REPLACE INTO sales ({columns}) VALUES ({placeholders})"
+        statement = f"INSERT INTO sales ({columns}) VALUES ({placeholders})"
+        if mode == WriteMode.CREATE:
+            statement += " ON CONFLICT (domain, saleid) DO NOTHING"
+        elif mode == WriteMode.UPSERT_MERGE:
+            updates = ", ".join(f"{name} = COALESCE(excluded.{name}, {name})"
+                                for name in self.columns if name not in KEY_COLUMNS.values())
+            statement += f" ON CONFLICT (domain, saleid) DO UPDATE SET {updates}"
+        return statement
+
+    async def write(self, df: pd.DataFrame, mode: WriteMode = WriteMode.CREATE, batch_offset: int = 0,
+                    batches: Optional[set[int]] = None) -> dict:
+        # The chunk is written as a single batch
+        if batches is not None and batch_offset not in batches:
+            return {"rows_written": 0, "batches": 1, "failed_batches": []}
+        return await asyncio.to_thread(self._write, df, mode, batch_offset)
+
+    def _write(self, df: pd.DataFrame, mode: WriteMode, batch_offset: int) -> dict:
+        df = df.rename(columns=KEY_COLUMNS).reindex(columns=self.columns)
+        # itertuples(name=None) yields plain tuples, cheaper than building a dict per row
+        rows = list(df.itertuples(index=False, name=None))
+        failed_batches = []
+        rows_written = 0
+        with self.lock:
+            try:
+                with self.conn:
+                    changes = self.conn.total_changes
+                    self.conn.executemany(self.build_insert(mode), rows)
+                    rows_written = self.conn.total_changes - changes if mode == WriteMode.CREATE else len(rows)
+                error = f"{len(rows) - rows_written} sales already exist" if rows_written < len(rows) else None
+            except sqlite3.Error as e:
+                error = str(e)
+            if error is not None:
+                failed_batch_log.error("Batch %s failed: %s", batch_offset, error)
+                failed_batches.append({
+                    "batch": batch_offset,
+                    "partition_key": None,
+                    "first_row_key": rows[0][self.columns.index("saleid")] if rows else None,
+                    "rows": len(rows) - rows_written,
+                    "error": error,
+                })
+        return {
+            "rows_written": rows_written,
+            "batches": 1,
+            "failed_batches": failed_batches,
+        }
+
+    def build_where(self, filters: SalesFilter) -> tuple[list[str], list]:
+        """
+        Build the WHERE conditions and their parameters for the filters.
+        """
+        conditions, parameters = [], []
+        for column, operator, value in (("domain", "=", filters.domain), ("username", "=", filters.username),
+                                        ("saledate", ">=", filters.start_date), ("saledate", "<=", filters.end_date)):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                parameters.append(value)
+        return conditions, parameters
+
+    async def query(self, filters: SalesFilter, page_size: int = 100,
+                    continuation_token: Optional[str] = None) -> dict:
+        return await asyncio.to_thread(self._query, filters, page_size, continuation_token)
+
+    def _query(self, filters: SalesFilter, page_size: int, continuation_token: Optional[str]) -> dict:
+        conditions, parameters = self.build_where(filters)
+        token = decode_continuation_token(continuation_token)
+        if token:
+            # Keyset pagination: resume after the last (domain, saleid) of the previous page
+            conditions.append("(domain, saleid) > (?, ?)")
+            parameters.extend([token["domain"], token["saleid"]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        statement = f"SELECT {', '.join(self.columns)} FROM sales {where} ORDER BY domain, saleid LIMIT ?"
+        with self.lock:
+            rows = self.conn.execute(statement, [*parameters, page_size + 1]).fetchall()
+        items = [dict(zip(self.columns, row)) for row in rows[:page_size]]
+        next_token = None
+        if len(rows) > page_size:
+            next_token = encode_continuation_token({"domain": items[-1]["domain"], "saleid": items[-1]["saleid"]})
+        return {"items": items, "continuation_token": next_token}
+
+    async def aggregate(self, filters: SalesFilter, group_by: GroupBy) -> list[dict]:
+        return await asyncio.to_thread(self._aggregate, filters, group_by)
+
+    def _aggregate(self, filters: SalesFilter, group_by: GroupBy) -> list[dict]:
+        conditions, parameters = self.build_where(filters)
+        key = GROUP_BY_EXPRESSIONS[group_by]
+        conditions.append(f"{key} IS NOT NULL")
+        statement = (f"SELECT {key} AS key, COUNT(*), SUM(quantity), SUM(price) FROM sales "
+                     f"WHERE {' AND '.join(conditions)} GROUP BY key ORDER BY key")
+        with self.lock:
+            rows = self.conn.execute(statement, parameters).fetchall()
+        return [{"key": key, "sales": sales, "quantity": quantity, "total_price": total_price}
+                for key, sales, quantity, total_price in rows]
@@ -0,0 +1,857 @@
+import asyncio
+import fcntl
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import zstandard
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from petshopapi import clients, compression, ingestion_jobs, metrics
+from petshopapi.admission import AdmissionController, AdmissionRejected, content_length
+from petshopapi.cache import AsyncTTLCache
+from petshopapi.ingestion_jobs import IngestionJob, IngestionJobManager, UploadInProgress, UploadSpool
+from azure.core.exceptions import HttpResponseError, ResourceExistsError
+from petshopapi.loaders import sales_loader, sales_readers, sales_schema, table_writer, write_retry
+from petshopapi.loaders.checkpoints import IngestionCheckpoint
+from petshopapi.logger_config import JsonFormatter, SampledLogger
+from petshopapi.startup import StartupReport
+from petshopapi.storage.azure_table_store import build_filter
+from petshopapi.storage.sales_store import GroupBy, SalesFilter, WriteMode
+from petshopapi.storage.parquet_store import ParquetSalesStore
+from petshopapi.storage.sqlite_store import SqliteSalesStore
+from petshopapi.uploads import MultipartUpload
+
+
+def make_sales_df(rows_per_domain: dict) -> pd.DataFrame:
+    rows = []
+    for domain, count in rows_per_domain.items():
+        for i in range(count):
+            rows.append({"RowKey": f"{domain}-{i}", "productname": "wiskas", "clienttaxnum": "123456789",
+                         "username": "john_doe", "quantity": 1, "price": 10.5, "PartitionKey": domain})
+    return pd.DataFrame(rows)
+
+
+class TestTableWriter(unittest.TestCase):
+    def test_batches_are_grouped_by_partition(self):
+        df = make_sales_df({"bo": 3, "us": 2})
+        batches = list(table_writer.build_batches(df))
+        self.assertEqual([pk for pk, _ in batches], ["bo", "us"])
+        for partition_key, entities in batches:
+            self.assertTrue(all(e["PartitionKey"] == partition_key for e in entities))
+
+    def test_batches_respect_transaction_limit(self):
+        df = make_sales_df({"bo": 250})
+        sizes = [len(entities) for _, entities in table_writer.build_batches(df, batch_size=500)]
+        self.assertEqual(sizes, [100, 100, 50])
+
+    def test_upsert_modes_build_upsert_operations(self):
+        entities = make_sales_df({"bo": 2}).to_dict("records")
+        operations = table_writer.build_operations(entities, table_writer.WriteMode.UPSERT_MERGE)
+        self.assertEqual({op[0] for op in operations}, {"upsert"})
+        self.assertEqual(operations[0][2]["mode"], table_writer.UpdateMode.MERGE)
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.reason = "Server Busy"
+        self.headers = headers or {}
+
+    def text(self):
+        return ""
+
+
+class ThrottledTableClient:
+    def __init__(self, throttled_calls: int, error: Exception = None):
+        self.throttled_calls = throttled_calls
+        self.error = error
+        self.calls = 0
+        self.written = []
+
+    async def submit_transaction(self, operations, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if self.calls <= self.throttled_calls:
+            raise HttpResponseError(response=FakeResponse(503, {"x-ms-retry-after-ms": "1"}))
+        self.written.extend(operations)
+
+
+class TestWriteRetry(unittest.TestCase):
+    def test_errors_are_classified_and_hints_read(self):
+        throttled = HttpResponseError(response=FakeResponse(503, {"X-Ms-Retry-After-Ms": "250"}))
+        self.assertEqual(write_retry.classify_error(throttled), "throttled")
+        self.assertEqual(write_retry.retry_after(throttled), 0.25)
+        self.assertEqual(write_retry.retry_after(HttpResponseError(response=FakeResponse(500, {"Retry-After": "2"}))), 2)
+        self.assertEqual(write_retry.classify_error(HttpResponseError(response=FakeResponse(500))), "transient")
+        self.assertIsNone(write_retry.classify_error(ResourceExistsError(response=FakeResponse(409))))
+        self.assertIsNone(write_retry.classify_error(ValueError("bad entity")))
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = write_retry.RetryPolicy(attempts=5, base_delay=1, max_delay=4)
+        self.assertTrue(all(0 <= policy.delay(10) <= 4 for _ in range(100)))
+        self.assertTrue(all(3 <= policy.delay(0, hint=3) <= 4 for _ in range(100)))
+
+    def test_limiter_decreases_on_throttling_and_grows_back(self):
+        limiter = write_retry.AIMDLimiter(8, minimum=2, cooldown=60)
+        limiter.on_throttle()
+        limiter.on_throttle()
+        self.assertEqual(limiter.limit, 4)
+        for _ in range(8):
+            limiter.on_success()
+        self.assertTrue(5 < limiter.limit < 6)
+
+    def test_throttled_batches_are_retried(self):
+        client = ThrottledTableClient(throttled_calls=2)
+        limiter = write_retry.AIMDLimiter(4, cooldown=0)
+        result = asyncio.run(table_writer.write_entities(
+            client, make_sales_df({"bo": 150}), limiter=limiter,
+            retry_policy=write_retry.RetryPolicy(attempts=3, base_delay=0)))
+        self.assertEqual((result["rows_written"], result["failed_batches"]), (150, []))
+        self.assertEqual(client.calls, 4)
+        self.assertEqual(limiter.throttled, 2)
+
+    def test_conflicts_fail_without_retry(self):
+        client = ThrottledTableClient(0, error=ResourceExistsError(response=FakeResponse(409)))
+        result = asyncio.run(table_writer.write_entities(
+            client, make_sales_df({"bo": 3}), retry_policy=write_retry.RetryPolicy(attempts=3, base_delay=0)))
+        self.assertEqual(client.calls, 1)
+        self.assertEqual(result["failed_batches"][0]["attempts"], 1)
+
+    def test_only_the_selected_batches_are_written(self):
+        client = ThrottledTableClient(0)
+        result = asyncio.run(table_writer.write_entities(client, make_sales_df({"bo": 250}), batch_offset=10,
+                                                         batches={12}))
+        self.assertEqual((result["rows_written"], result["batches"], len(client.written)), (50, 3, 50))
+
+
+class FlakySqliteSalesStore(SqliteSalesStore):
+    """
+    Fails the first write of the batches in fail_once.
+    """
+
+    def __init__(self, path: str, fail_once: set):
+        super().__init__(path)
+        self.fail_once = set(fail_once)
+        self.written_batches = []
+
+    def _write(self, df, mode, batch_offset):
+        if batch_offset in self.fail_once:
+            self.fail_once.remove(batch_offset)
+            return {"rows_written": 0, "batches": 1,
+                    "failed_batches": [{"batch": batch_offset, "rows": len(df), "error": "busy"}]}
+        self.written_batches.append(batch_offset)
+        return super()._write(df, mode, batch_offset)
+
+
+class TestSalesLoader(unittest.TestCase):
+    def test_duplicates_are_dropped_keeping_last(self):
+        df = pd.DataFrame({"saleid": ["a", "a", "b"], "productname": "wiskas", "clienttaxnum": "123",
+                           "username": "john_doe", "quantity": ["1", "2", "3"], "price": "9.5", "domain": "bo"})
+        chunk, stats = sales_loader.prepare_sales_chunk(df)
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(chunk["quantity"].tolist(), [2, 3])
+
+    def test_duplicates_across_chunks_are_dropped_in_create_mode(self):
+        seen = sales_loader.SeenKeys()
+        first = pd.DataFrame({"saleid": ["a", "b"], "productname": "wiskas", "clienttaxnum": "123",
+                              "username": "john_doe", "quantity": ["1", "2"], "price": "9.5", "domain": "bo"})
+        second = first.assign(saleid=["b", "c"], quantity=["5", "6"])
+        sales_loader.prepare_sales_chunk(first, seen)
+        chunk, stats = sales_loader.prepare_sales_chunk(second, seen)
+        self.assertEqual(stats["duplicates"], 1)
+        self.assertEqual(chunk["RowKey"].tolist(), ["c"])
+        # Without seen (upsert modes) the chunk is kept whole, the later write wins
+        chunk, stats = sales_loader.prepare_sales_chunk(second)
+        self.assertEqual(stats["duplicates"], 0)
+
+    def test_seen_keys_are_merged_into_few_sorted_arrays(self):
+        seen = sales_loader.SeenKeys()
+        keys = np.random.default_rng(3).permutation(np.arange(10000, dtype=np.uint64) * 7)
+        for start in range(0, len(keys), 100):
+            self.assertFalse(seen.contains(keys[start:start + 100]).any())
+            seen.add(keys[start:start + 100])
+        self.assertEqual(len(seen), len(keys))
+        self.assertLessEqual(len(seen.runs), 7)
+        self.assertTrue(seen.contains(keys).all())
+        self.assertFalse(seen.contains(keys + np.uint64(1)).any())
+
+    def test_stream_with_duplicates_across_chunks_has_no_conflicts(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = SqliteSalesStore(os.path.join(folder, "sales.db"))
+            asyncio.run(store.open())
+            self.addCleanup(lambda: asyncio.run(store.close()))
+            content = (b"saleid,productname,clienttaxnum,username,quantity,price,domain\n"
+                       b"a,wiskas,123,john_doe,1,9.5,bo\nb,wiskas,123,john_doe,2,9.5,bo\n"
+                       b"b,wiskas,123,john_doe,5,9.5,bo\nc,wiskas,123,john_doe,6,9.5,bo\n")
+            with mock.patch.object(clients, "sales_store", store), mock.patch.object(sales_loader, "csv_chunk_rows", 2):
+                totals = asyncio.run(sales_loader.process_sales_stream(io.BytesIO(content), mode=WriteMode.CREATE))
+            self.assertEqual(totals["duplicates_dropped"], 1)
+            self.assertEqual(totals["rows_written"], 3)
+            self.assertEqual(totals["failed_batches"], [])
+
+
+class TestIngestionCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = FlakySqliteSalesStore(os.path.join(self.tmp.name, "sales.db"), fail_once={1})
+        asyncio.run(self.store.open())
+        self.addCleanup(lambda: asyncio.run(self.store.close()))
+        patcher = mock.patch.object(clients, "sales_store", self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def process(self, content: bytes, checkpoint: IngestionCheckpoint) -> dict:
+        with mock.patch.object(sales_loader, "csv_chunk_rows", 2):
+            return asyncio.run(sales_loader.process_sales_stream(io.BytesIO(content), mode=WriteMode.CREATE,
+                                                                 checkpoint=checkpoint))
+
+    def test_resumed_upload_only_writes_the_failed_batches(self):
+        lines = ["saleid,productname,clienttaxnum,username,quantity,price,domain"]
+        lines += [f"s{i},wiskas,123,john_doe,1,9.5,bo" for i in range(6)]
+        content = "\n".join(lines).encode()
+        path = os.path.join(self.tmp.name, "checkpoints", "file.json")
+
+        first = self.process(content, IngestionCheckpoint(path))
+        self.assertEqual((first["rows_written"], len(first["failed_batches"])), (4, 1))
+
+        second = self.process(content, IngestionCheckpoint(path))
+        self.assertEqual(second["resumed_chunks"], 3)
+        self.assertEqual((second["rows_written"], second["failed_batches"]), (6, []))
+        self.assertEqual(self.store.written_batches, [0, 2, 1])
+
+        with mock.patch.object(sales_loader, "csv_engine", "pandas"):
+            third = self.process(content, IngestionCheckpoint(path))
+        self.assertEqual(third["resumed_chunks"], 0)
+
+
+class TestSalesReaders(unittest.TestCase):
+    CSV = (b"saleid,productname,clienttaxnum,username,quantity,price,domain\n"
+           b"a,wiskas,123,john_doe,1,9,bo\n"
+           b"b,,123,john_doe,2,9.5,bo\n"
+           b"c,proplan,123,jane_doe,x,3,us\n")
+
+    def read(self, data: bytes, csv_engine: str = "arrow") -> list[pd.DataFrame]:
+        return list(sales_readers.read_sales_file(io.BytesIO(data), chunk_rows=2, csv_engine=csv_engine))
+
+    def test_arrow_and_pandas_readers_return_the_same_chunks(self):
+        arrow_chunks, pandas_chunks = self.read(self.CSV), self.read(self.CSV, "pandas")
+        self.assertEqual([len(chunk) for chunk in arrow_chunks], [2, 1])
+        for arrow_chunk, pandas_chunk in zip(arrow_chunks, pandas_chunks):
+            pd.testing.assert_frame_equal(arrow_chunk, pandas_chunk)
+        _, report = sales_schema.validate_sales_frame(arrow_chunks[1])
+        self.assertEqual(report["samples"], [{"line": 4, "reasons": ["invalid_quantity"]}])
+
+    def test_parquet_uploads_are_read_as_text(self):
+        df = pd.read_csv(io.BytesIO(self.CSV), dtype={"clienttaxnum": str}, keep_default_na=False)
+        parquet = io.BytesIO()
+        df.to_parquet(parquet)
+        chunks = self.read(parquet.getvalue())
+        expected = self.read(self.CSV)
+        self.assertEqual(len(chunks), 2)
+        for chunk, expected_chunk in zip(chunks, expected):
+            valid, _ = sales_schema.validate_sales_frame(chunk)
+            pd.testing.assert_frame_equal(valid, sales_schema.validate_sales_frame(expected_chunk)[0])
+
+    def test_compressed_csv_is_decompressed_while_reading(self):
+        file = io.BytesIO(gzip.compress(self.CSV))
+        chunks = list(sales_readers.read_sales_file(file, chunk_rows=2))
+        for chunk, expected_chunk in zip(chunks, self.read(self.CSV)):
+            pd.testing.assert_frame_equal(chunk, expected_chunk)
+        self.assertFalse(file.closed)
+        self.assertEqual(file.tell(), len(file.getvalue()))
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+    def call(self, headers: list, body: bytes, response_body: bytes) -> tuple[bytes, list]:
+        received, sent = [], []
+
+        async def app(scope, receive, send):
+            message = await receive()
+            received.append((scope["headers"], message["body"]))
+            await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"text/csv")]})
+            await send({"type": "http.response.body", "body": response_body})
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/", "headers": headers}
+        asyncio.run(compression.CompressionMiddleware(app)(scope, receive, send))
+        return received[0], sent
+
+    def test_request_body_is_decompressed(self):
+        (headers, body), _ = self.call([(b"content-encoding", b"gzip")], gzip.compress(b"a,b\n1,2\n"), b"ok")
+        self.assertEqual(body, b"a,b\n1,2\n")
+        self.assertNotIn(b"content-encoding", dict(headers))
+
+    def test_admission_sees_the_length_of_the_compressed_body(self):
+        lengths = []
+        body = gzip.compress(b"a,b\n1,2\n")
+
+        async def app(scope, receive, send):
+            lengths.append(content_length(Request(scope)))
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def send(message):
+            pass
+
+        for encoding in (b"gzip", b"identity"):
+            scope = {"type": "http", "method": "POST", "path": "/", "headers": [
+                (b"content-encoding", encoding), (b"content-length", str(len(body)).encode())]}
+            asyncio.run(compression.CompressionMiddleware(app)(scope, receive, send))
+        self.assertEqual(lengths, [len(body), len(body)])
+
+    def test_large_responses_are_compressed(self):
+        payload = b"saleid,price\n" * 1000
+        _, (start, message) = self.call([(b"accept-encoding", b"gzip")], b"", payload)
+        self.assertEqual(dict(start["headers"])[b"content-encoding"], b"gzip")
+        self.assertEqual(gzip.decompress(message["body"]), payload)
+
+        _, (start, message) = self.call([(b"accept-encoding", b"gzip")], b"", b"small")
+        self.assertNotIn(b"content-encoding", dict(start["headers"]))
+        self.assertEqual(compression.choose_encoding("gzip;q=0, br"), None)
+
+    def receive_all(self, encoding: str, messages: list, max_bytes: int) -> list:
+        async def run():
+            pending = list(messages)
+
+            async def receive():
+                if not pending:
+                    return {"type": "http.disconnect"}
+                body, more_body = pending.pop(0)
+                return {"type": "http.request", "body": body, "more_body": more_body}
+
+            receive_decompressed = compression.CompressionMiddleware.decompressing_receive(
+                receive, compression.decompressor(encoding, max_bytes))
+            received = []
+            while True:
+                message = await receive_decompressed()
+                received.append(message)
+                if not message.get("more_body", False):
+                    break
+            received.append(await receive_decompressed())
+            return received
+
+        return asyncio.run(run())
+
+    def test_request_body_is_decompressed_in_bounded_pieces(self):
+        payload = b"0" * (3 * compression.DECOMPRESS_BLOCK_SIZE + 10)
+        for encoding, compress in (("gzip", gzip.compress), ("zstd", zstandard.ZstdCompressor().compress)):
+            body = compress(payload)
+            received = self.receive_all(encoding, [(body[:10], True), (body[10:], False)], len(payload))
+            self.assertEqual(received[-1]["type"], "http.disconnect")
+            pieces = [message["body"] for message in received[:-1]]
+            self.assertEqual(b"".join(pieces), payload)
+            self.assertLessEqual(max(len(piece) for piece in pieces), compression.DECOMPRESS_BLOCK_SIZE)
+            with self.assertRaisesRegex(ValueError, "larger than"):
+                self.receive_all(encoding, [(body, False)], len(payload) - 1)
+
+    def test_concatenated_members_and_truncated_bodies(self):
+        for encoding, compress in (("gzip", gzip.compress), ("zstd", zstandard.ZstdCompressor().compress)):
+            body = compress(b"a,b\n") + compress(b"1,2\n")
+            received = self.receive_all(encoding, [(body, False)], 1000)
+            self.assertEqual(b"".join(message.get("body", b"") for message in received[:-1]), b"a,b\n1,2\n")
+            with self.assertRaisesRegex(ValueError, "truncated"):
+                self.receive_all(encoding, [(body[:-3], False)], 1000)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def test_client_rate_limit(self):
+        admission = AdmissionController(max_ingestions=10, max_bytes=1000, uploads_per_minute=6, burst=2)
+        for ticket in [admission.admit("10.0.0.1", 0), admission.admit("10.0.0.1", 0)]:
+            admission.release(ticket)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            admission.admit("10.0.0.1", 0)
+        self.assertEqual(rejected.exception.reason, "client")
+        self.assertEqual(rejected.exception.headers(), {"Retry-After": "10"})
+        admission.release(admission.admit("10.0.0.2", 0))
+        self.assertEqual(admission.stats()["rejections"]["client"], 1)
+
+    def test_global_limits_until_release(self):
+        admission = AdmissionController(max_ingestions=2, max_bytes=1000, uploads_per_minute=60, burst=10,
+                                        retry_after=5)
+        first = admission.admit("a", 600)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            admission.admit("b", 600)
+        self.assertEqual((rejected.exception.reason, rejected.exception.retry_after), ("bytes", 5))
+        second = admission.admit("b", 0)
+        admission.resize(second, 300)
+        with self.assertRaises(AdmissionRejected) as rejected:
+            admission.admit("c", 0)
+        self.assertEqual(rejected.exception.reason, "ingestions")
+
+        admission.release(first)
+        admission.release(first)
+        self.assertEqual((admission.ingestions, admission.bytes_in_flight), (1, 300))
+        admission.admit("c", 700)
+
+
+class TestSalesSchema(unittest.TestCase):
+    def test_columns_are_coerced(self):
+        df = pd.read_csv("data/sales.csv", dtype=str, keep_default_na=False)
+        valid, report = sales_schema.validate_sales_frame(df)
+        self.assertEqual(report["rows_rejected"], 0)
+        self.assertEqual(valid["quantity"].dtype, "int64")
+        self.assertEqual(valid["price"].dtype, "float64")
+        self.assertEqual(valid["clienttaxnum"].tolist(), ["123456789", "987654321"])
+
+    def test_bad_rows_are_rejected(self):
+        df = pd.DataFrame({"saleid": ["a", "b/c", "d", "e"], "productname": ["wiskas", "wiskas", "", "wiskas"],
+                           "clienttaxnum": "123", "username": "john_doe", "quantity": ["1", "2", "3", "1.5"],
+                           "price": ["1.0", "2.0", "3.0", "abc"], "domain": "bo"})
+        valid, report = sales_schema.validate_sales_frame(df)
+        self.assertEqual(valid["saleid"].tolist(), ["a"])
+        self.assertEqual(report["rows_rejected"], 3)
+        self.assertEqual(report["reasons"], {"invalid_saleid": 1, "missing_productname": 1,
+                                             "invalid_quantity": 1, "invalid_price": 1})
+        self.assertEqual(report["samples"][0], {"line": 3, "reasons": ["invalid_saleid"]})
+
+    def test_missing_column_fails(self):
+        with self.assertRaises(sales_schema.SalesSchemaError):
+            sales_schema.validate_sales_frame(pd.DataFrame({"saleid": ["a"]}))
+
+
+class TestSqliteSalesStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.store = SqliteSalesStore(os.path.join(self.folder.name, "sales.db"))
+        asyncio.run(self.store.open())
+
+    def tearDown(self):
+        asyncio.run(self.store.close())
+        self.folder.cleanup()
+
+    def test_create_conflicts_and_upsert_replaces(self):
+        df = make_sales_df({"bo": 3, "us": 2})
+        result = asyncio.run(self.store.write(df))
+        self.assertEqual(result["rows_written"], 5)
+
+        result = asyncio.run(self.store.write(df))
+        self.assertEqual(result["rows_written"], 0)
+        self.assertEqual(len(result["failed_batches"]), 1)
+
+        # Only the sales that exist are skipped, the new ones of the chunk are written
+        more = make_sales_df({"bo": 4})
+        result = asyncio.run(self.store.write(more))
+        self.assertEqual(result["rows_written"], 1)
+        self.assertEqual(result["failed_batches"][0]["rows"], 3)
+        self.assertEqual(self.store.conn.execute("SELECT COUNT(*) FROM sales").fetchone(), (6,))
+        df = make_sales_df({"bo": 3, "us": 2})
+
+        df["quantity"] = 7
+        result = asyncio.run(self.store.write(df, mode=WriteMode.UPSERT_MERGE))
+        self.assertEqual(result["rows_written"], 5)
+        rows = self.store.conn.execute("SELECT COUNT(*), SUM(quantity) FROM sales").fetchone()
+        self.assertEqual(rows, (6, 36))
+
+    def test_query_pages_and_aggregates(self):
+        df = make_sales_df({"bo": 5, "us": 2})
+        df["saledate"] = ["2025-01-10", "2025-01-20", "2025-02-01", "2025-02-02", None, "2025-03-01", "2025-03-02"]
+        asyncio.run(self.store.write(df))
+
+        keys, token = [], None
+        while True:
+            page = asyncio.run(self.store.query(SalesFilter(domain="bo"), page_size=2, continuation_token=token))
+            keys.extend(sale["saleid"] for sale in page["items"])
+            token = page["continuation_token"]
+            if token is None:
+                break
+        self.assertEqual(keys, [f"bo-{i}" for i in range(5)])
+
+        months = asyncio.run(self.store.aggregate(SalesFilter(domain="bo"), GroupBy.MONTH))
+        self.assertEqual([(m["key"], m["sales"]) for m in months], [("2025-01", 2), ("2025-02", 2)])
+        dated = asyncio.run(self.store.query(SalesFilter(start_date="2025-02-01", end_date="2025-03-01")))
+        self.assertEqual(len(dated["items"]), 3)
+
+
+class TestParquetSalesStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.store = ParquetSalesStore(os.path.join(self.folder.name, "sales"))
+        asyncio.run(self.store.open())
+
+    def test_last_write_wins_whatever_the_file_order(self):
+        df = make_sales_df({"bo": 3, "us": 2})
+        asyncio.run(self.store.write(df))
+        df["quantity"] = 7
+        df["username"] = "jane_doe"
+        asyncio.run(self.store.write(df.head(2)))
+        # List the last written file first
+        partition = os.path.join(self.store.path, "domain=bo")
+        newest = sorted(os.listdir(partition))[-1]
+        os.rename(os.path.join(partition, newest), os.path.join(partition, f"a-{newest}"))
+
+        sales = self.store.read(SalesFilter(domain="bo")).set_index("saleid")
+        self.assertEqual(sales["quantity"].to_dict(), {"bo-0": 7, "bo-1": 7, "bo-2": 1})
+        # The older copies of the sales written again don't match the old username any more
+        old_username = self.store.read(SalesFilter(username="john_doe"))
+        self.assertEqual(sorted(old_username["saleid"]), ["bo-2", "us-0", "us-1"])
+
+    def test_query_pages_through_the_latest_copies(self):
+        df = make_sales_df({"bo": 7, "us": 3})
+        asyncio.run(self.store.write(df))
+        rewritten = df.iloc[[1, 3, 4, 8]].assign(username="jane_doe")
+        asyncio.run(self.store.write(rewritten))
+
+        for filters in (SalesFilter(), SalesFilter(domain="bo"), SalesFilter(username="john_doe"),
+                        SalesFilter(username="jane_doe")):
+            items, token = [], None
+            while True:
+                page = asyncio.run(self.store.query(filters, page_size=2, continuation_token=token))
+                self.assertLessEqual(len(page["items"]), 2)
+                items.extend(page["items"])
+                token = page["continuation_token"]
+                if token is None:
+                    break
+            expected = self.store.read(filters).sort_values(["domain", "saleid"])
+            self.assertEqual([(sale["saleid"], sale["username"]) for sale in items],
+                             list(zip(expected["saleid"], expected["username"])))
+
+
+class TestAzureTableSalesStore(unittest.TestCase):
+    def test_domain_filter_targets_the_partition(self):
+        query_filter, parameters = build_filter(SalesFilter(domain="bo", start_date="2025-01-01"))
+        self.assertEqual(query_filter, "PartitionKey eq @domain and saledate ge @start_date")
+        self.assertEqual(parameters, {"domain": "bo", "start_date": "2025-01-01"})
+
+
+class TestAsyncTTLCache(unittest.TestCase):
+    def test_concurrent_misses_are_coalesced(self):
+        cache = AsyncTTLCache(max_entries=10, ttl_seconds=60)
+        calls = []
+
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        async def run():
+            return await asyncio.gather(*[cache.get_or_load(("bo", "q"), loader) for _ in range(5)])
+
+        self.assertEqual(asyncio.run(run()), [1] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((cache.misses, cache.coalesced), (1, 4))
+
+    def test_invalidation_and_lru_eviction(self):
+        cache = AsyncTTLCache(max_entries=2, ttl_seconds=60)
+
+        async def value():
+            return "v"
+
+        async def run():
+            for key in [("bo", 1), (None, 2), ("us", 3)]:
+                await cache.get_or_load(key, value)
+
+        asyncio.run(run())
+        self.assertEqual(list(cache.entries), [(None, 2), ("us", 3)])
+        self.assertEqual(cache.evictions, 1)
+        cache.invalidate_domains(["bo"])
+        self.assertEqual(list(cache.entries), [("us", 3)])
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.labels("/sales").observe(value)
+        lines = histogram.render().splitlines()
+        self.assertIn('latency_seconds_bucket{route="/sales",le="0.1"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="/sales",le="1.0"} 3', lines)
+        self.assertIn('latency_seconds_bucket{route="/sales",le="+Inf"} 4', lines)
+        self.assertIn('latency_seconds_count{route="/sales"} 4', lines)
+
+    def test_route_template_is_the_path_of_the_route(self):
+        app = FastAPI()
+        app.add_middleware(metrics.MetricsMiddleware)
+
+        @app.get("/users/{username}/sales/{saleid}")
+        async def read_sale(username: str, saleid: str):
+            return {}
+
+        client = TestClient(app)
+        # Both parameters have the same value, which a replacement of the values in the path would mix up
+        client.get("/users/1/sales/1")
+        client.get("/nope")
+        routes = {values[1] for values in metrics.http_requests.children}
+        self.assertIn("/users/{username}/sales/{saleid}", routes)
+        self.assertIn("unmatched", routes)
+
+
+class TestStartupReport(unittest.TestCase):
+    def test_phases_are_timed_and_reported(self):
+        report = StartupReport(started_at=0)
+        with report.phase("import sqlite store"):
+            pass
+        with self.assertRaises(RuntimeError):
+            with report.phase("open sqlite store"):
+                raise RuntimeError("disk full")
+        self.assertEqual(list(report.to_dict()["phases"]), ["import sqlite store", "open sqlite store"])
+        report.finish()
+        self.assertEqual(report.to_dict()["total_seconds"], round(report.finished_at, 4))
+
+
+def make_spool(content: bytes) -> UploadSpool:
+    spool = UploadSpool("sales.csv")
+    spool.write(content)
+    spool.close()
+    return spool
+
+
+class SlowJobManager(IngestionJobManager):
+    async def _run(self, job):
+        await asyncio.sleep(0.05)
+        job.status = "completed"
+        await self._finish(job)
+
+
+class TestIngestionJobManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def make_job(self, job_id: str) -> IngestionJob:
+        path = os.path.join(self.tmp.name, f"{job_id}.csv")
+        open(path, "w").close()
+        return IngestionJob(id=job_id, filename="sales.csv", path=path, total_bytes=0, mode=WriteMode.UPSERT_MERGE)
+
+    def test_job_status_is_shared_between_processes(self):
+        job = self.make_job("a" * 32)
+        asyncio.run(IngestionJobManager(jobs_dir=self.tmp.name)._save(job))
+        other_worker = IngestionJobManager(jobs_dir=self.tmp.name)
+        self.assertEqual(other_worker.get(job.id).to_dict(), job.to_dict())
+        self.assertIsNone(other_worker.get("b" * 32))
+        self.assertIsNone(other_worker.get("../sales"))
+
+    def test_stop_drains_running_jobs_and_fails_queued_ones(self):
+        manager = SlowJobManager(workers=1, jobs_dir=self.tmp.name)
+        running, queued = self.make_job("a" * 32), self.make_job("b" * 32)
+
+        async def run():
+            await manager.start()
+            await manager.queue.put(running)
+            await manager.queue.put(queued)
+            await asyncio.sleep(0)
+            await manager.stop(timeout=5)
+
+        asyncio.run(run())
+        self.assertEqual(running.status, "completed")
+        self.assertEqual(queued.status, "failed")
+        self.assertFalse(os.path.exists(queued.path))
+
+    def test_on_finish_is_called_when_the_job_ends(self):
+        manager = SlowJobManager(workers=1, jobs_dir=self.tmp.name)
+        finished = []
+
+        async def run():
+            await manager.start()
+            job = await manager.submit(make_spool(b"saleid\n1\n"), on_finish=lambda: finished.append(True))
+            self.assertEqual(finished, [])
+            await asyncio.sleep(0)
+            await manager.stop(timeout=5)
+            return job
+
+        job = asyncio.run(run())
+        self.assertEqual((job.status, finished), ("completed", [True]))
+        self.assertEqual(manager.on_finish, {})
+
+
+    def test_status_saves_are_throttled_and_run_off_the_event_loop(self):
+        manager = IngestionJobManager(jobs_dir=self.tmp.name)
+        job = self.make_job("a" * 32)
+        writes = []
+        write_status = manager._write_status
+
+        def record_write(job_id, data):
+            writes.append((threading.current_thread() is threading.main_thread(), data["status"]))
+            write_status(job_id, data)
+
+        async def process_sales_stream(file, mode, progress, checkpoint):
+            totals = {"resumed_chunks": 0, "rows": 0, "duplicates_dropped": 0, "rejections": {},
+                      "rows_written": 0, "failed_batches": []}
+            for _ in range(100):
+                totals["rows"] += 10
+                progress(totals)
+                await asyncio.sleep(0)
+            return {**totals, "rows_written": totals["rows"]}
+
+        manager.loader = mock.Mock(process_sales_stream=process_sales_stream)
+        with mock.patch.object(manager, "_write_status", record_write), \
+                mock.patch.object(ingestion_jobs, "status_save_seconds", 3600):
+            asyncio.run(manager._run(job))
+        self.assertEqual(writes, [(False, "running"), (False, "completed")])
+        self.assertEqual(manager.get(job.id).to_dict(), job.to_dict())
+        self.assertEqual(IngestionJobManager(jobs_dir=self.tmp.name).get(job.id).rows_written, 1000)
+
+        writes.clear()
+        with mock.patch.object(manager, "_write_status", record_write), \
+                mock.patch.object(ingestion_jobs, "status_save_seconds", 0):
+            asyncio.run(manager._run(self.make_job("b" * 32)))
+        # A write starts only once the previous one is done, not after every chunk
+        self.assertLess(len(writes), 100)
+        self.assertEqual(writes[-1], (False, "completed"))
+
+
+    def test_a_file_already_being_ingested_is_rejected(self):
+        manager = SlowJobManager(workers=1, jobs_dir=self.tmp.name)
+        other_worker = SlowJobManager(workers=1, jobs_dir=self.tmp.name)
+
+        async def run():
+            await manager.start()
+            await other_worker.start()
+            job = await manager.submit(make_spool(b"saleid\n1\n"))
+            duplicate = make_spool(b"saleid\n1\n")
+            with self.assertRaises(UploadInProgress):
+                await other_worker.submit(duplicate)
+            self.assertFalse(os.path.exists(duplicate.path))
+            await manager.stop(timeout=5)
+            # The lock is released with the job, the file can be uploaded again
+            retry = await other_worker.submit(make_spool(b"saleid\n1\n"))
+            await asyncio.sleep(0)
+            await other_worker.stop(timeout=5)
+            return job, retry
+
+        job, retry = asyncio.run(run())
+        self.assertEqual((job.status, retry.status), ("completed", "completed"))
+        self.assertEqual(job.content_hash, retry.content_hash)
+
+
+    def test_old_checkpoints_are_removed_except_held_locks(self):
+        manager = IngestionJobManager(jobs_dir=self.tmp.name)
+        checkpoints = os.path.join(self.tmp.name, "checkpoints")
+        os.makedirs(checkpoints)
+        names = ["old.json", "old.json.lock", "held.json.lock", "new.json"]
+        for name in names:
+            open(os.path.join(checkpoints, name), "w").close()
+        for name in names[:3]:
+            os.utime(os.path.join(checkpoints, name), (0, 0))
+        with open(os.path.join(checkpoints, "held.json.lock"), "a") as held:
+            fcntl.flock(held, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            manager._remove_old_checkpoints()
+        self.assertEqual(sorted(os.listdir(checkpoints)), ["held.json.lock", "new.json"])
+
+    def test_finished_jobs_are_evicted_with_their_status_file(self):
+        manager = IngestionJobManager(max_finished=1, jobs_dir=self.tmp.name)
+
+        async def run():
+            for job_id in ("a" * 32, "b" * 32):
+                job = self.make_job(job_id)
+                manager.jobs[job_id] = job
+                await manager._finish(job)
+            await manager._evict_finished()
+
+        asyncio.run(run())
+        self.assertEqual(list(manager.jobs), ["b" * 32])
+        self.assertIsNone(manager.get("a" * 32))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "b" * 32 + ".csv")))
+
+
+def multipart_body(parts: list[tuple[str, str, bytes]], boundary: str = "XyZ") -> bytes:
+    body = b""
+    for name, filename, content in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{boundary}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{boundary}--\r\n".encode()
+
+
+class TestMultipartUpload(unittest.TestCase):
+    content_type = "multipart/form-data; boundary=XyZ"
+
+    def read(self, body: bytes, block_size: int = 7):
+        async def stream():
+            for start in range(0, len(body), block_size):
+                yield body[start:start + block_size]
+
+        return asyncio.run(MultipartUpload(self.content_type).read(stream()))
+
+    def test_file_is_spooled_and_hashed_while_streaming(self):
+        content = b"saleid,productname\n" + b"s1,wiskas\n" * 1000
+        with mock.patch("petshopapi.uploads.SPOOL_BLOCK_SIZE", 64):
+            spool = self.read(multipart_body([("comment", None, b"daily"), ("file", "sales.csv", content)]))
+        self.addCleanup(spool.discard)
+        with open(spool.path, "rb") as f:
+            self.assertEqual(f.read(), content)
+        self.assertEqual((spool.filename, spool.size), ("sales.csv", len(content)))
+        self.assertEqual(spool.content_hash, hashlib.sha256(content).hexdigest())
+
+    def test_invalid_bodies(self):
+        self.assertIsNone(self.read(multipart_body([("comment", None, b"daily")])))
+        with self.assertRaises(ValueError):
+            self.read(multipart_body([("file", "a.csv", b"a"), ("other", "b.csv", b"b")]))
+        with self.assertRaises(ValueError):
+            MultipartUpload("application/json")
+        with tempfile.TemporaryDirectory() as spool_dir, mock.patch.object(tempfile, "tempdir", spool_dir):
+            with self.assertRaises(ValueError):
+                self.read(multipart_body([("file", "a.csv", b"saleid\n1\n")])[:-20])
+            # The spool of the truncated upload was removed
+            self.assertEqual(os.listdir(spool_dir), [])
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestLogging(unittest.TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("petshopapi.tests")
+        self.logger.propagate = False
+        self.handler = RecordingHandler()
+        self.logger.handlers = [self.handler]
+        self.logger.setLevel(logging.INFO)
+
+    def test_sampled_logger_reports_suppressed_calls(self):
+        sampled = SampledLogger(self.logger, per_second=0, burst=2)
+        for i in range(5):
+            sampled.warning("Rejected line %s", i)
+        self.assertEqual([record.getMessage() for record in self.handler.records],
+                         ["Rejected line 0", "Rejected line 1"])
+        self.assertEqual(sampled.suppressed, 3)
+
+        sampled.tokens = 1
+        sampled.warning("Rejected line %s", 5)
+        self.assertEqual(self.handler.records[-1].suppressed, 3)
+        self.assertEqual(sampled.suppressed, 0)
+
+    def test_sampled_logger_keeps_one_call_in_n(self):
+        sampled = SampledLogger(self.logger, per_second=0, burst=100, sample_every=10)
+        for i in range(100):
+            sampled.info("Chunk %s", i)
+        self.assertEqual(len(self.handler.records), 10)
+        sampled.debug("Below the logger level")
+        self.assertEqual(len(self.handler.records), 10)
+
+    def test_json_formatter_adds_extra_fields(self):
+        record = self.logger.makeRecord(self.logger.name, logging.INFO, __file__, 1, "Wrote %s rows", (10,), None,
+                                        extra={"job_id": "abc"})
+        document = json.loads(JsonFormatter().format(record))
+        self.assertEqual(document["message"], "Wrote 10 rows")
+        self.assertEqual(document["level"], "INFO")
+        self.assertEqual(document["job_id"], "abc")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+from typing import AsyncIterator, Optional
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+from petshopapi.ingestion_jobs import SPOOL_BLOCK_SIZE, UploadSpool
+
+
+class MultipartUpload:
+    """
+    Streaming parser of a multipart/form-data body that copies the file of one field to an UploadSpool
+    as the body is received, instead of a form temporary file copied to the spool afterwards.
+    The file data is written on a thread, SPOOL_BLOCK_SIZE bytes at a time, other fields are ignored.
+    Raises ValueError on a malformed or incomplete body, or a body with more than one file.
+    """
+
+    def __init__(self, content_type: str, field: str = "file"):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("Expected a multipart/form-data body with a boundary")
+        self.field = field.encode()
+        self.spool: Optional[UploadSpool] = None
+        self.files = 0
+        self.in_file = False
+        self.complete = False
+        self.header_name = b""
+        self.header_value = b""
+        self.disposition = b""
+        # File data parsed but not written to the spool yet
+        self.pending = bytearray()
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_end": self.on_end,
+        })
+
+    def on_part_begin(self):
+        self.disposition = b""
+        self.in_file = False
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.in_file:
+            self.pending += data[start:end]
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        if self.header_name.lower() == b"content-disposition":
+            self.disposition = self.header_value
+        self.header_name = b""
+        self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self.disposition)
+        if b"filename" not in options:
+            return
+        self.files += 1
+        if self.files > 1:
+            raise ValueError("Only one file can be uploaded")
+        if options.get(b"name") == self.field:
+            self.spool = UploadSpool(options[b"filename"].decode("utf-8", "replace"))
+            self.in_file = True
+
+    def on_end(self):
+        self.complete = True
+
+    async def flush(self):
+        if self.pending:
+            data = bytes(self.pending)
+            self.pending.clear()
+            await asyncio.to_thread(self.spool.write, data)
+
+    async def read(self, stream: AsyncIterator[bytes]) -> Optional[UploadSpool]:
+        """
+        Parse the body from stream, e.g. request.stream(). Returns the spooled file, None without a file field.
+        The spool file is removed if the body is invalid or the client disconnects.
+        """
+        try:
+            async for chunk in stream:
+                self.parser.write(chunk)
+                if len(self.pending) >= SPOOL_BLOCK_SIZE:
+                    await self.flush()
+            self.parser.finalize()
+            if not self.complete:
+                raise ValueError("Incomplete multipart body")
+            await self.flush()
+            if self.spool is not None:
+                await asyncio.to_thread(self.spool.close)
+        except BaseException:
+            if self.spool is not None:
+                self.spool.discard()
+            raise
+        return self.spool